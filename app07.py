@@ -1,21 +1,25 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
+
+import engine
+from board import BOARD_LENGTH_OPTIONS, page_count, page_of_day, render_board_html, reward_days_for
+from history_bits import HistoryBits
+from stats import ChallengeStats
 
 # --- 定数と設定 ---
-MAX_MASU = 25
-REWARD_DAYS = [3, 7, 14, 21, 25]
+MAX_MASU = 25  # 盤面の長さの初期値（画面で 100 / 365 / 1000 日も選べる）
+REWARD_INTERVAL = 30  # 長い盤面でご褒美マスを置く間隔（日数。0 にすると最初の数日とゴールだけ）
+REWARD_DAYS = reward_days_for(MAX_MASU, REWARD_INTERVAL)
 START_MASU = 1
 GOAL_MASU = MAX_MASU
+HISTORY_LIMIT = 30  # サイドバーに表示する履歴の件数（長いチャレンジでも描画量を一定にする）
 
 
 # --- 処理関数 ---
+# ルール自体は engine.py にあり、ここでは画面への表示（トースト・再描画）だけを行う
 def reset_game():
     """ゲームの状態を初期値にリセットする (テーマは除く)"""
-    st.session_state.current_day = 1
-    st.session_state.history = {}
-    st.session_state.rewards = {day: {"name": "", "checked": False} for day in REWARD_DAYS}
-    st.session_state.consecutive_success = 0
-    st.session_state.animation_type = None
-    st.session_state.reward_checked_animation = False
+    engine.reset(st.session_state, REWARD_DAYS)
     # st.toast は st.rerun の後に表示されるため、次の行で実行
 
     # リセット後に画面を再描画
@@ -24,71 +28,71 @@ def reset_game():
 
 def record_success():
     """達成ボタンが押されたときの処理"""
-    if st.session_state.current_day <= GOAL_MASU:
-
-        day_achieved = st.session_state.current_day  # 達成したマス番号
-
-        # 現在のマスを達成済みとして記録
-        st.session_state.history[day_achieved] = "達成"
-
-        # 連続達成日数を加算
-        st.session_state.consecutive_success += 1
-
-        # アニメーションフラグの設定とトーストメッセージ
-        if day_achieved == GOAL_MASU:
-            # Day 25: ゴール達成 (風船+雪の最大演出)
-            st.session_state.animation_type = "goal_celebration"
-            st.toast("👑 GOAL達成！おめでとうございます！25日間継続できました！", icon="🎊")
-        elif day_achieved in REWARD_DAYS:
-            # ご褒美マス達成 (風船のみ)
-            st.session_state.animation_type = "balloons"
-            st.toast(f"🎁 ご褒美マス達成！おめでとうございます！", icon="✨")
-        elif st.session_state.consecutive_success > 0 and st.session_state.consecutive_success % 3 == 0:  # 連続達成日数が0でないことを確認
-            # 連続達成メッセージ
-            st.toast(f"🎉 3日連続達成！偉い！ {st.session_state.consecutive_success}日連続記録更新中！", icon="🥳")
-        else:
-            st.toast("達成を記録しました！次の日も頑張りましょう！", icon="💪")
-
-        # 次のマスへ進む (Day 25達成時はDay 26に進み、ボタンを無効化する)
-        if st.session_state.current_day <= GOAL_MASU:  # NEW: 25日目もインクリメントする
-            st.session_state.current_day += 1
+    toast = engine.record_success(st.session_state, GOAL_MASU, REWARD_DAYS)
+    if toast:
+        st.toast(toast.text, icon=toast.icon)
 
 
 def record_failure():
     """未達成ボタンが押されたときの処理"""
-    if st.session_state.current_day <= GOAL_MASU:  # ゴール後は未達成も記録しない
-        st.session_state.history[st.session_state.current_day] = "未達成"
-        st.session_state.consecutive_success = 0  # 連続達成日数をリセット
-        st.toast("未達成を記録しました。また明日から気持ちを切り替えて！", icon="😭")
-
-        # 未達成を記録したら画面を再描画して連続達成日数のリセットを表示に反映
-        st.rerun()
+    toast = engine.record_failure(st.session_state, GOAL_MASU)
+    if toast:
+        st.toast(toast.text, icon=toast.icon)
+        # 再描画は呼び出し側の rerun_affected() が必要な範囲だけ行う
 
 
 def update_reward_check(day):
     """ご褒美チェックボックスの更新処理"""
-    is_checked = st.session_state[f"reward_check_{day}"]
-    # チェックボックスの状態をセッションに反映
-    st.session_state.rewards[day]["checked"] = is_checked
+    # チェックボックスの状態をセッションに反映（チェックが入ったらアニメーションフラグを立てる）
+    engine.set_reward_checked(st.session_state, day, st.session_state[f"reward_check_{day}"])
+
+
+def change_board_length():
+    """チャレンジの日数が変更されたときの処理（記録済みのご褒美は引き継ぐ）"""
+    board_length = st.session_state.board_length_select
+    st.session_state.board_length = board_length
+    st.session_state.rewards = {
+        day: st.session_state.rewards.get(day, {"name": "", "checked": False})
+        for day in reward_days_for(board_length, REWARD_INTERVAL)
+    }
+    # ゴールを過ぎた位置にいる場合はゴール直後に合わせる
+    st.session_state.current_day = min(st.session_state.current_day, board_length + 1)
+
+
+def reward_panel_key():
+    """ご褒美リストの表示が依存する値（どのご褒美マスに到達済みか）"""
+    return tuple(day <= st.session_state.current_day for day in REWARD_DAYS)
+
 
-    # チェックが入ったら（ご褒美をGETしたら）アニメーションフラグを立てる
-    if is_checked:
-        st.session_state.reward_checked_animation = True
+def rerun_affected(reward_key_before):
+    """操作後の再描画: ご褒美リストの表示が変わるときだけアプリ全体、それ以外は押されたフラグメントだけ"""
+    if reward_panel_key() != reward_key_before:
+        st.rerun()
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        # フラグメント単独の再実行中でなければ（アプリ全体の実行中にボタンが処理された場合）全体を再実行する
+        st.rerun()
 
 
 # --- 初期化（アプリ起動時に一度だけ動く） ---
 # st.session_state に必要な変数が存在するかチェックし、なければ初期値を設定
 if "current_day" not in st.session_state:
     st.session_state.current_day = 1
+if "board_length" not in st.session_state:
+    st.session_state.board_length = MAX_MASU
 # ... (他の初期化ロジックは省略せずにコードに残っています) ...
 if "history" not in st.session_state:
-    # 履歴: {日数: "達成" / "未達成"}
-    st.session_state.history = {}
+    # 履歴: {日数: "達成" / "未達成"}（1日2ビットのビット列で保持）
+    st.session_state.history = HistoryBits()
+if "stats" not in st.session_state:
+    # 累計・連続達成日数の集計（記録のたびに差分で更新）
+    st.session_state.stats = ChallengeStats.from_history(st.session_state.history)
 if "theme" not in st.session_state:
-    st.session_state.theme = "読書を25日継続する！"
+    st.session_state.theme = engine.DEFAULT_THEME
 if "rewards" not in st.session_state:
     # ご褒美リスト: {日数: {name: "ご褒美名", checked: False}}
-    st.session_state.rewards = {day: {"name": "", "checked": False} for day in REWARD_DAYS}
+    st.session_state.rewards = engine.new_rewards(REWARD_DAYS)
 if "consecutive_success" not in st.session_state:
     st.session_state.consecutive_success = 0
 if "animation_type" not in st.session_state:
@@ -96,142 +100,172 @@ if "animation_type" not in st.session_state:
 if "reward_checked_animation" not in st.session_state:
     st.session_state.reward_checked_animation = False
 
+# 盤面の長さとご褒美マスはセッションごとに選べるため、実行のたびにセッションから決める
+GOAL_MASU = st.session_state.board_length
+REWARD_DAYS = reward_days_for(GOAL_MASU, REWARD_INTERVAL)
+
 # --- UIのメインレイアウト ---
 st.set_page_config(page_title="3日坊主すごろく", page_icon="🌟", layout="wide")
 
-st.title("三日坊主防止すごろく（25マス）🌟")
+st.title(f"三日坊主防止すごろく（{GOAL_MASU}マス）🌟")
+
+# チャレンジの日数（盤面全体が変わるため、フラグメントの外に置いてアプリ全体を再実行する）
+st.selectbox(
+    "チャレンジの日数",
+    BOARD_LENGTH_OPTIONS,
+    index=BOARD_LENGTH_OPTIONS.index(GOAL_MASU) if GOAL_MASU in BOARD_LENGTH_OPTIONS else 0,
+    key="board_length_select",
+    on_change=change_board_length,
+    format_func=lambda days: f"{days}日"
+)
+
+# --- 部分再描画（フラグメント） ---
+# 操作のたびにスクリプト全体を再実行しないよう、画面を独立して再実行できるフラグメントに分ける。
+#   テーマ欄 / 今日の達成（ステータス・盤面・履歴）/ ご褒美リスト
+# 盤面と履歴はウィジェットを含まないため、「今日の達成」フラグメントから外側のプレースホルダーに描画する。
+# 描画順と画面上の位置を分けるため、先に領域だけ確保しておく
+theme_area = st.container()
+st.subheader("今日の達成")
+progress_area = st.container()
+st.divider()
+
+# --- すごろくとご褒美入力のメインエリア ---
+col_game, col_reward = st.columns([3, 2])
+with col_game:
+    st.subheader("すごろく盤")
+    # 長い盤面はページに分け、表示中のページのマスだけを描画する（None は現在地のページ）
+    board_page = None
+    if page_count(GOAL_MASU) > 1:
+        board_page = st.selectbox(
+            "表示するページ",
+            [None] + list(range(page_count(GOAL_MASU))),
+            key="board_page",
+            format_func=lambda page: "現在地のページ" if page is None else f"ページ {page + 1}"
+        )
+    board_slot = st.empty()
+with col_reward:
+    reward_area = st.container()
+
+# --- 達成履歴（サイドバーに移動） ---
+with st.sidebar:
+    st.subheader("達成履歴")
+    history_slot = st.empty()
+
+st.markdown("---")
+caption_slot = st.empty()
 
-# テーマ設定とリセットボタンのエリア
-col_theme, col_reset = st.columns([4, 1])
 
-with col_theme:
-    st.session_state.theme = st.text_input(
-        "チャレンジテーマ（25日間の目標）",
-        value=st.session_state.theme,
-        placeholder="例: 毎日10ページ本を読む！"
+def render_board():
+    """すごろく盤を描画する"""
+    # すごろく盤の描画ロジック（表示するマスを1つのHTMLにまとめて1回で描画。同じ盤面はキャッシュを再利用）
+    page = board_page if board_page is not None else page_of_day(st.session_state.current_day, GOAL_MASU)
+    board_slot.markdown(
+        render_board_html(st.session_state.current_day, st.session_state.history, REWARD_DAYS, GOAL_MASU, page),
+        unsafe_allow_html=True
     )
 
-# with col_reset:
-#     # リセットボタン (on_clickでreset_gameを呼び出す)
-#     st.button("🔄 チャレンジをリセット", on_click=reset_game, use_container_width=True)
 
-st.subheader("今日の達成")
+def render_history():
+    """サイドバーの達成履歴を描画する"""
+    with history_slot.container():
+        if st.session_state.history:
+            # 集計は記録のたびに更新済みなので、ここでは履歴を数え直さない
+            stats = st.session_state.stats
+            st.markdown(f"**累計達成日数: {stats.achieved}日**")
+            st.markdown(f"最長連続達成: {stats.longest_streak}日 / 未達成: {stats.failed}日 / 達成率: {stats.completion_rate:.0%}")
+            st.write("---")
+
+            # 履歴を逆順に表示して最新の記録を見やすくする（最新 HISTORY_LIMIT 件まで）
+            for day in stats.recent_days(st.session_state.history, HISTORY_LIMIT):
+                status = st.session_state.history[day]
+                icon = "✅" if status == "達成" else "❌"
+                st.markdown(f"{icon} **Day {day}:** {status}")
+            if len(st.session_state.history) > HISTORY_LIMIT:
+                st.caption(f"ほか {len(st.session_state.history) - HISTORY_LIMIT} 件")
+        else:
+            st.info("まだ記録がありません。チャレンジを開始しましょう！")
 
-# 達成ボタンと未達成ボタン
-col_success, col_fail, col_status = st.columns([1.5, 1.5, 3])
 
-# ゴール達成後はボタンを無効化 (current_day > GOAL_MASU で無効)
-is_goal_achieved = st.session_state.current_day > GOAL_MASU
+@st.fragment
+def theme_panel():
+    """テーマ設定（入力してもこのフラグメントとフッターの表示だけを更新する）"""
+    # テーマ設定とリセットボタンのエリア
+    col_theme, col_reset = st.columns([4, 1])
 
-if col_success.button("達成した！🎉", use_container_width=True, type="primary", disabled=is_goal_achieved):
-    record_success()
-    # 処理後に再描画
-    st.rerun()
+    with col_theme:
+        st.session_state.theme = st.text_input(
+            f"チャレンジテーマ（{GOAL_MASU}日間の目標）",
+            value=st.session_state.theme,
+            placeholder="例: 毎日10ページ本を読む！"
+        )
 
-if col_fail.button("今日はできなかった...😢", use_container_width=True, disabled=is_goal_achieved):
-    # record_failure()内でst.rerun()を呼ぶのでここでは処理のみ実行
-    record_failure()
+    # with col_reset:
+    #     # リセットボタン (on_clickでreset_gameを呼び出す)
+    #     st.button("🔄 チャレンジをリセット", on_click=reset_game, use_container_width=True)
 
-# --- アニメーションの実行（成功時の一度だけ） ---
-# 1. 達成ボタンによるアニメーション
-if st.session_state.animation_type == "balloons":
-    st.balloons()
-    st.session_state.animation_type = None
-elif st.session_state.animation_type == "goal_celebration":
-    # ゴール達成時は、風船と雪を両方飛ばし、最大限の演出をする
-    st.balloons()
-    st.snow()
-    st.session_state.animation_type = None
+    caption_slot.caption(f"現在のチャレンジテーマ: **{st.session_state.theme}**")
 
-# 2. ご褒美チェックボックスによるアニメーション
-if st.session_state.reward_checked_animation:
-    st.balloons()
-    st.session_state.reward_checked_animation = False  # 実行後にリセット
-
-# 現在のステータス表示
-if is_goal_achieved:
-    # ゴール達成時のメッセージを修正
-    col_status.markdown("## 🎉 おめでとう！GOAL達成！✨")
-else:
-    col_status.markdown(
-        f"現在の位置: **{st.session_state.current_day}マス** (残り{GOAL_MASU - st.session_state.current_day}日)"
-    )
-    col_status.markdown(
-        f"連続達成日数: **{st.session_state.consecutive_success}日**"
-    )
 
-st.divider()
+@st.fragment
+def progress_panel():
+    """達成ボタン・ステータス・盤面・履歴（ボタンを押すとこのフラグメントだけを再実行する）"""
+    # 達成ボタンと未達成ボタン
+    col_success, col_fail, col_status = st.columns([1.5, 1.5, 3])
 
-# --- すごろくとご褒美入力のメインエリア ---
-col_game, col_reward = st.columns([3, 2])
+    # ゴール達成後はボタンを無効化 (current_day > GOAL_MASU で無効)
+    is_goal_achieved = engine.is_goal_achieved(st.session_state, GOAL_MASU)
 
-with col_game:
-    st.subheader("すごろく盤")
+    if col_success.button("達成した！🎉", use_container_width=True, type="primary", disabled=is_goal_achieved):
+        reward_key = reward_panel_key()
+        record_success()
+        # 処理後に再描画
+        rerun_affected(reward_key)
 
-    # すごろく盤の描画ロジック
-    masses = [
-        [1, 2, 3, 4, 5],
-        [6, 7, 8, 9, 10],
-        [11, 12, 13, 14, 15],
-        [16, 17, 18, 19, 20],
-        [21, 22, 23, 24, 25]
-    ]
-
-    for row in masses:
-        cols = st.columns(len(row))
-        for i, num in enumerate(row):
-            # マスのアイコンを決定
-            is_current = (num == st.session_state.current_day)
-            is_achieved = (num in st.session_state.history and st.session_state.history[num] == "達成")
-            is_reward = (num in REWARD_DAYS)
-            is_goal = (num == GOAL_MASU)
-
-            if is_current:
-                # 現在位置
-                mark = "⭐"
-            elif is_goal and is_achieved:
-                # ゴール達成済み
-                mark = "👑"
-            elif is_reward and is_achieved:
-                # ご褒美マス達成済み
-                mark = "🎁"
-            elif is_achieved:
-                # 過去の達成マス
-                mark = "✅"
-            elif is_reward:
-                # ご褒美マス
-                mark = "🌼"
-            elif is_goal:
-                # ゴールマス
-                mark = "🌟"
-            else:
-                # 通常マス
-                mark = "⚪"
-
-            # HTML/CSSでマスのデザインを調整
-            # 現在位置のマスは少し目立つように装飾
-            style = ""
-            if is_current:
-                style = "border: 2px solid #FF4B4B; background-color: #FFF0F0; border-radius: 8px; padding: 5px;"
-            elif is_achieved:
-                style = "background-color: #D4EDDA; border-radius: 8px; padding: 5px;"
-            elif is_reward:
-                style = "background-color: #FFF3CD; border-radius: 8px; padding: 5px;"
-
-            cols[i].markdown(
-                f"""
-                <div style='text-align:center; {style}'>
-                    <span style='font-size:30px;'>{mark}</span><br>
-                    <small style='font-size:14px; font-weight:bold;'>{num}</small>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+    if col_fail.button("今日はできなかった...😢", use_container_width=True, disabled=is_goal_achieved):
+        reward_key = reward_panel_key()
+        record_failure()
+        # 未達成を記録したら画面を再描画して連続達成日数のリセットを表示に反映
+        rerun_affected(reward_key)
+
+    # --- アニメーションの実行（成功時の一度だけ） ---
+    # 達成ボタンによるアニメーション
+    if st.session_state.animation_type == "balloons":
+        st.balloons()
+        st.session_state.animation_type = None
+    elif st.session_state.animation_type == "goal_celebration":
+        # ゴール達成時は、風船と雪を両方飛ばし、最大限の演出をする
+        st.balloons()
+        st.snow()
+        st.session_state.animation_type = None
+
+    # 現在のステータス表示
+    if is_goal_achieved:
+        # ゴール達成時のメッセージを修正
+        col_status.markdown("## 🎉 おめでとう！GOAL達成！✨")
+    else:
+        col_status.markdown(
+            f"現在の位置: **{st.session_state.current_day}マス** (残り{GOAL_MASU - st.session_state.current_day}日)"
+        )
+        col_status.markdown(
+            f"連続達成日数: **{st.session_state.stats.current_streak}日**"
+        )
 
-with col_reward:
+    # 盤面と履歴はこの操作でしか変わらないため、ここから描画する
+    render_board()
+    render_history()
+
+
+@st.fragment
+def reward_panel():
+    """ご褒美リスト（入力やチェックをしてもこのフラグメントだけを再実行する）"""
     st.subheader("ご褒美リスト")
     st.markdown("ご褒美マスに到達するたびに、自分へのご褒美を記録しましょう！")
 
+    # ご褒美チェックボックスによるアニメーション
+    if st.session_state.reward_checked_animation:
+        st.balloons()
+        st.session_state.reward_checked_animation = False  # 実行後にリセット
+
     # ご褒美入力とチェックボックスの描画
     for day in REWARD_DAYS:
         # ご褒美の入力フィールド
@@ -261,25 +295,13 @@ with col_reward:
                 disabled=not can_check
             )
 
-# --- 達成履歴（サイドバーに移動） ---
-with st.sidebar:
-    st.subheader("達成履歴")
-    if st.session_state.history:
-        # 達成したマスのリストを表示
-        achieved_days = [day for day, status in st.session_state.history.items() if status == "達成"]
-        st.markdown(f"**累計達成日数: {len(achieved_days)}日**")
-        st.write("---")
-
-        # 履歴を逆順に表示して最新の記録を見やすくする
-        for day in sorted(st.session_state.history.keys(), reverse=True):
-            status = st.session_state.history[day]
-            icon = "✅" if status == "達成" else "❌"
-            st.markdown(f"{icon} **Day {day}:** {status}")
-    else:
-        st.info("まだ記録がありません。チャレンジを開始しましょう！")
 
-st.markdown("---")
-st.caption(f"現在のチャレンジテーマ: **{st.session_state.theme}**")
+with theme_area:
+    theme_panel()
+with progress_area:
+    progress_panel()
+with reward_area:
+    reward_panel()
 
 # --- デバッグ/リセット機能 (必要であればコメントアウトを外す) ---
 if st.button("リセット"):
@@ -1,184 +1,657 @@
 import streamlit as st
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+import collections
+import datetime
 import json
 import os
+import socket
+import time
+import urllib.parse
+import uuid
+
+import engine
+from board import BOARD_LENGTH_OPTIONS, REWARD_INTERVAL, BoardConfig, reward_days_for
+from date_index import DateIndex
+from history_bits import json_default
+from journal import apply_changes, merge_changes
+from live_sync import LiveSync
+from locking import file_signature
+import metrics
+from metrics import timed, timed_function
+import portfolio
+import share
+from state_cache import StateCache
+from storage import CHALLENGE_ID_PATTERN, DEFAULT_CHALLENGE_ID, create_storage
+import undo
+from writer import WriteBehindQueue
 
 # --- 定数と設定 ---
-MAX_MASU = 25
-REWARD_DAYS = [3, 7, 14, 21, 25]
+MAX_MASU = 25  # 盤面の長さの初期値（画面で 100 / 365 / 1000 日も選べる）
+# 長い盤面でご褒美マスを置く間隔は board の設定（SUGOROKU_REWARD_INTERVAL）を使い、盤面・ご褒美・概要に渡す
+# （保存先が保存時に作る概要も同じ設定で決まるため、変えるときは環境変数で変える）
+REWARD_DAYS = reward_days_for(MAX_MASU, REWARD_INTERVAL)
 START_MASU = 1
 GOAL_MASU = MAX_MASU
+HISTORY_LIMIT = 30  # サイドバーに表示する履歴の件数（長いチャレンジでも描画量を一定にする）
 DATA_FILE = "sugoroku_data.json"  # データを保存するファイル名
+# 保存方式:
+#   "journal" 操作ごとに1行追記し定期的にDATA_FILEへ圧縮 / "file" 毎回DATA_FILEを全書き換え
+#   "sqlite"  ユーザー・チャレンジごとに行単位で保存 / "memory" ファイルに保存しない（app07と同じ）
+#   "crdt"    端末ごとのログに項目単位で追記し、共有フォルダ上の他の端末の記録とまとめる（複数端末での同時編集用）
+# 保存方式と書き込み間隔は、ベンチマークや負荷試験用に環境変数でも切り替えられる
+STORAGE_BACKEND = os.environ.get("SUGOROKU_STORAGE_BACKEND", "journal")
+JOURNAL_FILE = "sugoroku_data.journal"  # 追記型ジャーナルのファイル名
+JOURNAL_COMPACT_EVERY = 200  # この件数だけ追記したらDATA_FILEへ圧縮する
+SQLITE_FILE = "sugoroku_data.db"  # SQLiteのデータベースファイル名
+# "file" / "journal" の保存ファイルの形式: "json" 従来のJSON / "binary" 型の決まったバイナリ（拡張子 .sgrk）
+# （読み込みはどちらの形式でもでき、もう一方の形式のファイルは次の保存でこの形式に書き直される）
+SNAPSHOT_FORMAT = os.environ.get("SUGOROKU_SNAPSHOT_FORMAT", "json")
+REPLICA_DIR = os.environ.get("SUGOROKU_REPLICA_DIR", "sugoroku_data.crdt")  # "crdt" の端末ごとのログを置くフォルダ
+DEVICE_ID = os.environ.get("SUGOROKU_DEVICE_ID", socket.gethostname())  # "crdt" でこの端末（サーバー）を区別する名前
+# 保存をまとめて書き込む間隔（秒）。0 にするとその場で書き込む
+WRITE_BEHIND_INTERVAL = float(os.environ.get("SUGOROKU_WRITE_BEHIND_INTERVAL", "1.0"))
+# 読み込み済みの状態をプロセス内に保持する件数とメモリ量の上限。0 件にするとキャッシュしない
+# （同じ保存先を複数のプロセスで共有するときは 0 にする）
+STATE_CACHE_ENTRIES = int(os.environ.get("SUGOROKU_STATE_CACHE_ENTRIES", "256"))
+STATE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+# 保存ファイルを監視し、他のタブや手での編集による変更を開いているタブへ届ける（"0" で無効）
+LIVE_SYNC = os.environ.get("SUGOROKU_LIVE_SYNC", "1") == "1"
+# 届いた状態で作り直す入力欄のキー（入力欄は前回の値を覚えているため）
+SYNCED_WIDGET_KEYS = ("board_length_select", "theme_input")
+SYNCED_WIDGET_PREFIXES = ("reward_name_", "reward_check_")
+# チャレンジを切り替えるときに消して、次の実行の初期化で読み込み直すセッションのキー
+CHALLENGE_STATE_KEYS = ("game", "board_page", "challenge_select")
+# テーマとご褒美名の入力欄は、最後の入力からこの秒数だけ待ってまとめて保存する
+AUTOSAVE_DELAY = float(os.environ.get("SUGOROKU_AUTOSAVE_DELAY", "2.0"))
+# 処理時間の計測（SUGOROKU_METRICS=1 のときだけ有効）の書き出し先
+METRICS_PORT = int(os.environ.get("SUGOROKU_METRICS_PORT", "0"))  # 0 以外なら http://127.0.0.1:ポート/metrics
+METRICS_FILE = os.environ.get("SUGOROKU_METRICS_FILE")  # 指定するとPrometheusのテキスト形式で定期的に書き出す
+# 共有表示のスナップショットを持つ秒数（他のプロセスでの保存や手での編集は、長くてもこの秒数で反映される）
+SHARE_SNAPSHOT_TTL = float(os.environ.get("SUGOROKU_SHARE_SNAPSHOT_TTL", "60"))
+
+# ユーザーはURLの ?user=... で区別する（"file" / "journal" では全員で1つのファイルを共有）
+USER_ID = st.query_params.get("user", "default")
+# チャレンジは ?challenge=... で区別する（1ユーザーが複数のチャレンジを並行して進められる）
+# "file" / "journal" ではファイル名にも使うため、使えない文字を含むIDは既定のチャレンジとして扱う
+CHALLENGE_ID = st.query_params.get("challenge", DEFAULT_CHALLENGE_ID)
+if not CHALLENGE_ID_PATTERN.fullmatch(CHALLENGE_ID):
+    CHALLENGE_ID = DEFAULT_CHALLENGE_ID
+# ?share=チャレンジID で、そのチャレンジを読み取り専用で表示する（友だちへの共有用。持ち主は ?user= で指定）
+SHARE_ID = st.query_params.get("share")
+if SHARE_ID is not None and CHALLENGE_ID_PATTERN.fullmatch(SHARE_ID):
+    CHALLENGE_ID = SHARE_ID
+SESSION_ID = get_script_run_ctx().session_id  # 変更を届ける先のタブの区別に使う
 
 
 # --- データの永続化関数 ---
-# ... (load_data, save_data 関数は変更なし) ...
 
+@st.cache_resource
+def get_storage():
+    """全セッション・再実行で共有するストレージ（SQLiteの接続プールなど）を作成する"""
+    return create_storage(
+        STORAGE_BACKEND,
+        data_file=DATA_FILE,
+        journal_file=JOURNAL_FILE,
+        sqlite_file=SQLITE_FILE,
+        compact_every=JOURNAL_COMPACT_EVERY,
+        replica_dir=REPLICA_DIR,
+        device_id=DEVICE_ID,
+        snapshot_format=SNAPSHOT_FORMAT,
+    )
+
+
+@st.cache_resource
+def get_writer():
+    """全セッションで共有する裏側の書き込みスレッドを作成する"""
+    return WriteBehindQueue(get_storage(), interval=WRITE_BEHIND_INTERVAL)
+
+
+@st.cache_resource
+def get_state_cache():
+    """全セッションで共有する、読み込み済みの状態のキャッシュを作成する（無効なら None）"""
+    if STATE_CACHE_ENTRIES <= 0:
+        return None
+    return StateCache(
+        get_storage(),
+        writer=get_writer() if WRITE_BEHIND_INTERVAL > 0 else None,
+        max_entries=STATE_CACHE_ENTRIES,
+        max_bytes=STATE_CACHE_MAX_BYTES,
+    )
+
+
+@st.cache_resource
+def get_live_sync():
+    """保存ファイルの監視を作成する（ファイルに保存しない方式や無効にした場合は None）"""
+    storage = get_storage()
+    if not LIVE_SYNC or storage.files is None:
+        return None
+    return LiveSync(
+        storage,
+        lambda: storage.files,  # チャレンジを作るとファイルが増える方式があるため、毎回問い合わせる
+        rerun_session,
+        MAX_MASU,
+        writer=get_writer() if WRITE_BEHIND_INTERVAL > 0 else None,
+        cache=get_state_cache(),
+    )
+
+
+def rerun_session(session_id):
+    """別のセッションに再実行を依頼する（閉じられたセッションや、サーバー外での実行では False）
+
+    Streamlit の公開されていない部分（Runtime の _session_mgr）を使うため、見つからない・呼び出せない版では
+    False を返す。その場合は他のタブへ変更を届けられないだけで、そのタブは次の実行で監視に登録し直される。
+    """
+    try:
+        if not Runtime.exists():
+            return False
+        session_mgr = getattr(Runtime.instance(), "_session_mgr", None)  # AppTest では Runtime が仮のものになる
+        get_info = getattr(session_mgr, "get_active_session_info", None)
+        info = get_info(session_id) if callable(get_info) else None
+        if info is None:
+            return False
+        info.session.request_rerun(None)  # Streamlit がソースの変更で再実行するときと同じ呼び出し
+    except (AttributeError, RuntimeError, TypeError):
+        return False
+    return True
+
+
+def apply_synced_state(data):
+    """他のタブや手での編集で変わった状態をセッションに反映する"""
+    st.session_state.game.load(data, MAX_MASU, REWARD_INTERVAL)
+    for key in list(st.session_state.keys()):
+        if key in SYNCED_WIDGET_KEYS or key.startswith(SYNCED_WIDGET_PREFIXES):
+            del st.session_state[key]
+
+
+@st.cache_resource
+def get_board_config(board_length):
+    """盤面の長さごとの変わらない設定（ご褒美マスやマスごとのHTMLの表）を、プロセスで1回だけ作る"""
+    return BoardConfig.build(board_length, reward_days_for(board_length, REWARD_INTERVAL))
+
+
+@st.cache_resource
+def get_share_versions():
+    """共有表示のスナップショットの版（(ユーザー, チャレンジ) -> 保存の回数）。このプロセスでの保存で進める"""
+    return {}
+
+
+@st.cache_data(ttl=SHARE_SNAPSHOT_TTL, max_entries=256, show_spinner=False)
+def load_share_snapshot(user_id, challenge_id, version):
+    """共有表示のスナップショットを作る（user_id, challenge_id, version はキャッシュのキー。
+    持ち主が保存すると version が変わるので、見る人が何人いても作り直すのは保存1回につき1回だけ）"""
+    return share.build_snapshot(load_data(), MAX_MASU, reward_interval=REWARD_INTERVAL)
+
+
+@st.cache_resource
+def start_metrics_exporter():
+    """計測結果の書き出しスレッドをプロセスで1回だけ起動する"""
+    metrics.start_exporter(port=METRICS_PORT, textfile=METRICS_FILE)
+
+
+@timed_function("load_data")
 def load_data():
-    """保存されたデータをファイルから読み込む"""
-    if os.path.exists(DATA_FILE):
-        with open(DATA_FILE, 'r', encoding='utf-8') as f:
-            try:
-                # 辞書型としてデータを読み込む
-                return json.load(f)
-            except json.JSONDecodeError:
-                # ファイルが空や破損している場合
-                st.error("保存ファイルが破損しています。新しいチャレンジを開始します。")
-                return {}
-    return {}  # ファイルが存在しない場合は空の辞書を返す
-
-
-def save_data():
-    """現在のアプリの状態をファイルに保存する"""
-    data_to_save = {
-        "current_day": st.session_state.current_day,
-        "history": st.session_state.history,
-        "rewards": st.session_state.rewards,
-        "consecutive_success": st.session_state.consecutive_success,
-        "theme": st.session_state.theme,  # テーマも保存
+    """保存されたデータを読み込む（ファイルが変わっていなければ全セッション共通のキャッシュを返す）"""
+    cache = get_state_cache()
+    if cache is not None:
+        # 読み込み済みのユーザー（別タブや再訪問）は、保持している状態を複製して使う
+        return _read_data(cache, USER_ID, CHALLENGE_ID)
+    if WRITE_BEHIND_INTERVAL > 0:
+        # 書き込み待ちの変更を先に反映してから読み込む
+        get_writer().flush()
+    storage = get_storage()
+    if storage.files is None:
+        # ファイルの署名で判定できない保存先は、毎回ストレージから読み込む
+        return _read_data(storage, USER_ID, CHALLENGE_ID)
+    signatures = tuple(file_signature(path) for path in storage.files)
+    return _load_data_cached(STORAGE_BACKEND, USER_ID, CHALLENGE_ID, signatures)
+
+
+@st.cache_data(max_entries=8, show_spinner=False)
+def _load_data_cached(backend, user_id, challenge_id, signatures):
+    """ファイルの署名をキーにして読み込み結果をキャッシュする（backend, signatures は無効化の判定用）"""
+    return _read_data(get_storage(), user_id, challenge_id)
+
+
+def _read_data(source, user_id, challenge_id):
+    """保存されたデータをストレージ（またはキャッシュ）から読み込む"""
+    try:
+        # 辞書型としてデータを読み込む
+        return source.load(user_id, challenge_id)
+    except json.JSONDecodeError:
+        # ファイルが空や破損している場合
+        st.error("保存ファイルが破損しています。新しいチャレンジを開始します。")
+        return {}
+
+
+@timed_function("save_data")
+def save_data(changes=None, undo_step=None):
+    """現在のアプリの状態をファイルに保存する
+
+    changes: 今回の操作で変わった部分（journal.apply_changes の形式）。
+    journal / sqlite ではこの部分だけを書き込む。None の場合は状態全体を保存する。
+    undo_step: (操作の名前, undo.capture で取った操作前の値)。指定すると取り消せる操作として積む。
+    """
+    game = st.session_state.game
+    if undo_step is not None:
+        # 取り消し・やり直しの操作を積み、その分も同じ保存で書き込む（やり直しの内容にテーマは含めない）
+        changes = merge_changes(changes, game.undo.push(*undo_step, changes))
+    if changes is not None:
+        # まだ保存していないテーマ・ご褒美名の入力も、同じ書き込みにまとめる
+        changes = merge_changes(changes, take_text_edits())
+    else:
+        game.text_edits = {}  # 状態全体を保存するので、入力欄の変更も含まれる
+    store_challenge(CHALLENGE_ID, current_state(), changes, undo_stack=game.undo)
+
+
+def note_text_edit(field):
+    """テーマ（"theme"）・ご褒美名（日数）の入力欄の変更を記録する。保存は flush_text_edits でまとめて行う"""
+    game = st.session_state.game
+    if field == "theme":
+        value = game.theme = st.session_state.theme_input
+    else:
+        value = game.rewards[field]["name"] = st.session_state[f"reward_name_{field}"]
+    # 同じ欄を何度書き換えても、保存するのは最後の値だけ
+    game.text_edits[field] = value
+    game.text_edited_at = time.monotonic()
+
+
+def take_text_edits():
+    """まだ保存していない入力欄の変更を変更レコードにして返し、記録を消す（変わった欄だけを含む）"""
+    game = st.session_state.game
+    edits = game.text_edits
+    if not edits:
+        return {}
+    changes = {}
+    if "theme" in edits:
+        changes["set"] = {"theme": game.theme}
+    rewards = game.rewards
+    days = [day for day in edits if day != "theme" and day in rewards]  # 日数の変更でなくなったマスは除く
+    if days:
+        changes["rewards"] = {day: rewards[day] for day in days}
+    game.text_edits = {}
+    return changes
+
+
+def restore_text_edits():
+    """他のタブから届いた状態で上書きされた、まだ保存していない入力欄の変更を戻す"""
+    game = st.session_state.game
+    for field, value in game.text_edits.items():
+        if field == "theme":
+            game.theme = value
+        elif field in game.rewards:
+            game.rewards[field]["name"] = value
+
+
+def flush_text_edits(force=False):
+    """入力が止まってから AUTOSAVE_DELAY 秒たった（force なら今すぐ）入力欄の変更を保存する。保存したら True"""
+    game = st.session_state.game
+    if not game.text_edits:
+        return False
+    if not force and time.monotonic() - game.text_edited_at < AUTOSAVE_DELAY:
+        return False
+    save_data({})
+    return True
+
+
+@st.fragment(run_every=AUTOSAVE_DELAY)
+def autosave_text_edits():
+    """入力が止まるのを待って、まだ保存していない入力欄の変更を保存する（変更があるときだけ置く）"""
+    if flush_text_edits():
+        st.rerun()  # 全体を描き直し、この定期実行を止める
+
+
+def store_challenge(challenge_id, state, changes=None, undo_stack=None):
+    """チャレンジの状態を保存先へ渡す（表示中でないチャレンジの作成にも使う）
+
+    undo_stack: 取り消し・やり直しの操作。同じチャレンジを開いている他のタブへは、これも含めて届ける
+    （含めないと、届いた側の取り消しの記録が空になり、次の保存で位置を上書きしてしまう）。
+    """
+    cache = get_state_cache()
+    if cache is not None:
+        # キャッシュを更新してから保存先へ渡す（書き込みスレッドの使い方は get_state_cache で決まる）
+        cache.save(USER_ID, challenge_id, state, changes)
+    elif WRITE_BEHIND_INTERVAL > 0:
+        # 書き込みは裏側のスレッドに任せ、画面の再描画をディスクの書き込みで待たせない
+        get_writer().submit(USER_ID, challenge_id, state, changes)
+    else:
+        get_storage().save(USER_ID, challenge_id, state, changes)
+    live_sync = get_live_sync()
+    if live_sync is not None:
+        # このタブへは送り返さず、同じチャレンジを開いている他のタブへ保存した状態を届ける
+        synced = state if undo_stack is None else {**state, **undo_stack.to_state()}
+        live_sync.note_saved(SESSION_ID, USER_ID, challenge_id, synced)
+    # 共有表示のスナップショットを次に見られたときに作り直させる（保存先へ渡した後に進める）
+    versions = get_share_versions()
+    versions[(USER_ID, challenge_id)] = versions.get((USER_ID, challenge_id), 0) + 1
+
+
+@timed_function("load_summaries")
+def load_summaries():
+    """ユーザーの全チャレンジの概要を返す（保存時に作った概要だけを読み、履歴は読み込まない）
+
+    書き込み待ちのチャレンジと表示中のチャレンジは、まだ保存先の概要に入っていない変更があるため、
+    その状態から概要を作り直して差し替える。表示中のチャレンジは履歴を集計し直さず、セッションの集計（game.stats）から作る。
+    """
+    # 先に書き込み待ちを取り出す（間に書き込まれても、保存先の概要の方に入っている）
+    pending = get_writer().pending(USER_ID) if WRITE_BEHIND_INTERVAL > 0 else {}
+    summaries = get_storage().summaries(USER_ID)
+    for challenge_id, state in pending.items():
+        if challenge_id != CHALLENGE_ID:  # 表示中のチャレンジは下で差し替える
+            summaries[challenge_id] = portfolio.summarize(state, MAX_MASU, REWARD_INTERVAL)
+    summaries[CHALLENGE_ID] = portfolio.summarize_session(st.session_state.game, REWARD_INTERVAL)
+    return summaries
+
+
+def current_state():
+    """保存対象のアプリの状態を辞書にまとめる"""
+    game = st.session_state.game
+    return {
+        "current_day": game.current_day,
+        "history": game.history,
+        "rewards": game.rewards,
+        "consecutive_success": game.consecutive_success,
+        "theme": game.theme,  # テーマも保存
+        "board_length": game.board_length,
+        "calendar": game.calendar.encode(),
     }
-    # JSON形式でファイルに書き込む
-    with open(DATA_FILE, 'w', encoding='utf-8') as f:
-        json.dump(data_to_save, f, ensure_ascii=False, indent=4)
 
 
 # --- 処理関数 ---
+# ルール自体は engine.py にあり、ここでは画面への表示（トースト）と保存だけを行う
 
+@timed_function("callback.reset_game")
 def reset_game():
     """ゲームの状態を初期値にリセットする (テーマは除く)"""
-    st.session_state.current_day = 1
-    st.session_state.history = {}
-    st.session_state.rewards = {day: {"name": "", "checked": False} for day in REWARD_DAYS}
-    st.session_state.consecutive_success = 0
-    st.session_state.animation_type = None
-    st.session_state.reward_checked_animation = False
-
-    st.toast("チャレンジをリセットしました！", icon="🗑️")
-    save_data()  # リセット後、データを保存
+    game = st.session_state.game
+    before = undo.capture(current_state(), ("current_day", "history", "rewards", "consecutive_success", "calendar"))
+    toast = engine.reset(game, REWARD_DAYS)
+    game.calendar = DateIndex()  # 日付ごとの記録も次の記録の日から始め直す
+
+    st.toast(toast.text, icon=toast.icon)
+    save_data({"set": {
+        "current_day": 1,
+        "history": {},
+        "rewards": game.rewards,
+        "consecutive_success": 0,
+        "calendar": "",
+    }}, undo_step=("リセット", before))  # リセット後、データを保存
     # st.rerun() は削除済み
 
 
+@timed_function("callback.record_success")
 def record_success():
     """達成ボタンが押されたときの処理"""
-    if st.session_state.current_day <= GOAL_MASU:
-
-        day_achieved = st.session_state.current_day  # 達成したマス番号
-
-        # 現在のマスを達成済みとして記録 (キーはint)
-        st.session_state.history[day_achieved] = "達成"
-
-        # 連続達成日数を加算
-        st.session_state.consecutive_success += 1
-
-        # アニメーションフラグの設定とトーストメッセージ
-        if day_achieved == GOAL_MASU:
-            # Day 25: ゴール達成 (風船+雪の最大演出)
-            st.session_state.animation_type = "goal_celebration"
-            st.toast("👑 GOAL達成！おめでとうございます！25日間継続できました！", icon="🎊")
-        elif day_achieved in REWARD_DAYS:
-            # ご褒美マス達成 (風船のみ)
-            st.session_state.animation_type = "balloons"
-            st.toast(f"🎁 ご褒美マス達成！おめでとうございます！", icon="✨")
-        elif st.session_state.consecutive_success > 0 and st.session_state.consecutive_success % 3 == 0:  # 連続達成日数が0でないことを確認
-            # 連続達成メッセージ
-            st.toast(f"🎉 3日連続達成！偉い！ {st.session_state.consecutive_success}日連続記録更新中！", icon="🥳")
-        else:
-            st.toast("達成を記録しました！次の日も頑張りましょう！", icon="💪")
-
-        # 次のマスへ進む (Day 25達成時はDay 26に進み、ボタンを無効化する)
-        if st.session_state.current_day <= GOAL_MASU:
-            st.session_state.current_day += 1
-
-    save_data()  # 達成記録後、データを保存
+    game = st.session_state.game
+    catch_up_missed_days()  # 日付をまたいで開いていたタブでは、先に記録のなかった日を埋める
+    day_achieved = game.current_day  # 達成したマス番号
+    before = undo.capture(current_state(), ("current_day", "consecutive_success", "calendar"), history=(day_achieved,))
+    toast = engine.record_success(game, GOAL_MASU, REWARD_DAYS)
+    if toast:
+        st.toast(toast.text, icon=toast.icon)
+        record_calendar("達成")
+        save_data({
+            "set": {
+                "current_day": game.current_day,
+                "consecutive_success": game.consecutive_success,
+                "calendar": game.calendar.encode(),
+            },
+            # 未達成のマスを達成した場合は RETRIED になる（未達成だったことも保存する）
+            "history": {day_achieved: game.history.stored(day_achieved)},
+        }, undo_step=(f"Day {day_achieved} の達成", before))  # 達成記録後、データを保存
     # Session State (current_day, history, consecutive_success)が更新されるため、st.rerun()は不要
 
 
+@timed_function("callback.record_failure")
 def record_failure():
     """未達成ボタンが押されたときの処理"""
-    if st.session_state.current_day <= GOAL_MASU:  # ゴール後は未達成も記録しない
-        # キーはint
-        st.session_state.history[st.session_state.current_day] = "未達成"
-        st.session_state.consecutive_success = 0  # 連続達成日数をリセット
-        st.toast("未達成を記録しました。また明日から気持ちを切り替えて！", icon="😭")
-
-        save_data()  # 失敗記録後、データを保存
+    game = st.session_state.game
+    catch_up_missed_days()
+    day_failed = game.current_day
+    before = undo.capture(current_state(), ("consecutive_success", "calendar"), history=(day_failed,))
+    toast = engine.record_failure(game, GOAL_MASU)
+    if toast:  # ゴール後は未達成も記録しない
+        st.toast(toast.text, icon=toast.icon)
+        record_calendar("未達成")
+        save_data({
+            "set": {"consecutive_success": 0, "calendar": game.calendar.encode()},
+            "history": {day_failed: "未達成"},
+        }, undo_step=(f"Day {day_failed} の未達成", before))  # 失敗記録後、データを保存
         # st.rerun() # Session Stateが更新されるため、st.rerun()は削除
 
 
+def record_calendar(status):
+    """今日の状態を日付ごとの記録に書き込む
+
+    最後の記録が今日より後の日付（端末の時計を戻した、別の端末の記録をインポートしたなど）のときは
+    日付ごとの記録には書かず、盤面の記録だけを残して知らせる。
+    """
+    calendar = st.session_state.game.calendar
+    try:
+        calendar.record(datetime.date.today(), status)
+    except ValueError:  # 過去の日付には記録できない（記録は変わらない）
+        st.toast(f"日付ごとの記録が {calendar.last_date} まであるため、今日の分は記録しませんでした", icon="⚠️")
+
+
+def catch_up_missed_days():
+    """最後の記録から昨日までの記録のない日を、1回の計算でまとめて 未達成 にする
+
+    日付ごとの記録には1日ずつ 未達成 を追加し、盤面では（未達成ボタンと同じく）現在のマスを1回だけ 未達成 にする。
+    """
+    game = st.session_state.game
+    missed = game.calendar.fill_missed(datetime.date.today())
+    if not missed:
+        return
+    changes = {"set": {"calendar": game.calendar.encode()}}
+    if engine.record_failure(game, GOAL_MASU):  # ゴール後は盤面には記録しない
+        changes["set"]["consecutive_success"] = 0
+        changes["history"] = {game.current_day: "未達成"}
+    save_data(changes)
+    st.toast(f"記録のなかった {missed} 日を未達成にしました", icon="📅")
+
+
+@timed_function("callback.undo_last_action")
+def undo_last_action():
+    """直前の操作を取り消す"""
+    apply_undo_move(st.session_state.game.undo.undo, "「{}」を取り消しました", "↩️")
+
+
+@timed_function("callback.redo_last_action")
+def redo_last_action():
+    """取り消した操作をやり直す"""
+    apply_undo_move(st.session_state.game.undo.redo, "「{}」をやり直しました", "↪️")
+
+
+def apply_undo_move(move, message, icon):
+    """取り消し・やり直しの変更レコードを現在の状態に適用し、変わった項目と位置だけを保存する"""
+    label, changes, cursor = move()
+    game = st.session_state.game
+    stack = game.undo
+    data = apply_changes(json.loads(json.dumps(current_state(), ensure_ascii=False, default=json_default)), changes)
+    apply_synced_state(data)  # 日数やご褒美の入力欄も作り直す
+    game.undo = stack
+    save_data(merge_changes(changes, cursor))
+    st.toast(message.format(label), icon=icon)
+
+
+@timed_function("callback.switch_challenge")
+def switch_challenge():
+    """サイドバーで選んだチャレンジに切り替える"""
+    open_challenge(st.session_state.challenge_select)
+
+
+@timed_function("callback.create_challenge")
+def create_challenge():
+    """新しいチャレンジを保存して、そのチャレンジに切り替える"""
+    board_length = st.session_state.new_challenge_length
+    theme = st.session_state.new_challenge_theme.strip() or engine.DEFAULT_THEME
+    challenge_id = uuid.uuid4().hex[:12]
+    store_challenge(challenge_id, {
+        "current_day": 1,
+        "history": {},
+        "rewards": engine.new_rewards(get_board_config(board_length).reward_days),
+        "consecutive_success": 0,
+        "theme": theme,
+        "board_length": board_length,
+        "calendar": "",
+    })
+    open_challenge(challenge_id)
+    st.session_state.new_challenge_theme = ""
+    st.toast(f"新しいチャレンジ「{theme}」を始めました！", icon="🚩")
+
+
+def open_challenge(challenge_id):
+    """URLのチャレンジIDを変え、表示中のチャレンジの状態を消す（次の実行の初期化で読み込み直す）"""
+    flush_text_edits(force=True)  # 切り替える前のチャレンジへの入力を保存しておく
+    st.query_params["challenge"] = challenge_id
+    for key in list(st.session_state.keys()):
+        if key in CHALLENGE_STATE_KEYS or key in SYNCED_WIDGET_KEYS or key.startswith(SYNCED_WIDGET_PREFIXES):
+            del st.session_state[key]
+
+
+@timed_function("callback.update_reward_check")
 def update_reward_check(day):
     """ご褒美チェックボックスの更新処理"""
-    is_checked = st.session_state[f"reward_check_{day}"]
-    # チェックボックスの状態をセッションに反映
-    st.session_state.rewards[day]["checked"] = is_checked
-
-    # チェックが入ったら（ご褒美をGETしたら）アニメーションフラグを立てる
-    if is_checked:
-        st.session_state.reward_checked_animation = True
-
-    save_data()  # チェック状態変更後、データを保存
-
+    game = st.session_state.game
+    before = undo.capture(current_state(), rewards=(day,))
+    # チェックボックスの状態をセッションに反映（チェックが入ったらアニメーションフラグを立てる）
+    engine.set_reward_checked(game, day, st.session_state[f"reward_check_{day}"])
+
+    # チェック状態変更後、データを保存
+    save_data({"rewards": {day: game.rewards[day]}}, undo_step=(f"Day {day} のご褒美のチェック", before))
+
+
+@timed_function("callback.change_board_length")
+def change_board_length():
+    """チャレンジの日数が変更されたときの処理（記録済みのご褒美は引き継ぐ）"""
+    game = st.session_state.game
+    board_length = st.session_state.board_length_select
+    before = undo.capture(current_state(), ("board_length", "rewards", "current_day"))
+    game.board_length = board_length
+    game.rewards = {
+        day: game.rewards.get(day, {"name": "", "checked": False})
+        for day in get_board_config(board_length).reward_days
+    }
+    # ゴールを過ぎた位置にいる場合はゴール直後に合わせる
+    game.current_day = min(game.current_day, board_length + 1)
+
+    save_data({"set": {
+        "board_length": board_length,
+        "rewards": game.rewards,
+        "current_day": game.current_day,
+    }}, undo_step=("日数の変更", before))  # 日数変更後、データを保存
+
+
+# --- 読み取り専用の共有表示 ---
+# セッションの状態は作らず、全員で共有するスナップショットを描くだけで終える（操作できる部品は置かない）
+if SHARE_ID is not None:
+    st.set_page_config(page_title="3日坊主すごろく", page_icon="🌟", layout="wide")
+    snapshot = None
+    if CHALLENGE_ID == SHARE_ID:
+        version = get_share_versions().get((USER_ID, CHALLENGE_ID), 0)
+        snapshot = load_share_snapshot(USER_ID, CHALLENGE_ID, version)
+    if snapshot is None:
+        st.title("三日坊主防止すごろく 🌟")
+        st.warning("共有されたチャレンジが見つかりません。リンクを確認してください。")
+        st.stop()
+
+    summary = snapshot["summary"]
+    st.title(f"{summary['theme']}（{summary['board_length']}マス）🌟")
+    st.caption("共有された進み具合です（読み取り専用）")
+    col_position, col_achieved, col_streak, col_longest = st.columns(4)
+    if summary["goal_reached"]:
+        col_position.metric("現在の位置", "GOAL達成！🎉")
+    else:
+        col_position.metric("現在の位置", f"{summary['current_day']}マス", f"残り{summary['board_length'] - summary['current_day']}日",
+                            delta_color="off")
+    col_achieved.metric("累計達成日数", f"{summary['achieved']}日", f"達成率 {snapshot['completion_rate']:.0%}", delta_color="off")
+    col_streak.metric("連続達成日数", f"{summary['current_streak']}日")
+    col_longest.metric("最長連続達成", f"{summary['longest_streak']}日")
+
+    col_game, col_reward = st.columns([3, 2])
+    with col_game:
+        st.subheader("すごろく盤")
+        st.markdown(snapshot["board_html"], unsafe_allow_html=True)
+    with col_reward:
+        st.subheader("ご褒美リスト")
+        for day, name, checked in snapshot["rewards"]:
+            st.markdown(f"{'✅' if checked else '⬜'} **Day {day}:** {name}")
+        if not snapshot["rewards"]:
+            st.caption("ご褒美はまだ決まっていません")
+        st.subheader("最近の記録")
+        for day, status in snapshot["recent_history"]:
+            st.markdown(f"{'✅' if status == '達成' else '❌'} **Day {day}:** {status}")
+        if snapshot["recorded"] > len(snapshot["recent_history"]):
+            st.caption(f"ほか {snapshot['recorded'] - len(snapshot['recent_history'])} 件")
+        elif not snapshot["recorded"]:
+            st.info("まだ記録がありません")
+    st.stop()
 
 # --- 初期化（アプリ起動時に一度だけ動く） ---
 
-# 1. 永続化されたデータのロード
-loaded_data = load_data()
-
-# 2. セッションステートへの反映と初期値設定
-# 'current_day'がセッションに存在しない場合のみ、ロードまたは初期値で設定する
-if "current_day" not in st.session_state:
-
-    # 基本データのロード
-    st.session_state.current_day = loaded_data.get("current_day", 1)
-    st.session_state.consecutive_success = loaded_data.get("consecutive_success", 0)
-    st.session_state.theme = loaded_data.get("theme", "読書を25日継続する！")
-
-    # --- history データのロードとキーの整数化 ---
-    loaded_history = loaded_data.get("history", {})
-    # JSONから読み込まれたキー（文字列）を、Pythonで扱いやすい整数に変換し直す
-    st.session_state.history = {}
-    for key, value in loaded_history.items():
-        try:
-            st.session_state.history[int(key)] = value
-        except ValueError:
-            # 整数に変換できないキー（予期せぬデータ）はスキップ
-            continue
-
-    # ご褒美データのロード（初期構造を保証）
-    initial_rewards = {day: {"name": "", "checked": False} for day in REWARD_DAYS}
-    loaded_rewards = loaded_data.get("rewards", {})
-
-    # ロードデータと初期構造をマージ（新しいご褒美マスが増えた場合などに備える）
-    st.session_state.rewards = initial_rewards
-    for day in REWARD_DAYS:
-        # JSONのキーは文字列なので、文字列キーでアクセスを試みる
-        key = str(day)
-        if key in loaded_rewards:
-            st.session_state.rewards[day] = loaded_rewards[key]
-        elif day in loaded_rewards:  # 念のため整数キーもチェック
-            st.session_state.rewards[day] = loaded_rewards[day]
-
-    # アニメーションフラグの初期化（アプリ起動時はアニメーション不要）
-    st.session_state.animation_type = None
-    st.session_state.reward_checked_animation = False
+# セッションステートへの反映と初期値設定
+# チャレンジの状態は __slots__ の1つのオブジェクト（engine.SessionChallenge）にまとめて 'game' に置く。
+# 'game' がセッションに存在しない場合のみ、ロードまたは初期値で設定する
+# （チャレンジを切り替えたときも open_challenge で消しているので、ここで読み込み直す）
+session_loaded = "game" not in st.session_state
+if session_loaded:
+    # 永続化されたデータのロード（セッションの初期化時だけファイルを確認する）
+    # 足りない項目の補完やキーの型の変換は engine.normalize_challenge で行う（一括インポートと共通）
+    st.session_state.game = engine.SessionChallenge.from_saved(load_data(), MAX_MASU, REWARD_INTERVAL)
+game = st.session_state.game
+
+# 他のタブや手での編集で保存ファイルが変わっていれば、届いた状態を反映する
+live_sync = get_live_sync()
+if live_sync is not None:
+    synced_data = live_sync.take(SESSION_ID)
+    if synced_data is not None and not session_loaded:  # 切り替える前のチャレンジに届いた変更は使わない
+        apply_synced_state(synced_data)
+        restore_text_edits()
+        st.toast("他のタブでの変更を反映しました", icon="🔄")
+    if session_loaded or not live_sync.watching(SESSION_ID):
+        live_sync.register(SESSION_ID, USER_ID, CHALLENGE_ID, current_state())
+
+# 盤面の長さとご褒美マスはセッションごとに選べるため、実行のたびにセッションから決める
+# （盤面の設定そのものは長さごとにプロセスで1つだけ作り、全セッションで共有する）
+BOARD = get_board_config(game.board_length)
+GOAL_MASU = BOARD.board_length
+REWARD_DAYS = BOARD.reward_days
+
+catch_up_missed_days()
 
 # --- UIのメインレイアウト ---
 st.set_page_config(page_title="3日坊主すごろく", page_icon="🌟", layout="wide")
 
-st.title("三日坊主防止すごろく（25マス）🌟")
+st.title(f"三日坊主防止すごろく（{GOAL_MASU}マス）🌟")
+
+# チャレンジの日数
+st.selectbox(
+    "チャレンジの日数",
+    BOARD_LENGTH_OPTIONS,
+    index=BOARD_LENGTH_OPTIONS.index(GOAL_MASU) if GOAL_MASU in BOARD_LENGTH_OPTIONS else 0,
+    key="board_length_select",
+    on_change=change_board_length,
+    format_func=lambda days: f"{days}日"
+)
 
 # テーマ設定とリセットボタンのエリア
 col_theme, col_reset = st.columns([4, 1])
 
 with col_theme:
-    st.session_state.theme = st.text_input(
-        "チャレンジテーマ（25日間の目標）",
-        value=st.session_state.theme,
+    game.theme = st.text_input(
+        f"チャレンジテーマ（{GOAL_MASU}日間の目標）",
+        value=game.theme,
         key="theme_input",  # keyを設定して永続化されたテーマと紐付け
+        on_change=note_text_edit,  # 入力を記録し、入力が止まってからまとめて保存する
+        args=("theme",),
         placeholder="例: 毎日10ページ本を読む！"
     )
 
 with col_reset:
     # リセットボタン (on_clickでreset_gameを呼び出す)
     st.button("🔄 チャレンジをリセット", on_click=reset_game, use_container_width=True)
+    # 取り消し・やり直しのボタンは、下の達成ボタンの処理の後で描く（押した操作をすぐ取り消せるように）
+    undo_area = st.container()
 
 st.subheader("今日の達成")
 
@@ -186,7 +659,7 @@ st.subheader("今日の達成")
 col_success, col_fail, col_status = st.columns([1.5, 1.5, 3])
 
 # ゴール達成後はボタンを無効化 (current_day > GOAL_MASU で無効)
-is_goal_achieved = st.session_state.current_day > GOAL_MASU
+is_goal_achieved = engine.is_goal_achieved(game, GOAL_MASU)
 
 if col_success.button("達成した！🎉", use_container_width=True, type="primary", disabled=is_goal_achieved):
     record_success()
@@ -197,21 +670,32 @@ if col_fail.button("今日はできなかった...😢", use_container_width=Tru
     # record_failure()内で Session Stateが変更されるため、st.rerun()は削除
     record_failure()
 
+# 取り消し・やり直し（押し間違いやリセットも元に戻せる）
+with undo_area:
+    undo_stack = game.undo
+    col_undo, col_redo = st.columns(2)
+    col_undo.button("↩️ 戻す", on_click=undo_last_action, disabled=not undo_stack.can_undo,
+                    help=f"「{undo_stack.undo_label}」を取り消す" if undo_stack.can_undo else None,
+                    use_container_width=True)
+    col_redo.button("↪️ やり直す", on_click=redo_last_action, disabled=not undo_stack.can_redo,
+                    help=f"「{undo_stack.redo_label}」をやり直す" if undo_stack.can_redo else None,
+                    use_container_width=True)
+
 # --- アニメーションの実行（成功時の一度だけ） ---
 # 1. 達成ボタンによるアニメーション
-if st.session_state.animation_type == "balloons":
+if game.animation_type == "balloons":
     st.balloons()
-    st.session_state.animation_type = None
-elif st.session_state.animation_type == "goal_celebration":
+    game.animation_type = None
+elif game.animation_type == "goal_celebration":
     # ゴール達成時は、風船と雪を両方飛ばし、最大限の演出をする
     st.balloons()
     st.snow()
-    st.session_state.animation_type = None
+    game.animation_type = None
 
 # 2. ご褒美チェックボックスによるアニメーション
-if st.session_state.reward_checked_animation:
+if game.reward_checked_animation:
     st.balloons()
-    st.session_state.reward_checked_animation = False  # 実行後にリセット
+    game.reward_checked_animation = False  # 実行後にリセット
 
 # 現在のステータス表示
 if is_goal_achieved:
@@ -219,10 +703,10 @@ if is_goal_achieved:
     col_status.markdown("## 🎉 おめでとう！GOAL達成！✨")
 else:
     col_status.markdown(
-        f"現在の位置: **{st.session_state.current_day}マス** (残り{GOAL_MASU - st.session_state.current_day}日)"
+        f"現在の位置: **{game.current_day}マス** (残り{GOAL_MASU - game.current_day}日)"
     )
     col_status.markdown(
-        f"連続達成日数: **{st.session_state.consecutive_success}日**"
+        f"連続達成日数: **{game.stats.current_streak}日**"
     )
 
 st.divider()
@@ -233,125 +717,183 @@ col_game, col_reward = st.columns([3, 2])
 with col_game:
     st.subheader("すごろく盤")
 
-    # すごろく盤の描画ロジック
-    masses = [
-        [1, 2, 3, 4, 5],
-        [6, 7, 8, 9, 10],
-        [11, 12, 13, 14, 15],
-        [16, 17, 18, 19, 20],
-        [21, 22, 23, 24, 25]
-    ]
-
-    for row in masses:
-        cols = st.columns(len(row))
-        for i, num in enumerate(row):
-            # マスのアイコンを決定
-            is_current = (num == st.session_state.current_day)
-
-            # historyのキーは初期化時に整数に統一されたため、ここではnum (int)で直接チェック
-            is_achieved = (num in st.session_state.history and st.session_state.history[num] == "達成")
-
-            is_reward = (num in REWARD_DAYS)
-            is_goal = (num == GOAL_MASU)
-
-            if is_current:
-                # 現在位置
-                mark = "⭐"
-            elif is_goal and is_achieved:
-                # ゴール達成済み
-                mark = "👑"
-            elif is_reward and is_achieved:
-                # ご褒美マス達成済み
-                mark = "🎁"
-            elif is_achieved:
-                # 過去の達成マス
-                mark = "✅"
-            elif is_reward:
-                # ご褒美マス
-                mark = "🌼"
-            elif is_goal:
-                # ゴールマス
-                mark = "🌟"
-            else:
-                # 通常マス
-                mark = "⚪"
-
-            # HTML/CSSでマスのデザインを調整
-            # 現在位置のマスは少し目立つように装飾
-            style = ""
-            if is_current:
-                style = "border: 2px solid #FF4B4B; background-color: #FFF0F0; border-radius: 8px; padding: 5px;"
-            elif is_achieved:
-                style = "background-color: #D4EDDA; border-radius: 8px; padding: 5px;"
-            elif is_reward:
-                style = "background-color: #FFF3CD; border-radius: 8px; padding: 5px;"
-
-            cols[i].markdown(
-                f"""
-                <div style='text-align:center; {style}'>
-                    <span style='font-size:30px;'>{mark}</span><br>
-                    <small style='font-size:14px; font-weight:bold;'>{num}</small>
-                </div>
-                """,
-                unsafe_allow_html=True
-            )
+    # 長い盤面はページに分け、表示中のページのマスだけを描画する（None は現在地のページ）
+    board_page = None
+    if BOARD.pages > 1:
+        board_page = st.selectbox(
+            "表示するページ",
+            [None] + list(range(BOARD.pages)),
+            key="board_page",
+            format_func=lambda page: "現在地のページ" if page is None else f"ページ {page + 1}"
+        )
+
+    # すごろく盤の描画ロジック（表示するマスを1つのHTMLにまとめて1回で描画。同じ盤面はキャッシュを再利用）
+    with timed("board"):
+        st.markdown(
+            BOARD.render(game.current_day, game.history, board_page),
+            unsafe_allow_html=True
+        )
 
 with col_reward:
     st.subheader("ご褒美リスト")
     st.markdown("ご褒美マスに到達するたびに、自分へのご褒美を記録しましょう！")
 
     # ご褒美入力とチェックボックスの描画
-    for day in REWARD_DAYS:
-        # ご褒美の入力フィールド
-        reward_name = st.session_state.rewards[day]["name"]
-
-        # ご褒美マスに到達したか、または過去に達成しているか
-        # 修正: 'is_checked' も含めて判定することで、一度チェックしたものはリセット後も操作可能にする
-        is_checked = st.session_state.rewards[day]["checked"]
-        can_check = (day <= st.session_state.current_day) or is_checked
-
-        # ご褒美入力欄
-        st.session_state.rewards[day]["name"] = st.text_input(
-            f"**Day {day} のご褒美**",
-            value=reward_name,
-            key=f"reward_name_{day}",
-            placeholder="例: 好きなケーキを買う、映画を見る",
-            label_visibility="visible" if reward_name else "collapsed"  # 既に入力されていればラベルを表示
-        )
-
-        # ご褒美のチェックボックス（ご褒美マスに到達したら有効化）
-        if st.session_state.rewards[day]["name"]:
-            # チェックボックスの状態をセッションに保存
-            st.checkbox(
-                f"GET: {st.session_state.rewards[day]['name']}",
-                value=is_checked,  # 既に定義された is_checked を使用
-                key=f"reward_check_{day}",
-                on_change=update_reward_check,  # チェック時に状態を更新する関数を呼び出し
+    with timed("rewards"):
+        for day in REWARD_DAYS:
+            # ご褒美の入力フィールド
+            reward_name = game.rewards[day]["name"]
+
+            # ご褒美マスに到達したか、または過去に達成しているか
+            # 修正: 'is_checked' も含めて判定することで、一度チェックしたものはリセット後も操作可能にする
+            is_checked = game.rewards[day]["checked"]
+            can_check = (day <= game.current_day) or is_checked
+
+            # ご褒美入力欄
+            game.rewards[day]["name"] = st.text_input(
+                f"**Day {day} のご褒美**",
+                value=reward_name,
+                key=f"reward_name_{day}",
+                on_change=note_text_edit,
                 args=(day,),
-                disabled=not can_check
+                placeholder="例: 好きなケーキを買う、映画を見る",
+                label_visibility="visible" if reward_name else "collapsed"  # 既に入力されていればラベルを表示
+            )
+
+            # ご褒美のチェックボックス（ご褒美マスに到達したら有効化）
+            if game.rewards[day]["name"]:
+                # チェックボックスの状態をセッションに保存
+                st.checkbox(
+                    f"GET: {game.rewards[day]['name']}",
+                    value=is_checked,  # 既に定義された is_checked を使用
+                    key=f"reward_check_{day}",
+                    on_change=update_reward_check,  # チェック時に状態を更新する関数を呼び出し
+                    args=(day,),
+                    disabled=not can_check
+                )
+
+# --- すべてのチャレンジのダッシュボード ---
+# 保存時に作った概要だけを集計する（チャレンジが数百件でも、履歴の読み込みは表示中の1件分もしない）
+summaries = load_summaries()
+if len(summaries) > 1:
+    with timed("dashboard"):
+        st.divider()
+        st.subheader("すべてのチャレンジ")
+        totals = portfolio.aggregate(summaries)
+        col_count, col_achieved, col_streak, col_longest = st.columns(4)
+        col_count.metric("チャレンジ", f"{totals['challenges']}件", f"ゴール {totals['completed']}件", delta_color="off")
+        col_achieved.metric("累計達成日数", f"{totals['achieved']}日", f"未達成 {totals['failed']}日", delta_color="off")
+        col_streak.metric("いちばん長い連続達成中", f"{totals['best_current_streak']}日")
+        col_longest.metric("最長連続達成", f"{totals['longest_streak']}日")
+
+        if totals["upcoming_rewards"]:
+            st.markdown("**もうすぐのご褒美**")
+            st.dataframe(
+                [
+                    {
+                        "チャレンジ": reward["theme"],
+                        "ご褒美マス": f"Day {reward['day']}",
+                        "あと": f"{reward['remaining']}日" if reward["remaining"] else "今日",
+                        "ご褒美": reward["name"] or "（未設定）",
+                    }
+                    for reward in totals["upcoming_rewards"]
+                ],
+                hide_index=True,
+                use_container_width=True,
             )
 
+        st.dataframe(
+            [
+                {
+                    "チャレンジ": summary["theme"],
+                    "進み具合": f"{min(summary['current_day'] - 1, summary['board_length'])} / {summary['board_length']}マス",
+                    "累計達成": summary["achieved"],
+                    "連続達成": summary["current_streak"],
+                    "最長連続": summary["longest_streak"],
+                    "最後の記録": summary["last_date"] or "",
+                }
+                for summary in summaries.values()
+            ],
+            hide_index=True,
+            use_container_width=True,
+        )
+
 # --- 達成履歴（サイドバーに移動） ---
-with st.sidebar:
-    st.subheader("達成履歴")
-    if st.session_state.history:
-        # historyのキーは初期化時に整数に統一されたため、int(day)で直接アクセス
-        sorted_days = sorted(st.session_state.history.keys(), reverse=True)
+with st.sidebar, timed("sidebar"):
+    # チャレンジの切り替えと作成（既定のチャレンジを先頭に、あとはテーマ順）
+    st.subheader("チャレンジ")
+    challenge_ids = sorted(summaries, key=lambda challenge_id: (challenge_id != DEFAULT_CHALLENGE_ID,
+                                                               summaries[challenge_id]["theme"]))
+    # 選択は表示名で送り返されるため、同じテーマと日数のチャレンジにはIDを付けて表示名を重ねない
+    challenge_labels = {
+        challenge_id: f"{summaries[challenge_id]['theme']}（{summaries[challenge_id]['board_length']}日）"
+        for challenge_id in challenge_ids
+    }
+    label_counts = collections.Counter(challenge_labels.values())
+    st.selectbox(
+        "表示するチャレンジ",
+        challenge_ids,
+        index=challenge_ids.index(CHALLENGE_ID),
+        key="challenge_select",
+        on_change=switch_challenge,
+        format_func=lambda challenge_id: (challenge_labels[challenge_id] if label_counts[challenge_labels[challenge_id]] == 1
+                                          else f"{challenge_labels[challenge_id]} #{challenge_id}"),
+    )
+    with st.expander("新しいチャレンジを始める"):
+        st.text_input("テーマ", key="new_challenge_theme", placeholder="例: 毎朝ストレッチをする")
+        st.selectbox("日数", BOARD_LENGTH_OPTIONS, key="new_challenge_length", format_func=lambda days: f"{days}日")
+        st.button("🚩 始める", on_click=create_challenge, use_container_width=True)
+    # 友だちには読み取り専用の表示を共有する（見る人は操作できず、保存もしない）
+    share_query = urllib.parse.urlencode({"user": USER_ID, "share": CHALLENGE_ID})
+    st.markdown(f"[🔗 このチャレンジの共有用リンク](?{share_query})")
+    st.divider()
 
-        # 達成したマスのリストを表示
-        achieved_days = [day for day in sorted_days if st.session_state.history[day] == "達成"]
-        st.markdown(f"**累計達成日数: {len(achieved_days)}日**")
+    st.subheader("達成履歴")
+    if game.history:
+        # 集計は記録のたびに更新済みなので、ここでは履歴を数え直さない
+        stats = game.stats
+        st.markdown(f"**累計達成日数: {stats.achieved}日**")
+        st.markdown(f"最長連続達成: {stats.longest_streak}日 / 未達成: {stats.failed}日 / 達成率: {stats.completion_rate:.0%}")
+        calendar = game.calendar
+        if len(calendar):
+            # 日付ごとの記録の期間集計（累積和の差なので、記録が何年分あっても一定の時間で求まる）
+            today = datetime.date.today()
+            for label, start in (("直近7日", today - datetime.timedelta(days=6)), ("今月", today.replace(day=1))):
+                achieved, failed = calendar.counts(start, today)
+                st.caption(f"{label}: 達成 {achieved}日 / 未達成 {failed}日")
         st.write("---")
 
-        # 履歴を逆順に表示して最新の記録を見やすくする
-        for day in sorted_days:
+        # 履歴を逆順に表示して最新の記録を見やすくする（最新 HISTORY_LIMIT 件まで）
+        for day in stats.recent_days(game.history, HISTORY_LIMIT):
             # historyのキーは整数なので、dayで直接アクセス
-            status = st.session_state.history[day]
+            status = game.history[day]
             icon = "✅" if status == "達成" else "❌"
             st.markdown(f"{icon} **Day {day}:** {status}")
+        if len(game.history) > HISTORY_LIMIT:
+            st.caption(f"ほか {len(game.history) - HISTORY_LIMIT} 件")
     else:
         st.info("まだ記録がありません。チャレンジを開始しましょう！")
 
 st.markdown("---")
-st.caption(f"現在のチャレンジテーマ: **{st.session_state.theme}**")
-st.caption("※このデータは、アプリが動作しているPCのローカルファイルに保存されます。")
\ No newline at end of file
+st.caption(f"現在のチャレンジテーマ: **{game.theme}**")
+st.caption("※このデータは、アプリが動作しているPCのローカルファイルに保存されます。")
+
+# テーマ・ご褒美名の入力の保存（入力が続いている間は待ち、止まってから変わった欄だけを1回で書き込む）
+flush_text_edits()
+if game.text_edits:
+    autosave_text_edits()
+
+# 保存時のロック待ちや競合の状況（負荷がかかったときの確認用）
+storage_stats = (get_state_cache() or get_storage()).stats()
+if live_sync is not None:
+    storage_stats = {**storage_stats, **live_sync.stats()}
+if storage_stats:
+    with st.expander("保存の統計"):
+        st.json(storage_stats)
+
+# 処理時間の計測結果（SUGOROKU_METRICS=1 で起動し、URLに ?debug=1 を付けたときだけ表示）
+if metrics.ENABLED:
+    start_metrics_exporter()
+    if st.query_params.get("debug") == "1":
+        with st.expander("処理時間の計測"):
+            st.dataframe(metrics.REGISTRY.summary())
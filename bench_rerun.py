@@ -0,0 +1,259 @@
+"""クリック1回あたりのコストを測るベンチマーク
+
+streamlit.testing の AppTest で app07.py / app09_can_be_saved.py を画面なしで操作し、
+操作ごとのスクリプト実行時間（p50 / p95）、描画された要素数、保存先のファイルに書き込んだバイト数を JSON に出力する。
+
+    python bench_rerun.py --output bench_results.json
+    python bench_rerun.py --output new.json --compare bench_results.json
+
+保存先のファイルは保存ファイル・ジャーナル・SQLite・CRDTのログで、ロック・索引・一時ファイルは数えない。
+書き込んだバイト数は操作の前後のファイルの中身を比べて求める: 新しく作った・置き換えたファイルは全体、
+追記したファイルは増えた分、同じファイルの中を書き換えた部分（SQLite）は変わった BLOCK_SIZE 単位の数。
+AppTest はフラグメントだけの再実行を再現しないため、app07 の部分再描画の効果はこの数値には現れない。
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import streamlit as st
+from streamlit.logger import set_log_level
+from streamlit.testing.v1 import AppTest
+
+import engine
+from board import reward_days_for
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APPS = ["app07.py", "app09_can_be_saved.py"]
+
+SUCCESS_LABEL = "達成した！🎉"
+FAILURE_LABEL = "今日はできなかった...😢"
+RESET_LABELS = {"app07.py": "リセット", "app09_can_be_saved.py": "🔄 チャレンジをリセット"}
+
+# シナリオ: 操作名の並び
+SCENARIOS = {
+    "success_x25": ["success"] * 25,
+    "alternating_failures": ["failure", "success"] * 12,
+    "reward_checks": ["success"] * 3 + ["name_reward", "check_reward", "uncheck_reward"] * 4,
+    "resets": ["success", "reset"] * 5,
+}
+BOARD_LENGTHS = [25, 365, 1000]
+HISTORY_SIZES = [0, 20, 300, 900]  # 操作前に記録済みにしておく日数（盤面の長さ未満のものだけ使う）
+STORAGE_PREFIX = "sugoroku_data"  # app09 の保存先のファイル名（フォルダ名）の先頭
+IGNORED_SUFFIXES = (".lock", ".tmp", "-shm")  # 保存内容ではないファイル
+BLOCK_SIZE = 4096  # ファイルの中を書き換える保存（SQLite のページ）で、変わった部分を数える単位
+
+
+def read_storage(workdir):
+    """作業ディレクトリにある保存先のファイル（ロック・索引・一時ファイルは除く）-> (iノード番号, 中身)"""
+    files = {}
+    for root, _, names in os.walk(workdir):
+        for name in names:
+            path = os.path.join(root, name)
+            if (not os.path.relpath(path, workdir).startswith(STORAGE_PREFIX)
+                    or name.endswith(IGNORED_SUFFIXES) or ".index." in name):
+                continue
+            try:
+                with open(path, 'rb') as f:
+                    files[path] = (os.fstat(f.fileno()).st_ino, f.read())
+            except FileNotFoundError:  # 読む間に置き換えられた一時ファイルなど
+                continue
+    return files
+
+
+def bytes_written(before, after):
+    """read_storage の結果2つから、その間に保存先のファイルに書き込んだバイト数を求める"""
+    total = 0
+    for path, (inode, data) in after.items():
+        old_inode, old_data = before.get(path, (None, b""))
+        if inode != old_inode:
+            total += len(data)  # 新しく作った、または一時ファイルから置き換えたファイルは全体を書いた
+            continue
+        total += max(len(data) - len(old_data), 0)  # 追記した分（圧縮で切り詰めた分は書き込みではない）
+        for start in range(0, min(len(data), len(old_data)), BLOCK_SIZE):
+            block = data[start:start + BLOCK_SIZE]
+            if block != old_data[start:start + len(block)]:
+                total += len(block)
+    return total
+
+
+def count_elements(node):
+    """描画ツリーの要素数を数える（ブロック自身も含む）"""
+    children = getattr(node, "children", None)
+    if not children:
+        return 1
+    return 1 + sum(count_elements(child) for child in children.values())
+
+
+def seed_session(at, app, board_length, history_size):
+    """history_size 日分を達成済みにした状態をセッションに入れておく"""
+    reward_days = reward_days_for(board_length)
+    if app == "app09_can_be_saved.py":
+        # app09 はチャレンジの状態を1つのオブジェクトにまとめて "game" に置く
+        state = engine.SessionChallenge.from_saved({"board_length": board_length}, board_length)
+    else:
+        state = engine.ChallengeState(reward_days)
+    for _ in range(history_size):
+        engine.record_success(state, board_length, reward_days)
+    state.animation_type = None
+    if app == "app09_can_be_saved.py":
+        at.session_state["game"] = state
+        return
+    for name in engine.ChallengeState.__slots__:
+        at.session_state[name] = getattr(state, name)
+    at.session_state["board_length"] = board_length
+
+
+def find_button(at, label):
+    for button in at.button:
+        if button.label == label:
+            return button
+    raise LookupError(label)
+
+
+def perform(at, app, action):
+    """操作を1回行う（run は呼ばない）。ボタンが無効などで操作できなければ False"""
+    if action in ("success", "failure"):
+        button = find_button(at, SUCCESS_LABEL if action == "success" else FAILURE_LABEL)
+        if button.disabled:
+            return False
+        button.click()
+    elif action == "reset":
+        find_button(at, RESET_LABELS[app]).click()
+    elif action == "name_reward":
+        at.text_input(key=f"reward_name_{reward_days_for(25)[0]}").input("好きなケーキを買う")
+    elif action in ("check_reward", "uncheck_reward"):
+        checkbox = at.checkbox(key=f"reward_check_{reward_days_for(25)[0]}")
+        if checkbox.disabled:
+            return False
+        checkbox.check() if action == "check_reward" else checkbox.uncheck()
+    return True
+
+
+def percentile(values, ratio):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(ratio * (len(ordered) - 1))))]
+
+
+def run_case(app, scenario, board_length, history_size, timeout):
+    """1つの組み合わせを新しい作業ディレクトリで実行し、集計を返す"""
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    with tempfile.TemporaryDirectory() as workdir:
+        cwd = os.getcwd()
+        os.chdir(workdir)  # DATA_FILE などは相対パスなので、毎回まっさらな場所で実行する
+        try:
+            at = AppTest.from_file(os.path.join(APP_DIR, app), default_timeout=timeout)
+            seed_session(at, app, board_length, history_size)
+            at.run()
+            if at.exception:
+                raise RuntimeError(at.exception[0].message)
+
+            times, elements, written = [], [], []
+            for action in SCENARIOS[scenario]:
+                if not perform(at, app, action):
+                    continue
+                before = read_storage(workdir)
+                start = time.perf_counter()
+                at.run()
+                times.append(time.perf_counter() - start)
+                if at.exception:
+                    raise RuntimeError(at.exception[0].message)
+                written.append(bytes_written(before, read_storage(workdir)))
+                elements.append(count_elements(at.main) + count_elements(at.sidebar))
+        finally:
+            os.chdir(cwd)
+
+    return {
+        "app": app,
+        "scenario": scenario,
+        "board_length": board_length,
+        "history_size": history_size,
+        "actions": len(times),
+        "p50_ms": percentile(times, 0.50) * 1000 if times else None,
+        "p95_ms": percentile(times, 0.95) * 1000 if times else None,
+        "mean_elements": statistics.mean(elements) if elements else None,
+        "bytes_written_per_action": statistics.mean(written) if written else None,
+    }
+
+
+def case_key(result):
+    return (result["app"], result["scenario"], result["board_length"], result["history_size"])
+
+
+def compare(results, baseline_path):
+    """前回の結果と p95 を比べて表示する"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {case_key(r): r for r in json.load(f)["results"]}
+    print(f"{'case':<70} {'p95 before':>11} {'p95 after':>10} {'ratio':>6}")
+    for result in results:
+        old = baseline.get(case_key(result))
+        if not old or not old["p95_ms"] or not result["p95_ms"]:
+            continue
+        name = "/".join(str(part) for part in case_key(result))
+        print(f"{name:<70} {old['p95_ms']:>11.1f} {result['p95_ms']:>10.1f} {result['p95_ms'] / old['p95_ms']:>6.2f}")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=APP_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="AppTest で操作1回あたりのコストを測る")
+    parser.add_argument("--output", default="bench_results.json", help="結果を書き出すJSONファイル")
+    parser.add_argument("--compare", help="比較する前回の結果JSON")
+    parser.add_argument("--apps", nargs="+", default=APPS, choices=APPS)
+    parser.add_argument("--scenarios", nargs="+", default=list(SCENARIOS), choices=list(SCENARIOS))
+    parser.add_argument("--board-lengths", nargs="+", type=int, default=BOARD_LENGTHS)
+    parser.add_argument("--history-sizes", nargs="+", type=int, default=HISTORY_SIZES)
+    parser.add_argument("--backend", default="journal", help="app09 の保存方式（SUGOROKU_STORAGE_BACKEND）")
+    parser.add_argument("--timeout", type=float, default=30, help="1回の実行のタイムアウト（秒）")
+    args = parser.parse_args(argv)
+
+    # 書き込んだバイト数を操作ごとに測れるよう、裏側の書き込みスレッドは使わずその場で保存する
+    os.environ["SUGOROKU_STORAGE_BACKEND"] = args.backend
+    os.environ["SUGOROKU_WRITE_BEHIND_INTERVAL"] = "0"
+    set_log_level("error")  # AppTest の警告で出力が埋もれないようにする
+
+    results = []
+    for app in args.apps:
+        for scenario in args.scenarios:
+            for board_length in args.board_lengths:
+                for history_size in args.history_sizes:
+                    if history_size >= board_length:
+                        continue
+                    result = run_case(app, scenario, board_length, history_size, args.timeout)
+                    results.append(result)
+                    print(f"{app} {scenario} len={board_length} hist={history_size}: "
+                          f"p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms "
+                          f"elements={result['mean_elements']:.0f} bytes={result['bytes_written_per_action']}",
+                          file=sys.stderr)
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            "python": platform.python_version(),
+            "streamlit": st.__version__,
+            "backend": args.backend,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=4)
+
+    if args.compare:
+        compare(results, args.compare)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+import os
+from collections import namedtuple
+from functools import lru_cache
+
+# --- すごろく盤のHTML描画 ---
+# 表示するマスを1つのHTMLブロックにまとめ、st.markdown 1回で描画する
+# マスごとのHTMLは盤面の長さごとに BoardConfig で1回だけ作り、描画のたびには選んでつなぐだけにする
+
+BOARD_LENGTH_OPTIONS = [25, 100, 365, 1000]  # 選べるチャレンジの日数
+LONG_BOARD_COLUMNS = 10  # 長い盤面で1行に並べるマスの数
+LONG_BOARD_PAGE_SIZE = 100  # 長い盤面で1ページに表示するマスの数
+# ご褒美マスの置き方: 最初の数日は EARLY_REWARD_DAYS、それ以降は REWARD_INTERVAL 日ごと（0 で置かない）、最後にゴール
+# アプリから reward_days_for に渡して変えられる。既定の間隔は環境変数でも切り替えられる
+EARLY_REWARD_DAYS = (3, 7, 14, 21)
+REWARD_INTERVAL = int(os.environ.get("SUGOROKU_REWARD_INTERVAL", "30"))
+
+# マスの装飾（従来の st.columns 版と同じスタイル）
+CURRENT_STYLE = "border: 2px solid #FF4B4B; background-color: #FFF0F0; border-radius: 8px; padding: 5px;"
+ACHIEVED_STYLE = "background-color: #D4EDDA; border-radius: 8px; padding: 5px;"
+REWARD_STYLE = "background-color: #FFF3CD; border-radius: 8px; padding: 5px;"
+
+
+def reward_days_for(board_length, reward_interval=None):
+    """盤面の長さからご褒美マスの一覧を決める（reward_interval 日ごとにも追加。省略時は REWARD_INTERVAL）
+
+    既定の30日ごとなら、25マスの盤面は従来通り 3 / 7 / 14 / 21 / 25 になる。
+    """
+    if reward_interval is None:
+        reward_interval = REWARD_INTERVAL
+    days = set(EARLY_REWARD_DAYS)
+    if reward_interval > 0:
+        days.update(range(reward_interval, board_length, reward_interval))
+    return sorted(day for day in days if day < board_length) + [board_length]
+
+
+def board_layout(board_length):
+    """盤面の (1行のマス数, 1ページのマス数) を返す。25マス以下は従来通り5列で全体を1ページに表示"""
+    if board_length <= 25:
+        return 5, board_length
+    return LONG_BOARD_COLUMNS, LONG_BOARD_PAGE_SIZE
+
+
+def page_count(board_length):
+    """盤面のページ数"""
+    _, page_size = board_layout(board_length)
+    return (board_length + page_size - 1) // page_size
+
+
+def page_of_day(day, board_length):
+    """そのマスを含むページ番号（0始まり）。ゴール後の日は最後のページ"""
+    _, page_size = board_layout(board_length)
+    day = min(max(day, 1), board_length)
+    return (day - 1) // page_size
+
+
+def cell_mark(num, current_day, is_achieved, reward_days, goal_day):
+    """マスのアイコンを決定する"""
+    is_reward = (num in reward_days)
+    is_goal = (num == goal_day)
+
+    if num == current_day:
+        # 現在位置
+        return "⭐"
+    if is_goal and is_achieved:
+        # ゴール達成済み
+        return "👑"
+    if is_reward and is_achieved:
+        # ご褒美マス達成済み
+        return "🎁"
+    if is_achieved:
+        # 過去の達成マス
+        return "✅"
+    if is_reward:
+        # ご褒美マス
+        return "🌼"
+    if is_goal:
+        # ゴールマス
+        return "🌟"
+    # 通常マス
+    return "⚪"
+
+
+def cell_style(num, current_day, is_achieved, reward_days):
+    """マスの装飾を決定する（現在位置のマスは少し目立つように装飾）"""
+    if num == current_day:
+        return CURRENT_STYLE
+    if is_achieved:
+        return ACHIEVED_STYLE
+    if num in reward_days:
+        return REWARD_STYLE
+    return ""
+
+
+class BoardConfig(namedtuple("BoardConfig", ["board_length", "reward_days", "reward_set", "columns", "page_size",
+                                             "pages", "cell_html"])):
+    """盤面の長さごとに決まる変わらない設定と、マスごとの表（作った後は書き換えず、全セッションで共有する）
+
+    reward_days はご褒美マスの昇順タプル、reward_set はマスの判定に使う frozenset。
+    cell_html[日] は (通常, 達成済み, 現在地) の3通りのマスのHTML（0番目は使わない）。
+    """
+
+    __slots__ = ()
+
+    @classmethod
+    def build(cls, board_length, reward_days=None):
+        """盤面の長さから設定を作る（マスのアイコンと装飾はここで1回だけ決める）"""
+        reward_days = tuple(reward_days_for(board_length) if reward_days is None else reward_days)
+        reward_set = frozenset(reward_days)
+        columns, page_size = board_layout(board_length)
+        cell_html = [None]
+        for num in range(1, board_length + 1):
+            cell_html.append(tuple(
+                _cell_html(num, cell_mark(num, current_day, is_achieved, reward_set, board_length),
+                           cell_style(num, current_day, is_achieved, reward_set))
+                for current_day, is_achieved in ((0, False), (0, True), (num, False))
+            ))
+        return cls(board_length, reward_days, reward_set, columns, page_size, page_count(board_length),
+                   tuple(cell_html))
+
+    def render(self, current_day, history, page=None):
+        """history（{日数: "達成" / "未達成"}）から、指定ページ（省略時は現在地のページ）の盤面HTMLを作る
+
+        マスのHTMLは表から選んでつなぐだけなので、盤面が変わるたびに作り直しても文字列の連結1回で済む。
+        """
+        if page is None:
+            page = page_of_day(current_day, self.board_length)
+        start = page * self.page_size + 1
+        end = min(start + self.page_size - 1, self.board_length)
+        cell_html = self.cell_html
+        cells = "".join(
+            cell_html[num][2 if num == current_day else 1 if history.get(num) == "達成" else 0]
+            for num in range(start, end + 1)
+        )
+        return f"<div style='display:grid; grid-template-columns:repeat({self.columns}, 1fr); gap:1rem;'>{cells}</div>"
+
+
+@lru_cache(maxsize=16)
+def board_config(board_length, reward_days=None):
+    """盤面の長さ（とご褒美マス）ごとの設定を1回だけ作って使い回す"""
+    return BoardConfig.build(board_length, reward_days)
+
+
+def render_board_html(current_day, history, reward_days, goal_day, page=None):
+    """history（{日数: "達成" / "未達成"}）から、指定ページ（省略時は現在地のページ）の盤面HTMLを作る"""
+    return board_config(goal_day, tuple(reward_days)).render(current_day, history, page)
+
+
+def _cell_html(num, mark, style):
+    return (
+        f"<div style='text-align:center; {style}'>"
+        f"<span style='font-size:30px;'>{mark}</span><br>"
+        f"<small style='font-size:14px; font-weight:bold;'>{num}</small>"
+        f"</div>"
+    )
@@ -0,0 +1,200 @@
+"""チャレンジの一括エクスポート / インポート（JSONL形式、1行1チャレンジ）
+
+    python challenge_io.py export --backend sqlite --output challenges.jsonl
+    python challenge_io.py import --backend sqlite --input challenges.jsonl
+
+1行の形式:
+    {"user_id": "alice", "challenge_id": "default", "theme": "...", "board_length": 25, "current_day": 4,
+     "consecutive_success": 3, "history": {"1": "達成", ...}, "rewards": {"3": {"name": "...", "checked": false}},
+     "calendar": "2026-10-01|b64:..."}
+history の状態は "達成" / "未達成" と、未達成のあとに同じマスを達成した "再挑戦で達成"。
+calendar（日付ごとの記録）は省略できる。challenge_id は英数字・"_"・"-" の64文字まで（省略すると "default"）。
+
+入力は1行ずつ読み、batch-size 件ごとにまとめて保存するので、件数が多くてもメモリ使用量は一定。
+足りない項目の補完やキーの変換は app09 の初期化と同じ engine.normalize_challenge で行い、
+consecutive_success は保存された値ではなく履歴から決め直す。形式が正しくない行は読み飛ばして報告する。
+"file" / "journal" はチャレンジごとのファイルに保存するがユーザーを区別しないため、複数ユーザーのインポートには
+"sqlite" を使う。
+"""
+import argparse
+import base64
+import binascii
+import datetime
+import json
+import sys
+from contextlib import nullcontext
+
+import engine
+from history_bits import ACHIEVED, ENCODED_PREFIX, FAILED, RETRIED
+from snapshot import FORMATS
+from storage import CHALLENGE_ID_PATTERN, DEFAULT_CHALLENGE_ID, create_storage
+
+# app09_can_be_saved.py と同じ保存先の既定値
+DATA_FILE = "sugoroku_data.json"
+JOURNAL_FILE = "sugoroku_data.journal"
+SQLITE_FILE = "sugoroku_data.db"
+DEFAULT_BOARD_LENGTH = 25
+
+
+def validate_record(record):
+    """1行分の形式を確認する。正しくなければ理由を付けて ValueError"""
+    if not isinstance(record, dict):
+        raise ValueError("1行は1つのJSONオブジェクトにしてください")
+    if not isinstance(record.get("user_id"), str) or not record["user_id"]:
+        raise ValueError("user_id（文字列）がありません")
+    challenge_id = record.get("challenge_id", DEFAULT_CHALLENGE_ID)
+    if not isinstance(challenge_id, str) or not CHALLENGE_ID_PATTERN.fullmatch(challenge_id):
+        raise ValueError("challenge_id は英数字・_・- の64文字までの文字列にしてください")
+    for field in ("current_day", "board_length"):
+        value = record.get(field, 1)
+        if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+            raise ValueError(f"{field} は1以上の整数にしてください")
+    for field in ("theme", "calendar"):
+        if not isinstance(record.get(field, ""), str):
+            raise ValueError(f"{field} は文字列にしてください")
+
+    history = record.get("history", {})
+    if isinstance(history, dict):
+        for day, status in history.items():
+            if not str(day).isdigit() or int(day) < 1:
+                raise ValueError(f"history の日数が正しくありません: {day}")
+            if status not in (ACHIEVED, FAILED, RETRIED):
+                raise ValueError(f"history の状態が正しくありません: {status}")
+    elif isinstance(history, str):  # ビット列の形式（"b64:..."）も受け付ける
+        _check_encoded(history, "history")
+    else:
+        raise ValueError("history はオブジェクトにしてください")
+
+    calendar = record.get("calendar", "")
+    if calendar:
+        start, _, log = calendar.partition("|")
+        try:
+            datetime.date.fromisoformat(start)
+        except ValueError:
+            raise ValueError(f"calendar の開始日が正しくありません: {start}") from None
+        _check_encoded(log, "calendar")
+
+    rewards = record.get("rewards", {})
+    if not isinstance(rewards, dict):
+        raise ValueError("rewards はオブジェクトにしてください")
+    for day, reward in rewards.items():
+        if (not isinstance(reward, dict) or not isinstance(reward.get("name"), str)
+                or not isinstance(reward.get("checked"), bool)):
+            raise ValueError(f"rewards の Day {day} は {{\"name\": 文字列, \"checked\": 真偽値}} にしてください")
+
+
+def _check_encoded(text, field):
+    """ビット列の形式（"b64:..."）として読めるか確かめる。読めなければ ValueError"""
+    if not text.startswith(ENCODED_PREFIX):
+        raise ValueError(f"{field} のビット列は \"{ENCODED_PREFIX}\" で始めてください")
+    try:
+        base64.b64decode(text[len(ENCODED_PREFIX):], validate=True)
+    except binascii.Error:
+        raise ValueError(f"{field} のビット列を読み取れません") from None
+
+
+def to_state(record):
+    """インポートする1行を、保存先に渡す状態に変換する"""
+    challenge = engine.normalize_challenge(record, DEFAULT_BOARD_LENGTH)
+    # ゴールを過ぎた位置は、app09 で日数を変えたときと同じくゴール直後に合わせる
+    current_day = min(challenge["current_day"], challenge["board_length"] + 1)
+    return {
+        "current_day": current_day,
+        "theme": challenge["theme"],
+        "board_length": challenge["board_length"],
+        "history": challenge["history"],
+        "rewards": challenge["rewards"],
+        "consecutive_success": challenge["consecutive_success"],
+        "calendar": challenge["calendar"].encode(),
+    }
+
+
+def to_record(user_id, challenge_id, state):
+    """保存されている状態を、エクスポートする1行に変換する"""
+    challenge = engine.normalize_challenge(state, DEFAULT_BOARD_LENGTH)
+    return {
+        "user_id": user_id,
+        "challenge_id": challenge_id,
+        "theme": challenge["theme"],
+        "board_length": challenge["board_length"],
+        "current_day": challenge["current_day"],
+        "consecutive_success": challenge["consecutive_success"],
+        "history": challenge["history"].to_dict(),
+        "rewards": {str(day): reward for day, reward in challenge["rewards"].items()},
+        "calendar": challenge["calendar"].encode(),
+    }
+
+
+def export_challenges(storage, out):
+    """保存されているチャレンジを1行ずつ書き出し、件数を返す"""
+    count = 0
+    for user_id, challenge_id, state in storage.iter_challenges():
+        out.write(json.dumps(to_record(user_id, challenge_id, state), ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def import_challenges(storage, lines, batch_size=1000, errors=sys.stderr):
+    """JSONL を1行ずつ読み、batch_size 件ごとに保存する。(保存した件数, 読み飛ばした件数) を返す"""
+    imported = skipped = 0
+    batch = []
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+            validate_record(record)
+            # 変換で見つかった問題も、その行だけを読み飛ばす（溜めている分の保存を止めない）
+            state = to_state(record)
+        except ValueError as e:  # json.JSONDecodeError も ValueError の一種
+            print(f"{line_number}行目: {e}", file=errors)
+            skipped += 1
+            continue
+        batch.append((record["user_id"], record.get("challenge_id", DEFAULT_CHALLENGE_ID), state))
+        if len(batch) >= batch_size:
+            storage.save_many(batch)
+            imported += len(batch)
+            batch = []
+    if batch:
+        storage.save_many(batch)
+        imported += len(batch)
+    return imported, skipped
+
+
+def _open(path, mode):
+    """"-" は標準入出力として扱う"""
+    if path == "-":
+        return nullcontext(sys.stdout if "w" in mode else sys.stdin)
+    return open(path, mode, encoding="utf-8")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="チャレンジを JSONL で一括エクスポート / インポートする")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("--backend", default="sqlite", choices=["file", "journal", "sqlite"])
+    parser.add_argument("--data-file", default=DATA_FILE)
+    parser.add_argument("--journal-file", default=JOURNAL_FILE)
+    parser.add_argument("--sqlite-file", default=SQLITE_FILE)
+    parser.add_argument("--snapshot-format", default=FORMATS[0], choices=FORMATS,
+                        help="file / journal でインポートするときの保存ファイルの形式")
+    parser.add_argument("--input", default="-", help="インポートする JSONL（- は標準入力）")
+    parser.add_argument("--output", default="-", help="エクスポート先の JSONL（- は標準出力）")
+    parser.add_argument("--batch-size", type=int, default=1000, help="1回のトランザクションで保存する件数")
+    args = parser.parse_args(argv)
+
+    storage = create_storage(args.backend, data_file=args.data_file, journal_file=args.journal_file,
+                             sqlite_file=args.sqlite_file, snapshot_format=args.snapshot_format)
+    if args.command == "export":
+        with _open(args.output, "w") as out:
+            count = export_challenges(storage, out)
+        print(f"{count} 件をエクスポートしました", file=sys.stderr)
+        return 0
+
+    with _open(args.input, "r") as lines:
+        imported, skipped = import_challenges(storage, lines, batch_size=args.batch_size)
+    print(f"{imported} 件をインポートしました（読み飛ばし {skipped} 件）", file=sys.stderr)
+    return 1 if skipped else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,133 @@
+import time
+
+from history_bits import ACHIEVED, FAILED, RETRIED, HistoryBits, decode_history
+
+# --- 複数の端末で編集できるチャレンジ（CRDT） ---
+# 履歴は1日ごと、ご褒美は1日の name / checked ごと、テーマと盤面の長さはそれぞれ1つの値として、
+# 「値 + タイムスタンプ」の組で持つ。同じ項目は新しいタイムスタンプの値が勝つ（Last-Writer-Wins）。
+# タイムスタンプは (ミリ秒, カウンタ, 端末ID) で、端末IDまで比べるので勝ち負けは必ず1通りに決まる。
+# 取り消し・やり直しの操作（undo.UndoStack）は環状バッファの位置ごとに1つの値として持つ。
+# 履歴・ご褒美などを丸ごと置き換える変更（リセットなど）は "reset/history" / "reset/rewards" の値として記録し、
+# それより古い項目は無視する（消した項目を1つずつ記録し直さない）。履歴の値が None の日は未記録として扱う。
+# current_day と consecutive_success は保存せず、まとめた履歴から決める（未達成のあとに達成した日は RETRIED の値で残すので、
+# 連続達成日数もボタン操作どおりに数え直せる）。
+HISTORY_PREFIX = "history/"
+REWARD_PREFIX = "rewards/"
+UNDO_PREFIX = "undo/"
+RESET_PREFIX = "reset/"
+RESETTABLE_FIELDS = ("history", "rewards", "undo")  # 日数・位置ごとの項目に分けて持つフィールド
+# 1つの値として持つフィールド
+REGISTER_FIELDS = ("theme", "board_length", "calendar", "undo_bottom", "undo_position", "undo_top")
+REWARD_FIELDS = ("name", "checked")
+
+
+class HybridClock:
+    """時計が戻ったり端末間でずれたりしても、この端末が付けるタイムスタンプが必ず増えていく時計"""
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self._ms = 0
+        self._counter = 0
+
+    def now(self):
+        """新しいタイムスタンプ [ミリ秒, カウンタ, 端末ID] を返す"""
+        wall = int(time.time() * 1000)
+        if wall > self._ms:
+            self._ms, self._counter = wall, 0
+        else:
+            self._counter += 1
+        return [self._ms, self._counter, self.device_id]
+
+    def observe(self, stamp):
+        """他の端末のタイムスタンプを見たら、以降はそれより新しい値を付ける"""
+        if (stamp[0], stamp[1]) > (self._ms, self._counter):
+            self._ms, self._counter = stamp[0], stamp[1]
+
+
+class ChallengeReplica:
+    """1つのチャレンジの、端末ごとの複製。操作（キー, 値, タイムスタンプ）をまとめて状態を作る"""
+
+    def __init__(self):
+        self.entries = {}  # キー -> (値, タイムスタンプ)
+
+    def apply(self, ops):
+        """操作を取り込む。同じ操作を何度・どの順で取り込んでも結果は同じ"""
+        for key, value, stamp in ops:
+            stamp = list(stamp)
+            current = self.entries.get(key)
+            if current is None or stamp > current[1]:
+                self.entries[key] = (value, stamp)
+
+    def ops_from_changes(self, changes, clock):
+        """アプリの変更レコード（journal.apply_changes の形式）を、値が変わった項目の操作にする"""
+        fields = changes.get("set", {})
+        ops = []
+
+        def put(key, value):
+            if self._value(key) != value:
+                ops.append((key, value, clock.now()))
+
+        for field in RESETTABLE_FIELDS:
+            if field in fields:
+                # 丸ごと置き換え: それまでの項目をまとめて無効にしてから、新しい項目を記録する
+                reset = (f"{RESET_PREFIX}{field}", True, clock.now())
+                self.apply([reset])  # 以降の比較は置き換え後の状態で行う
+                ops.append(reset)
+        for field in REGISTER_FIELDS:
+            if field in fields:
+                put(field, fields[field])
+        history = {**decode_history(fields.get("history", {})).to_dict(), **changes.get("history", {})}
+        for day, status in history.items():
+            key = f"{HISTORY_PREFIX}{int(day)}"
+            if status == ACHIEVED and self._value(key) in (FAILED, RETRIED):
+                # 未達成の日を達成で上書きするときは、未達成だったことを値に含める（まとめたあとの集計に要る）
+                status = RETRIED
+            put(key, status)
+        rewards = {**fields.get("rewards", {}), **changes.get("rewards", {})}
+        for day, reward in rewards.items():
+            for name in REWARD_FIELDS:
+                put(f"{REWARD_PREFIX}{int(day)}/{name}", reward[name])
+        for slot, step in {**fields.get("undo", {}), **changes.get("undo", {})}.items():
+            put(f"{UNDO_PREFIX}{int(slot)}", step)
+        return ops
+
+    def to_state(self):
+        """まとめた状態をアプリの保存形式（JSON形式の辞書）で返す"""
+        state = {}
+        for field in REGISTER_FIELDS:
+            if field in self.entries:
+                state[field] = self.entries[field][0]
+
+        history = HistoryBits()
+        rewards = {}
+        undo = {}
+        for key in self.entries:
+            value = self._value(key)  # 置き換えより前の記録は None
+            if value is None:
+                continue
+            if key.startswith(HISTORY_PREFIX):
+                history[int(key[len(HISTORY_PREFIX):])] = value
+            elif key.startswith(REWARD_PREFIX):
+                day, name = key[len(REWARD_PREFIX):].split("/")
+                rewards.setdefault(day, {"name": "", "checked": False})[name] = value
+            elif key.startswith(UNDO_PREFIX):
+                undo[key[len(UNDO_PREFIX):]] = value
+
+        # 現在のマスは「最後に達成した日の次の日」（未達成はマスを進めない）。ゴールの次の日で止まる
+        achieved = [day for day, status in history.items() if status == ACHIEVED]
+        current_day = max(achieved) + 1 if achieved else 1
+        if "board_length" in state:
+            current_day = min(current_day, state["board_length"] + 1)
+        state.update({"current_day": current_day, "history": history, "rewards": rewards, "undo": undo})
+        return state
+
+    def _value(self, key):
+        """現在の値（置き換えより前の履歴・ご褒美は無いものとして扱う）"""
+        entry = self.entries.get(key)
+        if entry is None:
+            return None
+        field = key.split("/", 1)[0]
+        reset = self.entries.get(f"{RESET_PREFIX}{field}")
+        if reset is not None and field in RESETTABLE_FIELDS and entry[1] < reset[1]:
+            return None
+        return entry[0]
@@ -0,0 +1,92 @@
+import datetime
+
+from history_bits import ACHIEVED, FAILED, HistoryBits, decode_history
+
+# --- 日付ごとの記録 ---
+# マス（history）とは別に、カレンダーの日付ごとに「その日は達成 / 未達成」を記録する。
+# 記録のなかった日は読み込み時や次の記録時に 未達成 でまとめて埋めるので、記録は開始日から途切れずに続く。
+# そのため日付から位置は引き算で決まり、期間の集計は累積和の差で求まる（二分探索も要らない）。
+# 保存時は "開始日|ビット列" の1つの文字列にする。
+
+
+class DateIndex:
+    """開始日から連続した、日付ごとの 達成 / 未達成 の記録"""
+
+    __slots__ = ("start", "log", "_achieved")
+
+    def __init__(self, start=None, log=None):
+        self.start = start  # 最初に記録した日（まだ記録がなければ None）
+        self.log = log if log is not None else HistoryBits()  # 開始日を1日目とした日ごとの状態
+        self._achieved = [0]  # 累積和: _achieved[i] は最初の i 日のうち達成した日数
+        for _, status in self.log.items():
+            self._achieved.append(self._achieved[-1] + (status == ACHIEVED))
+
+    def __len__(self):
+        return len(self._achieved) - 1
+
+    @property
+    def last_date(self):
+        """最後に記録した日（記録がなければ None）"""
+        if not len(self):
+            return None
+        return self.start + datetime.timedelta(days=len(self) - 1)
+
+    def fill_missed(self, today):
+        """最後の記録の翌日から today の前日までを 未達成 で埋め、埋めた日数を返す"""
+        if not len(self):
+            return 0
+        missed = (today - self.last_date).days - 1
+        if missed <= 0:
+            return 0
+        first = len(self) + 1
+        for position in range(first, first + missed):
+            self.log[position] = FAILED
+        self._achieved.extend([self._achieved[-1]] * missed)  # 未達成なので累積和は増えない
+        return missed
+
+    def record(self, date, status):
+        """その日の状態を記録する（同じ日の記録は上書き。過去の日付は ValueError）"""
+        if self.start is None:
+            self.start = date
+        self.fill_missed(date)
+        position = self._position(date)
+        if position < len(self):
+            raise ValueError(f"過去の日付には記録できません: {date}")
+        if position == len(self):
+            # 今日の記録の上書き: 最後の累積和だけを直す
+            self._achieved[-1] -= (self.log[position] == ACHIEVED)
+        else:
+            self._achieved.append(self._achieved[-1])
+        self.log[position] = status
+        self._achieved[-1] += (status == ACHIEVED)
+
+    def counts(self, start, end):
+        """start から end まで（両端を含む）の (達成した日数, 未達成の日数) を O(1) で返す"""
+        if self.start is None:
+            return 0, 0
+        first = max(self._position(start), 1)
+        last = min(self._position(end), len(self))
+        if first > last:
+            return 0, 0
+        achieved = self._achieved[last] - self._achieved[first - 1]
+        return achieved, (last - first + 1) - achieved
+
+    def encode(self):
+        """保存用の文字列 "開始日|ビット列" にする（記録がなければ空文字列）"""
+        if self.start is None:
+            return ""
+        return f"{self.start.isoformat()}|{self.log.encode()}"
+
+    @classmethod
+    def decode(cls, text):
+        """encode() で作った文字列から復元する（空や不正な値なら記録なし）"""
+        start, _, log = (text or "").partition("|")
+        try:
+            start = datetime.date.fromisoformat(start)
+        except ValueError:
+            return cls()
+        return cls(start, decode_history(log))
+
+    def _position(self, date):
+        """開始日を1とした位置"""
+        return (date - self.start).days + 1
@@ -0,0 +1,160 @@
+from collections import namedtuple
+
+from board import reward_days_for
+from date_index import DateIndex
+from history_bits import ACHIEVED, FAILED, HistoryBits, decode_history
+from stats import ChallengeStats
+from undo import UndoStack
+
+# --- ゲームのルール（Streamlitに依存しない） ---
+# state には st.session_state か ChallengeState を渡す（属性として読み書きできれば何でもよい）。
+# 画面への表示（st.toast など）は呼び出し側が行い、ここでは表示する内容だけを返す。
+Toast = namedtuple("Toast", ["text", "icon"])
+
+DEFAULT_THEME = "読書を25日継続する！"
+
+
+class ChallengeState:
+    """画面を使わずにルールを動かすときのチャレンジの状態"""
+
+    __slots__ = ("current_day", "history", "stats", "rewards", "consecutive_success", "theme",
+                 "animation_type", "reward_checked_animation")
+
+    def __init__(self, reward_days, theme=DEFAULT_THEME):
+        self.theme = theme
+        reset(self, reward_days)
+
+
+class SessionChallenge(ChallengeState):
+    """app09 の1セッション分のチャレンジの状態（st.session_state には項目を並べず、この1つだけを置く）"""
+
+    __slots__ = ("board_length", "calendar", "undo", "text_edits", "text_edited_at")
+
+    @classmethod
+    def from_saved(cls, data, default_board_length, reward_interval=None):
+        """保存データ（JSON形式の辞書）から作る。足りない項目は normalize_challenge で補う"""
+        state = cls.__new__(cls)
+        state.load(data, default_board_length, reward_interval)
+        # アニメーションフラグ（読み込んだ直後はアニメーション不要）
+        state.animation_type = None
+        state.reward_checked_animation = False
+        state.text_edits = {}  # まだ保存していない入力欄の変更（"theme" または日数 -> 値）
+        state.text_edited_at = 0.0
+        return state
+
+    def load(self, data, default_board_length, reward_interval=None):
+        """保存データの内容で置き換える（アニメーションや入力欄の記録はそのまま）"""
+        for name, value in normalize_challenge(data, default_board_length, reward_interval).items():
+            setattr(self, name, value)
+
+
+def new_rewards(reward_days):
+    """ご褒美リスト: {日数: {name: "ご褒美名", checked: False}}"""
+    return {day: {"name": "", "checked": False} for day in reward_days}
+
+
+def normalize_challenge(data, default_board_length, reward_interval=None):
+    """保存されたデータ（JSON形式の辞書）から、足りない項目を補いキーの型を揃えた状態を作る
+
+    history は HistoryBits、rewards のキーは整数になる。consecutive_success は保存された値ではなく
+    履歴の集計から決める。ご褒美マスは reward_interval（board.reward_days_for と同じ）で決める。
+    """
+    board_length = data.get("board_length", default_board_length)
+
+    # ビット列（1日2ビット）で保持する。従来の {"日数": 状態} 形式の保存ファイルもそのまま読み込める
+    history = decode_history(data.get("history", {}))
+
+    # 累計・連続達成日数の集計を履歴から1回で作る（以降は記録のたびに差分で更新）
+    stats = ChallengeStats.from_history(history)
+
+    # ご褒美データ（初期構造を保証し、新しいご褒美マスが増えた場合などに備えてマージする）
+    rewards = new_rewards(reward_days_for(board_length, reward_interval))
+    loaded_rewards = data.get("rewards", {})
+    for day in rewards:
+        # JSONのキーは文字列なので、文字列キーでアクセスを試みる
+        key = str(day)
+        if key in loaded_rewards:
+            rewards[day] = loaded_rewards[key]
+        elif day in loaded_rewards:  # 念のため整数キーもチェック
+            rewards[day] = loaded_rewards[day]
+
+    return {
+        "current_day": data.get("current_day", 1),
+        "theme": data.get("theme", DEFAULT_THEME),
+        "board_length": board_length,
+        "history": history,
+        "stats": stats,
+        "consecutive_success": stats.current_streak,
+        "rewards": rewards,
+        "calendar": DateIndex.decode(data.get("calendar")),  # 日付ごとの記録（"開始日|ビット列"）
+        "undo": UndoStack.from_state(data),  # 取り消し・やり直しのできる操作
+    }
+
+
+def reset(state, reward_days):
+    """ゲームの状態を初期値にリセットする (テーマは除く)"""
+    state.current_day = 1
+    state.history = HistoryBits()
+    state.stats = ChallengeStats()
+    state.rewards = new_rewards(reward_days)
+    state.consecutive_success = 0
+    state.animation_type = None
+    state.reward_checked_animation = False
+    return Toast("チャレンジをリセットしました！", "🗑️")
+
+
+def is_goal_achieved(state, goal_day):
+    """ゴール達成後か（current_day > goal_day ならボタンを無効化する）"""
+    return state.current_day > goal_day
+
+
+def record_success(state, goal_day, reward_days):
+    """達成を記録して次のマスへ進む。ゴール後は何もせず None を返す"""
+    if state.current_day > goal_day:
+        return None
+
+    day_achieved = state.current_day  # 達成したマス番号
+
+    # 現在のマスを達成済みとして記録 (キーはint)。集計も同時に更新する
+    state.stats.record(state.history, day_achieved, ACHIEVED)
+
+    # 連続達成日数は履歴の集計から決める（途中の日を書き換えても正しくなる）
+    state.consecutive_success = state.stats.current_streak
+
+    # アニメーションフラグの設定とトーストメッセージ
+    if day_achieved == goal_day:
+        # ゴール達成 (風船+雪の最大演出)
+        state.animation_type = "goal_celebration"
+        toast = Toast(f"👑 GOAL達成！おめでとうございます！{goal_day}日間継続できました！", "🎊")
+    elif day_achieved in reward_days:
+        # ご褒美マス達成 (風船のみ)
+        state.animation_type = "balloons"
+        toast = Toast("🎁 ご褒美マス達成！おめでとうございます！", "✨")
+    elif state.consecutive_success > 0 and state.consecutive_success % 3 == 0:  # 連続達成日数が0でないことを確認
+        # 連続達成メッセージ
+        toast = Toast(f"🎉 3日連続達成！偉い！ {state.consecutive_success}日連続記録更新中！", "🥳")
+    else:
+        toast = Toast("達成を記録しました！次の日も頑張りましょう！", "💪")
+
+    # 次のマスへ進む (ゴール達成時はゴールの次に進み、ボタンを無効化する)
+    state.current_day += 1
+    return toast
+
+
+def record_failure(state, goal_day):
+    """未達成を記録する（マスは進まない）。ゴール後は何もせず None を返す"""
+    if state.current_day > goal_day:  # ゴール後は未達成も記録しない
+        return None
+
+    state.stats.record(state.history, state.current_day, FAILED)
+    state.consecutive_success = 0  # 連続達成日数をリセット
+    return Toast("未達成を記録しました。また明日から気持ちを切り替えて！", "😭")
+
+
+def set_reward_checked(state, day, is_checked):
+    """ご褒美のチェック状態を反映する"""
+    state.rewards[day]["checked"] = is_checked
+
+    # チェックが入ったら（ご褒美をGETしたら）アニメーションフラグを立てる
+    if is_checked:
+        state.reward_checked_animation = True
@@ -0,0 +1,195 @@
+import base64
+from collections.abc import ItemsView, MutableMapping
+
+# --- 履歴のビット列表現 ---
+# 1日あたり2ビット（0: 未記録 / 1: 達成 / 2: 未達成 / 3: 未達成のあとに達成）で、1バイトに4日分を詰める。
+# {日数: "達成" / "未達成"} の辞書と同じように使える。
+# 未達成のマスはそのまま（マスを進めずに）次の日の達成で上書きされるが、その日に未達成だったことは集計に要るため、
+# 3 として残す。読むときは 達成 として返し、保存用（stored / to_dict）だけ RETRIED として区別する。
+ACHIEVED = "達成"
+FAILED = "未達成"
+RETRIED = "再挑戦で達成"
+_CODES = {ACHIEVED: 1, FAILED: 2, RETRIED: 3}
+_STATUSES = {1: ACHIEVED, 2: FAILED, 3: ACHIEVED}
+_STORED_STATUSES = {1: ACHIEVED, 2: FAILED, 3: RETRIED}
+ENCODED_PREFIX = "b64:"  # 保存ファイル上でビット列の履歴であることを示す接頭辞
+# 1バイト（4日分）の値 -> そのうち記録のある日数（bytes.translate で全体をまとめて数えるのに使う）
+_RECORDED_COUNT = bytes(sum(1 for shift in range(4) if (value >> (shift * 2)) & 0b11) for value in range(256))
+
+
+class HistoryBits(MutableMapping):
+    """日数（1始まりの整数）→ "達成" / "未達成" をビット列で保持する辞書"""
+
+    __slots__ = ("_bits", "_count")
+
+    def __init__(self, data=b""):
+        self._bits = bytearray(data)
+        self._count = sum(self._bits.translate(_RECORDED_COUNT))
+
+    def __getitem__(self, day):
+        code = self._code(self._index(day))
+        if code == 0:
+            raise KeyError(day)
+        return _STATUSES[code]
+
+    def __setitem__(self, day, status):
+        index = self._index(day)
+        if status not in _CODES:
+            raise ValueError(f"履歴の状態は {ACHIEVED} / {FAILED} / {RETRIED} のどれかです: {status}")
+        byte, shift = divmod(index, 4)
+        if byte >= len(self._bits):
+            self._bits.extend(bytes(byte + 1 - len(self._bits)))
+        previous = self._code(index)
+        if previous == 0:
+            self._count += 1
+        code = _CODES[status]
+        if code == _CODES[ACHIEVED] and previous in (_CODES[FAILED], _CODES[RETRIED]):
+            code = _CODES[RETRIED]  # 未達成のマスを達成で上書きしても、未達成だったことは残す
+        self._bits[byte] = (self._bits[byte] & ~(0b11 << (shift * 2))) | (code << (shift * 2))
+
+    def __delitem__(self, day):
+        index = self._index(day)
+        if self._code(index) == 0:
+            raise KeyError(day)
+        byte, shift = divmod(index, 4)
+        self._bits[byte] &= ~(0b11 << (shift * 2))
+        self._count -= 1
+
+    def __iter__(self):
+        return self._recorded_days()
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, day):
+        try:
+            return self._code(self._index(day)) != 0
+        except KeyError:
+            return False
+
+    def items(self):
+        """(日数, 状態) を日付順に返す（1日ずつ __getitem__ を呼ばず、ビット列を直接たどる）"""
+        return _HistoryItems(self)
+
+    def stored(self, day):
+        """保存用の状態（未達成のあとに達成した日は RETRIED）。記録がなければ None"""
+        try:
+            code = self._code(self._index(day))
+        except KeyError:
+            return None
+        return _STORED_STATUSES.get(code)
+
+    def stored_items(self):
+        """(日数, 保存用の状態) を日付順に返す"""
+        for day, code in self._recorded_codes():
+            yield day, _STORED_STATUSES[code]
+
+    def __repr__(self):
+        return f"HistoryBits({dict(self.items())!r})"
+
+    def copy(self):
+        """ビット列を複製する（記録のある日数は数え直さない）"""
+        clone = HistoryBits.__new__(HistoryBits)
+        clone._bits = bytearray(self._bits)
+        clone._count = self._count
+        return clone
+
+    def to_bytes(self):
+        """ビット列そのもの（末尾の未記録の日は省く）"""
+        return bytes(self._bits.rstrip(b"\0"))
+
+    def encode(self):
+        """保存用の文字列（接頭辞 + base64）に変換する"""
+        return ENCODED_PREFIX + base64.b64encode(self.to_bytes()).decode("ascii")
+
+    @classmethod
+    def decode(cls, text):
+        """encode() で作った文字列から復元する"""
+        return cls(base64.b64decode(text[len(ENCODED_PREFIX):]))
+
+    @classmethod
+    def from_dict(cls, history):
+        """従来の辞書形式（キーは文字列でも整数でもよい）から作る。変換できないキーや状態は読み飛ばす"""
+        codes = {}
+        for key, status in history.items():
+            try:
+                day = int(key)
+                code = _CODES[status]
+            except (KeyError, ValueError, TypeError):
+                # 整数に変換できないキーや、予期せぬ状態はスキップ
+                continue
+            if day >= 1:
+                codes[day] = code
+
+        # 1日ずつ __setitem__ で伸ばさず、必要な長さを先に確保してまとめて詰める
+        data = bytearray((max(codes) + 3) // 4 if codes else 0)
+        for day, code in codes.items():
+            byte, shift = divmod(day - 1, 4)
+            data[byte] |= code << (shift * 2)
+        bits = cls.__new__(cls)
+        bits._bits = data
+        bits._count = len(codes)
+        return bits
+
+    def to_dict(self):
+        """従来の辞書形式（キーは文字列。未達成のあとに達成した日は RETRIED）に変換する"""
+        return {str(day): status for day, status in self.stored_items()}
+
+    def _index(self, day):
+        try:
+            index = int(day) - 1  # JSONから来た文字列キーもそのまま使えるようにする
+        except (TypeError, ValueError):
+            raise KeyError(day) from None
+        if index < 0:
+            raise KeyError(day)
+        return index
+
+    def _code(self, index):
+        byte, shift = divmod(index, 4)
+        if byte >= len(self._bits):
+            return 0
+        return (self._bits[byte] >> (shift * 2)) & 0b11
+
+    def _recorded_days(self):
+        for byte_index, value in enumerate(self._bits):
+            if value == 0:
+                continue  # 4日分まとめて未記録
+            for shift in range(4):
+                if (value >> (shift * 2)) & 0b11:
+                    yield byte_index * 4 + shift + 1
+
+    def _recorded_items(self):
+        for day, code in self._recorded_codes():
+            yield day, _STATUSES[code]
+
+    def _recorded_codes(self):
+        for byte_index, value in enumerate(self._bits):
+            if value == 0:
+                continue
+            for shift in range(4):
+                code = (value >> (shift * 2)) & 0b11
+                if code:
+                    yield byte_index * 4 + shift + 1, code
+
+
+class _HistoryItems(ItemsView):
+    def __iter__(self):
+        return self._mapping._recorded_items()
+
+
+def decode_history(value):
+    """保存ファイルの history（ビット列の文字列、または従来の辞書）を HistoryBits にする"""
+    if isinstance(value, HistoryBits):
+        return value
+    if isinstance(value, str) and value.startswith(ENCODED_PREFIX):
+        return HistoryBits.decode(value)
+    if isinstance(value, dict):
+        return HistoryBits.from_dict(value)
+    return HistoryBits()
+
+
+def json_default(obj):
+    """json.dump の default 用: HistoryBits を保存用の文字列にする"""
+    if isinstance(obj, HistoryBits):
+        return obj.encode()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,196 @@
+import json
+import os
+
+from history_bits import decode_history, json_default
+from locking import FileLock, file_signature
+from snapshot import path_for_format, read_snapshot, write_snapshot
+
+
+# --- 変更レコードの適用 ---
+# 変更レコードの形式:
+#   {"set": {フィールド名: 新しい値}, "history": {日数: 状態}, "rewards": {日数: {name, checked}}}
+# "set" はフィールドを丸ごと置き換え、"history" / "rewards" は日数ごとに、"undo" は位置ごとに部分更新する
+# "history" の状態が None の日は未記録に戻す（取り消し用）
+PATCH_FIELDS = ("history", "rewards", "undo")
+
+
+def apply_changes(state, changes):
+    """変更レコードを状態（JSON形式の辞書）に適用する"""
+    for field, value in changes.get("set", {}).items():
+        # 呼び出し元の辞書と共有しないようにコピー（履歴のビット列は保存用の文字列になる）
+        state[field] = json.loads(json.dumps(value, default=json_default))
+    for field in PATCH_FIELDS:
+        patch = changes.get(field)
+        if patch:
+            target = state.setdefault(field, {})
+            if field == "history":
+                # 履歴はビット列（HistoryBits）に揃えてから部分更新する
+                target = state[field] = decode_history(target)
+            for day, value in patch.items():
+                if value is None:
+                    target.pop(str(day), None)
+                    continue
+                # JSONのキーは文字列なので、文字列に揃えて保存する
+                target[str(day)] = value
+    return state
+
+
+def merge_changes(older, newer):
+    """2つの変更レコードを、順に適用したのと同じ結果になる1つのレコードにまとめる（キーは文字列に揃える）"""
+    merged = {"set": dict(older.get("set", {}))}
+    for field in PATCH_FIELDS:
+        merged[field] = {str(day): value for day, value in older.get(field, {}).items()}
+
+    for field, value in newer.get("set", {}).items():
+        merged["set"][field] = value
+        if field in PATCH_FIELDS:
+            merged[field] = {}  # 丸ごと置き換えられたので、それ以前の部分更新は不要
+
+    for field in PATCH_FIELDS:
+        patch = {str(day): value for day, value in newer.get(field, {}).items()}
+        if field in merged["set"]:
+            # 置き換え後の値にそのまま反映する
+            base = merged["set"][field]
+            if field == "history":
+                base = decode_history(base).to_dict()  # 未達成のあとの達成（RETRIED）も区別したまま
+            base = {str(day): value for day, value in base.items()}
+            merged["set"][field] = {**base, **patch}
+        else:
+            merged[field].update(patch)
+
+    return {key: value for key, value in merged.items() if value}
+
+
+class EventJournal:
+    """1操作1行の追記型ジャーナルと、定期的に圧縮するスナップショットで状態を保存する"""
+
+    def __init__(self, snapshot_path, journal_path, compact_every=200, snapshot_format="json"):
+        self.snapshot_path = path_for_format(snapshot_path, snapshot_format)
+        self.journal_path = journal_path
+        self.compact_every = compact_every  # この件数だけ追記したらスナップショットを作り直す
+        self.snapshot_format = snapshot_format  # スナップショットを書き出す形式（snapshot.FORMATS）
+        self.lock = FileLock(journal_path)  # 別プロセスのサーバーとも追記・圧縮を排他する
+        self.conflicts = 0  # 他のプロセスが先に追記していた回数
+        self._seq = None  # 最後に書いたレコードの通し番号（初回の追記時に読み込む）
+        self._pending = 0  # 最後のスナップショット以降に追記した件数
+        self._offset = 0  # 把握しているジャーナルの末尾（バイト数）
+        self._snapshot_signature = None
+        self._written = {}  # ファイルのパス -> このプロセスが最後に書き込んだ直後の署名
+
+    def load(self):
+        """最新のスナップショットとジャーナルの残りから状態を復元する"""
+        with self.lock:
+            state, torn = self._replay()
+            if torn:
+                # 壊れた行の後ろに追記しないよう、先に圧縮しておく
+                self._compact()
+            return state
+
+    def append(self, changes):
+        """変更レコードを1行追記する（書き込み量は履歴の長さに依存しない）"""
+        with self.lock:
+            foreign = self._sync()
+            self._seq += 1
+            record = {"seq": self._seq, **changes}
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=json_default) + "\n")
+            self._offset = os.path.getsize(self.journal_path)
+            self._pending += 1
+            if self._pending >= self.compact_every:
+                self._compact()
+            if foreign:
+                self._written.clear()  # 他のプロセスの変更も入ったので、変更の監視で読み直させる
+            else:
+                self._written[self.journal_path] = file_signature(self.journal_path)
+
+    def compact(self):
+        """現在の状態をスナップショットに書き出し、ジャーナルを空にする"""
+        with self.lock:
+            self._compact()
+
+    @property
+    def written(self):
+        """このプロセスが最後に書き込んだ直後のファイルの署名（変更の監視で自分の保存を見分ける）
+
+        書き込み中に呼ばれたら、書き終えて署名を記録するまで待つ。
+        """
+        with self.lock:
+            return dict(self._written)
+
+    def stats(self):
+        """ロックと競合の統計を辞書で返す"""
+        return {**self.lock.stats(), "conflicts": self.conflicts, "version": self._seq}
+
+    def _sync(self):
+        """他のプロセスの追記・圧縮を取り込んで、通し番号を最新にする（ロック中に呼ぶ）
+
+        このプロセスが把握していない内容を読んだら True を返す。
+        """
+        size = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        if (self._seq is None or size < self._offset
+                or file_signature(self.snapshot_path) != self._snapshot_signature):
+            # 初回、または他のプロセスが圧縮した場合は全体を読み直す
+            _, torn = self._replay()
+            if torn:
+                self._compact()
+            return True
+        if size == self._offset:
+            return False
+        # 把握している末尾より後ろは他のプロセスの追記なので、その部分だけ読む
+        self.conflicts += 1
+        with open(self.journal_path, 'rb') as f:
+            f.seek(self._offset)
+            for line in f.read().decode('utf-8').splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    self._compact()
+                    return True
+                self._seq = max(self._seq, record.get("seq", 0))
+                self._pending += 1
+        self._offset = size
+        return True
+
+    def _compact(self):
+        state, _ = self._replay()
+        state["journal_seq"] = self._seq
+        # 先にスナップショットを置き換える。ここで落ちても通し番号で二重適用は防がれる
+        write_snapshot(self.snapshot_path, state, self.snapshot_format)
+        open(self.journal_path, 'w', encoding='utf-8').close()
+        self._pending = 0
+        self._offset = 0
+        self._snapshot_signature = file_signature(self.snapshot_path)
+        self._written[self.snapshot_path] = self._snapshot_signature
+        self._written[self.journal_path] = file_signature(self.journal_path)
+
+    def _replay(self):
+        """スナップショットを読み込み、それより新しいジャーナルのレコードを順に適用する（ロック中に呼ぶ）"""
+        # 破損している場合は JSONDecodeError（snapshot.SnapshotError）を呼び出し元へ。
+        # 従来の JSON のスナップショットも履歴はビット列に揃うので、次の圧縮で今の形式に書き直される
+        state = read_snapshot(self.snapshot_path)
+        seq = state.pop("journal_seq", 0)
+
+        pending = 0
+        torn = False
+        if os.path.exists(self.journal_path):
+            with open(self.journal_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        # 書き込み途中でクラッシュした最終行は捨てる
+                        torn = True
+                        break
+                    if record.get("seq", 0) <= seq:
+                        # スナップショットに反映済みのレコード
+                        continue
+                    apply_changes(state, record)
+                    seq = record["seq"]
+                    pending += 1
+
+        self._seq = seq
+        self._pending = pending
+        self._offset = os.path.getsize(self.journal_path) if os.path.exists(self.journal_path) else 0
+        self._snapshot_signature = file_signature(self.snapshot_path)
+        return state, torn
+
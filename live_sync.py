@@ -0,0 +1,212 @@
+import json
+import os
+import threading
+
+from engine import normalize_challenge
+from history_bits import json_default
+from locking import file_signature
+
+try:
+    # Linux では inotify、macOS / Windows ではそれぞれのOSの通知を使う
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+except ImportError:  # watchdog がなければ一定間隔でファイルの署名を確認する
+    FileSystemEventHandler = object
+    Observer = None
+
+# --- 保存ファイルの変更を開いているタブへ届ける ---
+# 保存ファイル（DATA_FILE など）を監視し、他のプロセスや手での編集で内容が変わったら、
+# 変わったファイルに入っているチャレンジを表示していて、表示中の状態と違うセッションにだけ新しい状態を預けて再実行させる。
+# このプロセスの保存で変わっただけのファイルは読み直さず、同じプロセスの他のタブには保存した状態をそのまま届ける。
+# セッションは再実行の最初に take() で預けられた状態を受け取り、画面に反映する。
+
+
+class FileWatcher:
+    """ファイルの変更を、変わったファイルの絶対パスの集合で通知する。watchdog があればOSの通知、なければ interval 秒ごとの確認
+
+    paths には、監視するファイルが後から増える場合（チャレンジごとのファイルなど）は一覧を返す関数も渡せる。
+    増えたファイルは、最初に監視したファイルと同じフォルダにあるものだけ通知を受け取れる。
+    """
+
+    def __init__(self, paths, on_change, interval=1.0):
+        self._paths = paths
+        self.on_change = on_change
+        self.interval = interval
+        self._signatures = {path: file_signature(path) for path in self.paths}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        if Observer is not None:
+            self.mode = "events"
+            self._observer = Observer()
+            handler = _Handler(self)
+            for directory in {os.path.dirname(path) for path in self.paths}:
+                self._observer.schedule(handler, directory, recursive=False)
+            self._observer.daemon = True
+            self._observer.start()
+        else:
+            self.mode = "polling"
+            threading.Thread(target=self._poll, name="sugoroku-file-watcher", daemon=True).start()
+
+    @property
+    def paths(self):
+        """監視しているファイルの絶対パス"""
+        paths = self._paths() if callable(self._paths) else self._paths
+        return [os.path.abspath(path) for path in paths]
+
+    def check(self):
+        """署名（更新時刻, サイズ）が変わったファイルがあれば、それらを渡して on_change を呼ぶ"""
+        with self._lock:
+            changed = set()
+            for path in self.paths:
+                signature = file_signature(path)
+                if signature != self._signatures.get(path):
+                    self._signatures[path] = signature
+                    changed.add(path)
+        if changed:
+            self.on_change(changed)
+
+    def stop(self):
+        self._stop.set()
+        if self.mode == "events":
+            self._observer.stop()
+
+    def _poll(self):
+        while not self._stop.wait(self.interval):
+            self.check()
+
+
+class _Handler(FileSystemEventHandler):
+    def __init__(self, watcher):
+        self.watcher = watcher
+
+    def on_any_event(self, event):
+        # 一時ファイルからの置き換え（moved）も含め、監視対象のファイルに関わるイベントだけを見る
+        paths = {os.path.abspath(event.src_path), os.path.abspath(getattr(event, "dest_path", "") or event.src_path)}
+        if paths & set(self.watcher.paths):
+            self.watcher.check()
+
+
+class LiveSync:
+    """セッションごとに表示中の状態の指紋を覚えておき、保存ファイルが変わったら違うセッションにだけ届ける"""
+
+    def __init__(self, storage, paths, request_rerun, default_board_length, writer=None, cache=None, interval=1.0):
+        self.storage = storage
+        self.default_board_length = default_board_length  # 保存データに盤面の長さがないときの値（アプリと同じ）
+        self.request_rerun = request_rerun  # session_id を受け取り、再実行できなければ False を返す
+        self.writer = writer
+        self.cache = cache
+        self.pushes = 0  # 状態を届けて再実行させた回数
+        self._lock = threading.Lock()
+        self._sessions = {}  # session_id -> (user_id, challenge_id)
+        self._fingerprints = {}  # session_id -> 表示中の状態の指紋
+        self._inbox = {}  # session_id -> 届けた状態
+        self._saves = {}  # (user_id, challenge_id) -> このプロセスで保存した回数
+        self.watcher = FileWatcher(paths, self._on_change, interval=interval)
+
+    def register(self, session_id, user_id, challenge_id, state):
+        """セッションが表示している状態を登録する（初期化時と、届いた状態を反映した後に呼ぶ）"""
+        with self._lock:
+            self._sessions[session_id] = (user_id, challenge_id)
+            self._fingerprints[session_id] = fingerprint(state, self.default_board_length)
+
+    def watching(self, session_id):
+        """登録済みのセッションか"""
+        with self._lock:
+            return session_id in self._sessions
+
+    def note_saved(self, session_id, user_id, challenge_id, state):
+        """セッションが保存した。このセッションには送り返さず、同じチャレンジを表示している他のタブへ届ける
+
+        保存先のファイルは読み直さない（このプロセスの保存で変わったファイルは _on_change でも読み飛ばす）。
+        """
+        key = (user_id, challenge_id)
+        current = fingerprint(state, self.default_board_length)
+        to_rerun = []
+        with self._lock:
+            self._saves[key] = self._saves.get(key, 0) + 1
+            if self._sessions.get(session_id) == key:  # 表示中のチャレンジの保存のときだけ
+                self._fingerprints[session_id] = current
+            for other_id, session_key in self._sessions.items():
+                if other_id != session_id and session_key == key and self._fingerprints[other_id] != current:
+                    if not to_rerun:
+                        # セッション側で後から書き換えられても影響しないようにコピーしておく
+                        state = json.loads(json.dumps(state, ensure_ascii=False, default=json_default))
+                    self._inbox[other_id] = state
+                    self._fingerprints[other_id] = current
+                    to_rerun.append(other_id)
+        self._rerun(to_rerun)
+
+    def take(self, session_id):
+        """届いている状態を受け取る（なければ None）"""
+        with self._lock:
+            return self._inbox.pop(session_id, None)
+
+    def stats(self):
+        """監視の方式と、届けた回数を辞書で返す"""
+        with self._lock:
+            return {"watch_mode": self.watcher.mode, "live_sessions": len(self._sessions), "pushes": self.pushes}
+
+    def _on_change(self, paths):
+        """変わったファイルのうち、このプロセスが書き込んだままのものを除き、それに入っているチャレンジだけ読み直す"""
+        written = {os.path.abspath(path): signature for path, signature in self.storage.written.items()}
+        changed = {path for path in paths if path not in written or written[path] != file_signature(path)}
+        if not changed:
+            return
+        with self._lock:
+            keys = set(self._sessions.values())
+        for key in keys:
+            if changed.intersection(map(os.path.abspath, self.storage.files_for(*key))):
+                self._push(key)
+
+    def _push(self, key, attempts=5):
+        """保存先の最新の状態を読み、表示中の状態と違うセッションに届けて再実行させる"""
+        for _ in range(attempts):
+            with self._lock:
+                saves_before = self._saves.get(key, 0)
+            if self.writer is not None:
+                # 書き込み待ちの変更を先に書き出す（変更したセッションへ古い状態を届けないように）
+                self.writer.flush()
+            try:
+                state = self.storage.load(*key)
+            except (OSError, ValueError):  # 書き込み途中などで読めなければ、次の変更通知を待つ
+                return
+            current = fingerprint(state, self.default_board_length)
+            to_rerun = []
+            with self._lock:
+                if self._saves.get(key, 0) != saves_before:
+                    continue  # 読み込みの間にこのプロセスで保存された。読み直して比べる
+                if self.cache is not None:
+                    self.cache.refresh(*key, state)
+                for session_id, session_key in list(self._sessions.items()):
+                    if session_key == key and self._fingerprints[session_id] != current:
+                        self._inbox[session_id] = state
+                        self._fingerprints[session_id] = current
+                        to_rerun.append(session_id)
+            self._rerun(to_rerun)
+            return
+
+    def _rerun(self, session_ids):
+        for session_id in session_ids:
+            if self.request_rerun(session_id):
+                self.pushes += 1
+            else:
+                self._forget(session_id)  # 閉じられたタブ
+
+    def _forget(self, session_id):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+            self._fingerprints.pop(session_id, None)
+            self._inbox.pop(session_id, None)
+
+
+def fingerprint(state, default_board_length):
+    """画面に関わる内容が同じなら同じになる文字列（保存方式ごとのキーや履歴の形式の違いは揃える）"""
+    challenge = normalize_challenge(state, default_board_length)
+    return json.dumps({
+        "current_day": challenge["current_day"],
+        "theme": challenge["theme"],
+        "board_length": challenge["board_length"],
+        "history": challenge["history"],
+        "rewards": {str(day): reward for day, reward in challenge["rewards"].items()},
+    }, ensure_ascii=False, sort_keys=True, default=json_default)
+
@@ -0,0 +1,328 @@
+"""同じ保存先を複数のセッションで同時に操作する負荷試験（オフラインで完結する）
+
+streamlit.testing の AppTest で app09_can_be_saved.py のセッションを利用者の数だけ作り、プロセスプールの
+各プロセスに振り分けて「達成」「未達成」「ご褒美のチェック」「リセット」を決めた間隔で押し続ける。
+1つのプロセスは1台のサーバー（cache_resource の保存先や書き込みスレッドを共有する）、
+プロセスの数はサーバーの台数にあたり、全プロセスが同じ作業フォルダの保存ファイルを読み書きする。
+
+    python load_test.py --users 20 --processes 4 --actions 30 --rate 2 --backend journal
+    python load_test.py --users 8 --shared --backend file --output load_results.json
+
+報告する値:
+    throughput            全体で1秒あたりに処理した操作の数
+    p50 / p95 / p99 / max 操作1回あたりのスクリプト実行時間
+    lost_history_days     画面で見えていた履歴と、終了後に保存先から読み直した履歴が食い違う日数
+    lost_reward_checks    同じくご褒美のチェックが食い違う数
+    corrupt_events        実行中に出た破損の警告と、終了後に読めなかった保存ファイル・ジャーナルの壊れた行の数
+
+既定では利用者ごとに別のチャレンジを操作する。--shared を付けると全員が同じチャレンジを操作し、
+最後に操作したセッションの画面の状態を「意図した状態」として比べる。
+"""
+import argparse
+import glob
+import heapq
+import json
+import multiprocessing
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import streamlit as st
+
+import engine
+from bench_rerun import FAILURE_LABEL, RESET_LABELS, SUCCESS_LABEL, find_button, git_commit, percentile
+
+APP_DIR = os.path.dirname(os.path.abspath(__file__))
+APP = "app09_can_be_saved.py"
+BACKENDS = ["file", "journal", "sqlite", "crdt"]  # "memory" はプロセス間で共有されないので対象外
+ACTIONS = ("success", "failure", "reward", "reset")
+DEFAULT_MIX = "success=60,failure=25,reward=10,reset=5"
+
+# app09_can_be_saved.py と同じ保存先の既定値（作業フォルダからの相対パス）
+DATA_FILE = "sugoroku_data.json"
+JOURNAL_FILE = "sugoroku_data.journal"
+SQLITE_FILE = "sugoroku_data.db"
+REPLICA_DIR = "sugoroku_data.crdt"
+DEFAULT_BOARD_LENGTH = 25
+CORRUPT_MESSAGE = "破損"  # app09 が保存ファイルを読めなかったときに出すエラーの文言
+
+
+def parse_mix(text):
+    """"success=60,failure=25,..." を操作名 -> 重み の辞書にする"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ACTIONS:
+            raise argparse.ArgumentTypeError(f"未対応の操作です: {name}（{', '.join(ACTIONS)}）")
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"重みは数値にしてください: {part}") from None
+    if not mix or sum(mix.values()) <= 0:
+        raise argparse.ArgumentTypeError("重みの合計は0より大きくしてください")
+    return mix
+
+
+def session_keys(users, shared):
+    """利用者ごとの (user_id, challenge_id)。"file" / "journal" はユーザーを区別しないのでチャレンジも分ける"""
+    if shared:
+        return [("load", "default")] * users
+    return [(f"load-{index}", f"c{index}") for index in range(users)]
+
+
+def perform(at, action, rng):
+    """操作を1回行う（run は呼ばない）。実際に行った操作名を返す"""
+    success, failure = find_button(at, SUCCESS_LABEL), find_button(at, FAILURE_LABEL)
+    if action in ("success", "failure") and success.disabled:
+        action = "reset"  # ゴール後は記録できないので、利用者はやり直す
+    if action == "reward":
+        checkboxes = [box for box in at.checkbox if (box.key or "").startswith("reward_check_") and not box.disabled]
+        if not checkboxes:
+            action = "success"
+            if success.disabled:
+                action = "reset"
+        else:
+            box = rng.choice(checkboxes)
+            box.uncheck() if box.value else box.check()
+            return action
+    if action == "success":
+        success.click()
+    elif action == "failure":
+        failure.click()
+    else:
+        find_button(at, RESET_LABELS[APP]).click()
+    return action
+
+
+def observed_state(at):
+    """セッションの画面に見えている履歴とご褒美のチェック"""
+    game = at.session_state.game
+    return {
+        "history": {str(day): status for day, status in game.history.to_dict().items()},
+        "rewards": {str(day): reward["checked"] for day, reward in game.rewards.items()},
+    }
+
+
+def run_worker(worker_index, sessions, options):
+    """1つのプロセス（サーバー1台分）で、割り当てられたセッションを順番に操作する"""
+    from streamlit.logger import set_log_level
+    from streamlit.testing.v1 import AppTest
+
+    os.chdir(options["data_dir"])  # app09 の保存先は相対パスなので、全プロセスで同じフォルダを使う
+    os.environ["SUGOROKU_STORAGE_BACKEND"] = options["backend"]
+    os.environ["SUGOROKU_WRITE_BEHIND_INTERVAL"] = str(options["write_behind"])
+    os.environ["SUGOROKU_LIVE_SYNC"] = "1" if options["live_sync"] else "0"
+    os.environ["SUGOROKU_DEVICE_ID"] = f"load-worker-{worker_index}"  # "crdt" の端末ログをプロセスごとに分ける
+    set_log_level("error")
+
+    rng = random.Random(options["seed"] * 1000 + worker_index)
+    names, weights = list(options["mix"]), list(options["mix"].values())
+    interval = 1 / options["rate"] if options["rate"] > 0 else 0
+
+    result = {"latencies": [], "actions": {}, "errors": [], "corrupt_events": 0, "observed": []}
+    apps = []
+    for index, (user_id, challenge_id) in sessions:
+        at = AppTest.from_file(os.path.join(APP_DIR, APP), default_timeout=options["timeout"])
+        at.query_params["user"] = user_id
+        at.query_params["challenge"] = challenge_id
+        at.run()
+        apps.append((index, user_id, challenge_id, at))
+
+    # 次に操作する時刻の早い順に取り出す（間隔は利用者ごと、開始時刻は少しずらす）
+    started = time.time()
+    queue = [(started + rng.random() * interval, position, 0) for position in range(len(apps))]
+    heapq.heapify(queue)
+    last_action = {}
+    while queue:
+        due, position, count = heapq.heappop(queue)
+        wait = due - time.time()
+        if wait > 0:
+            time.sleep(wait)
+        index, user_id, challenge_id, at = apps[position]
+        action = perform(at, rng.choices(names, weights)[0], rng)
+        start = time.perf_counter()
+        at.run()
+        result["latencies"].append(time.perf_counter() - start)
+        last_action[position] = time.time()
+        result["actions"][action] = result["actions"].get(action, 0) + 1
+        if at.exception:
+            result["errors"].append(f"{user_id}/{challenge_id}: {at.exception[0].message}")
+            continue  # 例外の後は画面の状態が当てにならないので、このセッションの操作はやめる
+        result["corrupt_events"] += sum(CORRUPT_MESSAGE in error.value for error in at.error)
+        if count + 1 < options["actions"]:
+            heapq.heappush(queue, (max(due + interval, time.time()), position, count + 1))
+    result["started"], result["finished"] = started, time.time()
+
+    for position, (index, user_id, challenge_id, at) in enumerate(apps):
+        if position in last_action and not at.exception:
+            result["observed"].append({
+                "user_id": user_id,
+                "challenge_id": challenge_id,
+                "last_action": last_action[position],
+                **observed_state(at),
+            })
+    # 書き込み待ちの変更はプロセスの正常終了時（atexit）に書き出されるので、ここでは待たない
+    return result
+
+
+def open_storage(data_dir, backend):
+    from storage import create_storage
+    return create_storage(
+        backend,
+        data_file=os.path.join(data_dir, DATA_FILE),
+        journal_file=os.path.join(data_dir, JOURNAL_FILE),
+        sqlite_file=os.path.join(data_dir, SQLITE_FILE),
+        replica_dir=os.path.join(data_dir, REPLICA_DIR),
+        device_id="load-test-verify",
+    )
+
+
+def scan_files(data_dir):
+    """保存フォルダの保存ファイル（バイナリ / JSON）とジャーナルを直接読み、壊れているものを数える"""
+    from snapshot import read_snapshot
+    corrupt = []
+    for path in glob.glob(os.path.join(data_dir, "**", "sugoroku_data*"), recursive=True):
+        if path.endswith((".json", ".sgrk")):
+            try:
+                read_snapshot(path)  # ヘッダーとチェックサムも確かめる
+            except json.JSONDecodeError:
+                corrupt.append(path)
+        elif path.endswith(".journal"):
+            with open(path, encoding="utf-8", errors="replace") as f:
+                for line_number, line in enumerate(f, start=1):
+                    try:
+                        json.loads(line)
+                    except json.JSONDecodeError:
+                        corrupt.append(f"{path}:{line_number}")
+    return corrupt
+
+
+def verify(data_dir, backend, observed):
+    """最後に見えていた状態と、保存先から読み直した状態を比べる"""
+    intended = {}
+    for entry in observed:
+        key = (entry["user_id"], entry["challenge_id"])
+        if key not in intended or entry["last_action"] > intended[key]["last_action"]:
+            intended[key] = entry
+
+    storage = open_storage(data_dir, backend)
+    lost_days = lost_checks = 0
+    load_errors = []
+    for (user_id, challenge_id), entry in sorted(intended.items()):
+        try:
+            persisted = engine.normalize_challenge(storage.load(user_id, challenge_id), DEFAULT_BOARD_LENGTH)
+        except json.JSONDecodeError as e:
+            load_errors.append(f"{user_id}/{challenge_id}: {e}")
+            continue
+        history = {str(day): status for day, status in persisted["history"].to_dict().items()}
+        checks = {str(day): reward["checked"] for day, reward in persisted["rewards"].items()}
+        lost_days += sum(history.get(day) != entry["history"].get(day) for day in history.keys() | entry["history"].keys())
+        lost_checks += sum(checks.get(day, False) != entry["rewards"].get(day, False)
+                           for day in checks.keys() | entry["rewards"].keys())
+    return {"challenges": len(intended), "lost_history_days": lost_days, "lost_reward_checks": lost_checks,
+            "load_errors": load_errors}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="複数のセッションで同じ保存先を同時に操作する負荷試験")
+    parser.add_argument("--users", type=int, default=10, help="同時に操作する利用者（セッション）の数")
+    parser.add_argument("--processes", type=int, default=2, help="セッションを振り分けるプロセス（サーバー）の数")
+    parser.add_argument("--actions", type=int, default=20, help="利用者1人あたりの操作回数")
+    parser.add_argument("--rate", type=float, default=2.0, help="利用者1人あたりの1秒間の操作回数（0 は待たずに続ける）")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(DEFAULT_MIX), help=f"操作の重み（既定: {DEFAULT_MIX}）")
+    parser.add_argument("--shared", action="store_true", help="全員で同じチャレンジを操作する")
+    parser.add_argument("--backend", default="journal", choices=BACKENDS, help="app09 の保存方式")
+    parser.add_argument("--write-behind", type=float, default=1.0, help="SUGOROKU_WRITE_BEHIND_INTERVAL（0 はその場で保存）")
+    parser.add_argument("--no-live-sync", dest="live_sync", action="store_false", help="保存ファイルの監視を止める")
+    parser.add_argument("--data-dir", help="保存ファイルを置くフォルダ（省略すると一時フォルダを作って最後に消す）")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--timeout", type=float, default=30, help="1回の実行のタイムアウト（秒）")
+    parser.add_argument("--output", help="結果を書き出すJSONファイル")
+    args = parser.parse_args(argv)
+
+    data_dir = os.path.abspath(args.data_dir) if args.data_dir else tempfile.mkdtemp(prefix="sugoroku-load-")
+    os.makedirs(data_dir, exist_ok=True)
+    options = {
+        "data_dir": data_dir,
+        "backend": args.backend,
+        "write_behind": args.write_behind,
+        "live_sync": args.live_sync,
+        "seed": args.seed,
+        "rate": args.rate,
+        "mix": args.mix,
+        "actions": args.actions,
+        "timeout": args.timeout,
+    }
+    sessions = list(enumerate(session_keys(args.users, args.shared)))
+    processes = max(1, min(args.processes, args.users))
+    try:
+        # Streamlit はスレッドを使うので fork ではなく spawn で起動し、close / join で正常終了させる
+        # （プロセスの終了時に書き込み待ちの変更が書き出される）
+        pool = multiprocessing.get_context("spawn").Pool(processes)
+        pending = [pool.apply_async(run_worker, (index, sessions[index::processes], options))
+                   for index in range(processes)]
+        pool.close()
+        pool.join()
+        results = [result.get() for result in pending]
+
+        latencies = [latency for result in results for latency in result["latencies"]]
+        elapsed = max(r["finished"] for r in results) - min(r["started"] for r in results)
+        actions = {}
+        for result in results:
+            for name, count in result["actions"].items():
+                actions[name] = actions.get(name, 0) + count
+        verification = verify(data_dir, args.backend, [entry for r in results for entry in r["observed"]])
+        corrupt_files = scan_files(data_dir)
+    finally:
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+
+    summary = {
+        "actions": len(latencies),
+        "actions_by_type": actions,
+        "elapsed_s": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed > 0 else None,
+        "p50_ms": percentile(latencies, 0.50) * 1000 if latencies else None,
+        "p95_ms": percentile(latencies, 0.95) * 1000 if latencies else None,
+        "p99_ms": percentile(latencies, 0.99) * 1000 if latencies else None,
+        "max_ms": max(latencies) * 1000 if latencies else None,
+        "challenges": verification["challenges"],
+        "lost_history_days": verification["lost_history_days"],
+        "lost_reward_checks": verification["lost_reward_checks"],
+        "corrupt_events": sum(r["corrupt_events"] for r in results) + len(verification["load_errors"]) + len(corrupt_files),
+        "errors": [error for r in results for error in r["errors"]] + verification["load_errors"] + corrupt_files,
+    }
+    print(f"{args.backend} users={args.users} processes={processes} shared={args.shared}: "
+          f"{summary['actions']} actions in {elapsed:.1f}s ({summary['throughput'] or 0:.1f}/s) "
+          f"p50={summary['p50_ms'] or 0:.1f}ms p95={summary['p95_ms'] or 0:.1f}ms p99={summary['p99_ms'] or 0:.1f}ms "
+          f"lost_days={summary['lost_history_days']} lost_checks={summary['lost_reward_checks']} "
+          f"corrupt={summary['corrupt_events']} errors={len(summary['errors'])}", file=sys.stderr)
+    for error in summary["errors"][:10]:
+        print(f"  {error}", file=sys.stderr)
+
+    if args.output:
+        report = {
+            "meta": {
+                "commit": git_commit(),
+                "created_at": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+                "python": platform.python_version(),
+                "streamlit": st.__version__,
+                "options": {**vars(args), "processes": processes},
+            },
+            "summary": summary,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=4)
+
+    # 更新の消失や破損があれば失敗として終了する（CI などで使えるように）
+    lost = summary["lost_history_days"] or summary["lost_reward_checks"] or summary["corrupt_events"]
+    return 1 if lost or summary["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,121 @@
+import json
+import os
+import threading
+import time
+
+from history_bits import json_default
+
+try:
+    import fcntl  # Linux / macOS
+except ImportError:
+    fcntl = None
+    import msvcrt  # Windows
+
+
+def atomic_write_json(path, data):
+    """一時ファイルに書き込んでから置き換え、書き込み途中で壊れないようにする"""
+    atomic_write_text(path, json.dumps(data, ensure_ascii=False, indent=4, default=json_default))
+
+
+def atomic_write_text(path, text):
+    """atomic_write_json の文字列版"""
+    atomic_write_bytes(path, text.encode('utf-8'))
+
+
+def atomic_write_bytes(path, data):
+    """atomic_write_json のバイト列版"""
+    tmp_path = f"{path}.{os.getpid()}.tmp"  # 複数プロセスが同じ一時ファイルを使わないようにする
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def file_signature(path):
+    """ファイルが変わったかの判定に使う (iノード番号, 更新時刻, サイズ)。ファイルがなければ None
+
+    読み込みキャッシュのキー・変更の監視・自分の書き込みの記録で、同じ判定になるようこれだけを使う。
+    置き換え（atomic_write_*）では iノード番号が変わるので、更新時刻とサイズが同じでも見分けられる。
+    """
+    try:
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+class FileLock:
+    """別ファイル（path + ".lock"）を使ったプロセス間の助言ロック。保持時間と競合回数を記録する"""
+
+    def __init__(self, path):
+        self.lock_path = f"{path}.lock"
+        self._thread_lock = threading.Lock()  # 同じプロセス内のスレッド同士はこちらで待つ
+        self._file = None
+        self._acquired_at = 0.0
+        self.acquisitions = 0  # ロックを取得した回数
+        self.contentions = 0  # すぐに取得できず待たされた回数
+        self.total_wait = 0.0  # 待ち時間の合計（秒）
+        self.total_hold = 0.0  # 保持時間の合計（秒）
+        self.max_hold = 0.0  # 最長の保持時間（秒）
+
+    def __enter__(self):
+        start = time.perf_counter()
+        contended = not self._thread_lock.acquire(blocking=False)
+        if contended:
+            self._thread_lock.acquire()
+        self._file = open(self.lock_path, 'a+b')
+        if not self._try_lock_file():
+            contended = True
+            self._lock_file()
+        self._acquired_at = time.perf_counter()
+        self.acquisitions += 1
+        self.total_wait += self._acquired_at - start
+        if contended:
+            self.contentions += 1
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        held = time.perf_counter() - self._acquired_at
+        self.total_hold += held
+        self.max_hold = max(self.max_hold, held)
+        self._unlock_file()
+        self._file.close()
+        self._file = None
+        self._thread_lock.release()
+
+    def stats(self):
+        """ロックの統計を辞書で返す"""
+        return {
+            "acquisitions": self.acquisitions,
+            "contentions": self.contentions,
+            "total_wait_seconds": self.total_wait,
+            "total_hold_seconds": self.total_hold,
+            "max_hold_seconds": self.max_hold,
+        }
+
+    def _try_lock_file(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+
+    def _lock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+            return
+        # msvcrt には無期限に待つ方法がないため、取得できるまで繰り返す
+        while not self._try_lock_file():
+            time.sleep(0.01)
+
+    def _unlock_file(self):
+        if fcntl is not None:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        else:
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
@@ -0,0 +1,161 @@
+import functools
+import os
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from locking import atomic_write_text
+
+# --- 処理時間の計測 ---
+# 環境変数 SUGOROKU_METRICS=1 のときだけ計測する。無効なときは timed() が共有の空コンテキストを返し、
+# timed_function() は関数をそのまま返すので、計測のための処理はほぼ発生しない。
+ENABLED = os.environ.get("SUGOROKU_METRICS", "") == "1"
+
+# ヒストグラムのバケット（秒）
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+METRIC_NAME = "sugoroku_section_seconds"
+_NULL_CONTEXT = nullcontext()
+
+
+class Histogram:
+    """1区間の処理時間のヒストグラム（Prometheus と同じ累積でないバケット数を保持）"""
+
+    __slots__ = ("counts", "total", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # 最後は BUCKETS の上限を超えたもの
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        for index, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                break
+        else:
+            index = len(BUCKETS)
+        self.counts[index] += 1
+        self.total += seconds
+        self.count += 1
+
+    def quantile(self, ratio):
+        """バケットから求めたおおよその分位点（秒）。上限を超えた場合は最後のバケットの上限を返す"""
+        if not self.count:
+            return 0.0
+        target = ratio * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return BUCKETS[min(index, len(BUCKETS) - 1)]
+        return BUCKETS[-1]
+
+
+class Registry:
+    """プロセス全体で共有する区間ごとのヒストグラム"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}
+
+    def observe(self, section, seconds):
+        with self._lock:
+            histogram = self._histograms.get(section)
+            if histogram is None:
+                histogram = self._histograms[section] = Histogram()
+            histogram.observe(seconds)
+
+    def summary(self):
+        """区間ごとの {count, mean_ms, p95_ms} を返す（デバッグ表示用）"""
+        with self._lock:
+            return {
+                section: {
+                    "count": h.count,
+                    "mean_ms": h.total / h.count * 1000 if h.count else 0.0,
+                    "p95_ms": h.quantile(0.95) * 1000,
+                }
+                for section, h in sorted(self._histograms.items())
+            }
+
+    def to_prometheus(self):
+        """Prometheus のテキスト形式に変換する"""
+        lines = [
+            f"# HELP {METRIC_NAME} Time spent in each section of the sugoroku app.",
+            f"# TYPE {METRIC_NAME} histogram",
+        ]
+        with self._lock:
+            for section, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.counts):
+                    cumulative += count
+                    lines.append(f'{METRIC_NAME}_bucket{{section="{section}",le="{bound}"}} {cumulative}')
+                lines.append(f'{METRIC_NAME}_bucket{{section="{section}",le="+Inf"}} {h.count}')
+                lines.append(f'{METRIC_NAME}_sum{{section="{section}"}} {h.total}')
+                lines.append(f'{METRIC_NAME}_count{{section="{section}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def timed(section):
+    """with timed("board"): ... の区間の処理時間を記録する"""
+    if not ENABLED:
+        return _NULL_CONTEXT
+    return _timed(section)
+
+
+@contextmanager
+def _timed(section):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(section, time.perf_counter() - start)
+
+
+def timed_function(section):
+    """関数全体の処理時間を記録するデコレーター（無効なときは関数をそのまま返す）"""
+    def decorator(func):
+        if not ENABLED:
+            return func
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with _timed(section):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") != "/metrics":
+            self.send_error(404)
+            return
+        body = REGISTRY.to_prometheus().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass  # アクセスのたびにログを出さない
+
+
+def start_exporter(port=None, textfile=None, interval=10.0):
+    """計測結果の書き出しを始める
+
+    port: 指定すると http://127.0.0.1:port/metrics で公開する
+    textfile: 指定すると interval 秒ごとにこのファイルへ Prometheus 形式で書き出す
+    """
+    if port:
+        server = ThreadingHTTPServer(("127.0.0.1", port), _MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="sugoroku-metrics-http", daemon=True).start()
+    if textfile:
+        def write_loop():
+            while True:
+                time.sleep(interval)
+                atomic_write_text(textfile, REGISTRY.to_prometheus())
+        threading.Thread(target=write_loop, name="sugoroku-metrics-file", daemon=True).start()
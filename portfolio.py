@@ -0,0 +1,83 @@
+import heapq
+
+from board import reward_days_for
+from engine import normalize_challenge
+
+# --- 複数のチャレンジの概要（ポートフォリオ） ---
+# チャレンジごとに、一覧やダッシュボードに必要な数値だけを「概要」として保存時に作っておく。
+# ダッシュボードは概要だけを読んで集計するので、チャレンジが数百件あっても履歴は1件も読み込まない。
+DEFAULT_BOARD_LENGTH = 25  # 保存データに盤面の長さがないときの値（app09 の MAX_MASU と同じ）
+UPCOMING_REWARD_LIMIT = 10  # ダッシュボードに並べる「次のご褒美」の件数
+
+
+def summarize(state, default_board_length=DEFAULT_BOARD_LENGTH, reward_interval=None):
+    """チャレンジの状態（JSON形式でもセッションの形式でもよい）から概要の辞書を作る"""
+    challenge = normalize_challenge(state, default_board_length, reward_interval)
+    return _summary(challenge["theme"], challenge["board_length"], challenge["current_day"], challenge["stats"],
+                    challenge["rewards"], challenge["calendar"], reward_interval)
+
+
+def summarize_session(game, reward_interval=None):
+    """セッションのチャレンジ（engine.SessionChallenge）から概要を作る。集計は game.stats を使い、履歴は読まない"""
+    return _summary(game.theme, game.board_length, game.current_day, game.stats, game.rewards, game.calendar,
+                    reward_interval)
+
+
+def _summary(theme, board_length, current_day, stats, rewards, calendar, reward_interval):
+    # 次のご褒美: 現在のマス以降で最初のご褒美マス（ゴール後はなし）
+    next_reward_day = next((day for day in reward_days_for(board_length, reward_interval) if day >= current_day), None)
+    last_date = calendar.last_date
+    return {
+        "theme": theme,
+        "board_length": board_length,
+        "current_day": current_day,
+        "achieved": stats.achieved,
+        "failed": stats.failed,
+        "current_streak": stats.current_streak,
+        "longest_streak": stats.longest_streak,
+        "goal_reached": current_day > board_length,
+        "next_reward_day": next_reward_day,
+        "next_reward_name": rewards[next_reward_day]["name"] if next_reward_day else "",
+        "last_date": last_date.isoformat() if last_date else None,  # 最後に記録した日
+    }
+
+
+def aggregate(summaries, limit=UPCOMING_REWARD_LIMIT):
+    """チャレンジID -> 概要 の辞書から、全チャレンジの合計と近いご褒美を求める"""
+    totals = {
+        "challenges": len(summaries),
+        "active": 0,
+        "completed": 0,
+        "achieved": 0,
+        "failed": 0,
+        "best_current_streak": 0,
+        "longest_streak": 0,
+    }
+    for summary in summaries.values():
+        totals["completed" if summary["goal_reached"] else "active"] += 1
+        totals["achieved"] += summary["achieved"]
+        totals["failed"] += summary["failed"]
+        totals["best_current_streak"] = max(totals["best_current_streak"], summary["current_streak"])
+        totals["longest_streak"] = max(totals["longest_streak"], summary["longest_streak"])
+
+    # 残りマス数が少ない順に limit 件だけ取り出す（全件の並べ替えはしない）
+    upcoming = heapq.nsmallest(
+        limit,
+        (
+            (summary["next_reward_day"] - summary["current_day"], challenge_id, summary)
+            for challenge_id, summary in summaries.items()
+            if summary["next_reward_day"] is not None
+        ),
+        key=lambda item: (item[0], item[1]),
+    )
+    totals["upcoming_rewards"] = [
+        {
+            "challenge_id": challenge_id,
+            "theme": summary["theme"],
+            "day": summary["next_reward_day"],
+            "remaining": remaining,
+            "name": summary["next_reward_name"],
+        }
+        for remaining, challenge_id, summary in upcoming
+    ]
+    return totals
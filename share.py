@@ -0,0 +1,34 @@
+from board import render_board_html, reward_days_for
+from engine import normalize_challenge
+from portfolio import summarize
+
+# --- 読み取り専用の共有表示 ---
+# 友だちに見せる画面は、保存された状態から作った「スナップショット」（盤面のHTML・ご褒美・最近の履歴・集計）
+# だけで描く。スナップショットは JSON にできる値だけの辞書なので、そのまま st.cache_data に置いて
+# 全員で使い回せる。見る人ごとにセッションの状態を作ったり履歴を読み込んだりはしない。
+SHARE_HISTORY_LIMIT = 30  # 共有画面に並べる最近の履歴の件数
+
+
+def build_snapshot(state, default_board_length, history_limit=SHARE_HISTORY_LIMIT, reward_interval=None):
+    """保存データ（JSON形式の辞書）から共有表示のスナップショットを作る（保存されていないチャレンジなら None）"""
+    if "current_day" not in state:  # 読み込みキャッシュは空のデータも履歴などを補って返すため、中身で判定する
+        return None
+    challenge = normalize_challenge(state, default_board_length, reward_interval)
+    board_length = challenge["board_length"]
+    history = challenge["history"]
+    stats = challenge["stats"]
+    reward_days = reward_days_for(board_length, reward_interval)
+    return {
+        "summary": summarize(state, default_board_length, reward_interval),
+        "completion_rate": stats.completion_rate,
+        # 盤面は現在地のページだけを描く（長い盤面でも1ページ分）
+        "board_html": render_board_html(challenge["current_day"], history, reward_days, board_length),
+        # 名前を付けたご褒美だけを (日, 名前, 受け取ったか) で並べる
+        "rewards": [
+            (day, challenge["rewards"][day]["name"], challenge["rewards"][day]["checked"])
+            for day in reward_days
+            if challenge["rewards"][day]["name"]
+        ],
+        "recent_history": [(day, history[day]) for day in stats.recent_days(history, history_limit)],
+        "recorded": len(history),  # 記録のあるマスの数
+    }
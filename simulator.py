@@ -0,0 +1,60 @@
+from collections import namedtuple
+
+import numpy as np
+
+# --- まとめてシミュレーション ---
+# engine.py と同じルールを、多数のチャレンジに対して NumPy の配列演算で一度に適用する。
+# 画面を操作せずに、ご褒美マスの配置や負荷の見積もりを試すために使う。
+BatchResult = namedtuple("BatchResult", ["positions", "streaks", "longest_streaks", "failures", "reward_unlock_steps"])
+
+
+def simulate_batch(outcomes, goal_day, reward_days):
+    """達成 / 未達成の操作列をチャレンジごとに適用した結果を返す
+
+    outcomes: 形が (チャレンジ数, 操作数) の真偽値配列。True が「達成」、False が「未達成」のボタン操作。
+    戻り値（いずれもチャレンジごとの配列）:
+        positions           最終的な current_day（ゴール達成後は goal_day + 1）
+        streaks             最後の時点の連続達成日数
+        longest_streaks     最長連続達成日数
+        failures            未達成を記録したマスの数（あとで達成したマスも含む。engine の stats.failed と同じ）
+        reward_unlock_steps 形が (チャレンジ数, ご褒美マス数)。各ご褒美マスを達成した操作の番号（1始まり、未達成は -1）
+    """
+    outcomes = np.asarray(outcomes, dtype=bool)
+    n_challenges, n_steps = outcomes.shape
+    reward_days = list(reward_days)
+
+    # マス番号 → ご褒美マスの番号（ご褒美マスでなければ -1）の対応表
+    reward_index = np.full(goal_day + 2, -1, dtype=np.int64)
+    reward_index[reward_days] = np.arange(len(reward_days))
+
+    positions = np.ones(n_challenges, dtype=np.int64)
+    runs = np.zeros(n_challenges, dtype=np.int64)  # 直前の操作までの連続達成日数（未達成で 0 に戻る）
+    streaks = np.zeros(n_challenges, dtype=np.int64)
+    longest = np.zeros(n_challenges, dtype=np.int64)
+    failed_here = np.zeros(n_challenges, dtype=bool)  # current_day に未達成が記録されているか
+    failures = np.zeros(n_challenges, dtype=np.int64)
+    unlock_steps = np.full((n_challenges, len(reward_days)), -1, dtype=np.int64)
+    rows = np.arange(n_challenges)
+
+    for step in range(n_steps):
+        active = positions <= goal_day  # ゴール後はどちらのボタンも無効
+        success = outcomes[:, step] & active
+        failure = ~outcomes[:, step] & active
+
+        # 達成: 直前までの連続 + 1 になり、次のマスへ進む（同じマスの未達成は上書きされるが、未達成の日としては残す）
+        streaks = np.where(success, runs + 1, streaks)
+        runs = np.where(success, streaks, runs)
+        longest = np.maximum(longest, streaks)
+        failed_here &= ~success
+
+        hit = success & (reward_index[positions] >= 0)
+        unlock_steps[rows[hit], reward_index[positions[hit]]] = step + 1
+        positions = positions + success
+
+        # 未達成: マスは進まず、連続達成日数は 0 に戻る（次の達成は 1 から数える）
+        streaks = np.where(failure, 0, streaks)
+        runs = np.where(failure, 0, runs)
+        failures += (failure & ~failed_here)
+        failed_here |= failure
+
+    return BatchResult(positions, streaks, longest, failures, unlock_steps)
@@ -0,0 +1,266 @@
+import json
+import os
+import struct
+import zlib
+from itertools import accumulate
+
+from history_bits import HistoryBits, decode_history, json_default
+from locking import atomic_write_bytes, atomic_write_json
+
+# --- 保存ファイル（スナップショット）の形式 ---
+# "file" の保存ファイルと "journal" のスナップショットは、既定では従来どおり JSON で書き出す。
+# "binary" を選ぶと、型の決まったバイナリで拡張子 .sgrk のファイルに書き出す。
+#   ヘッダー（16バイト）: マジック "SGRK" / ヘッダーの版 / スキーマの版 / 本体の長さ / 本体の CRC32
+#   本体: スキーマの版ごとに決まった並びで struct に詰めた状態
+# 読み込み時はヘッダーと CRC32 を1回確かめたら、あとは決まった位置から順に取り出すだけで、
+# キーごとの型の確認や変換は要らない。履歴はビット列（HistoryBits）のまま、base64 を通さずに読み書きする。
+# バイナリの利点は CRC32 による破損の検出と、履歴を base64 にしない分の小ささで、読み込みの速さではない
+# （取り消しの記録は JSON のまま本体に入れるため、履歴がビット列の JSON とほぼ同じ速さになる）。
+# 先頭がマジックでないファイルは従来の JSON として読み、登録したマイグレーションで今のスキーマに揃える。
+# 形式を切り替えた後は、選んだ形式のファイルがまだなければもう一方の形式のファイル（.json / .sgrk）から読む。
+# 書き込んだら、もう一方の形式のファイルは消す（古い内容のファイルを残さない）。
+MAGIC = b"SGRK"
+HEADER_VERSION = 1
+SCHEMA_VERSION = 1  # 本体の並びを変えたら増やし、前の版からのマイグレーションを登録する
+LEGACY_SCHEMA_VERSION = 0  # 従来の JSON（sugoroku_data.json）
+FORMATS = ("json", "binary")  # 保存時に選べる形式（先頭が既定）
+EXTENSIONS = {"json": ".json", "binary": ".sgrk"}  # 形式ごとの保存ファイルの拡張子
+
+_HEADER = struct.Struct("<4sHHII")
+_U32 = struct.Struct("<I")
+
+# 版1の本体: 項目の有無のビット / 整数項目 / 文字列項目 / 履歴 / ご褒美 / その他の項目（JSON）
+# ご褒美は件数のあとに 日数の列 / チェックの列 / 名前の文字数の列 / 名前をつないだ文字列 の順に並べ、
+# 列ごとに struct 1回で取り出す。値の型が合わない項目は、読み込んだ結果が同じになるよう「その他の項目」に回す
+INT_FIELDS = ("current_day", "board_length", "consecutive_success", "version", "journal_seq",
+              "undo_bottom", "undo_position", "undo_top")
+TEXT_FIELDS = ("theme", "calendar")
+_INTS = struct.Struct(f"<H{len(INT_FIELDS)}q")
+_HISTORY_BIT = 1 << (len(INT_FIELDS) + len(TEXT_FIELDS))
+_REWARDS_BIT = _HISTORY_BIT << 1
+
+
+class SnapshotError(json.JSONDecodeError):
+    """保存ファイルが壊れている（呼び出し元が JSON の破損と同じく扱えるよう JSONDecodeError の派生にする）"""
+
+    def __init__(self, msg, pos=0):
+        super().__init__(msg, "", pos)
+
+
+# --- マイグレーション ---
+MIGRATIONS = {}  # スキーマの版 -> その版の状態を1つ新しい版に変える関数
+
+
+def migration(from_version):
+    """スキーマの版 from_version の状態を、次の版に変える関数として登録する"""
+    def register(func):
+        MIGRATIONS[from_version] = func
+        return func
+    return register
+
+
+def migrate(state, schema):
+    """登録したマイグレーションを順に適用して、今のスキーマの状態にする"""
+    while schema < SCHEMA_VERSION:
+        state = MIGRATIONS[schema](state)
+        schema += 1
+    return state
+
+
+@migration(LEGACY_SCHEMA_VERSION)
+def _from_legacy_json(state):
+    """従来の JSON → 版1: 履歴（{"日数": 状態} の辞書か "b64:..."）をビット列にし、ご褒美のキーを文字列に揃える"""
+    if "history" in state:
+        state["history"] = decode_history(state["history"])
+    rewards = state.get("rewards")
+    if isinstance(rewards, dict):
+        state["rewards"] = {str(day): reward for day, reward in rewards.items()}
+    return state
+
+
+# --- 読み書き ---
+def path_for_format(path, snapshot_format):
+    """形式に合わせた保存ファイル名（"sugoroku_data.json" は "binary" なら "sugoroku_data.sgrk"）"""
+    root, ext = os.path.splitext(path)
+    if ext not in EXTENSIONS.values():
+        return path  # 拡張子で形式を見分けられない名前は、そのまま使う
+    return root + EXTENSIONS[snapshot_format]
+
+
+def read_snapshot(path):
+    """保存ファイルを読み込む（ファイルがなければ空の辞書、壊れていれば SnapshotError）
+
+    path がなければ、形式を切り替える前のもう一方の形式のファイルを読む（次の write_snapshot で移し替わる）。
+    """
+    for candidate in (path, *_other_paths(path)):
+        try:
+            with open(candidate, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            continue
+        return decode(data)
+    return {}
+
+
+def write_snapshot(path, state, snapshot_format="json"):
+    """状態を保存ファイルに書き込む。一時ファイルに書いてから置き換えるので途中で壊れない
+
+    path は path_for_format で形式に合わせた名前にしておく。書き込んだら、もう一方の形式のファイルは消す。
+    """
+    if snapshot_format == "json":
+        atomic_write_json(path, state)
+    else:
+        atomic_write_bytes(path, encode(state))
+    for other in _other_paths(path):
+        try:
+            os.remove(other)
+        except FileNotFoundError:
+            pass
+
+
+def encode(state):
+    """状態（JSON形式の辞書。history は HistoryBits / "b64:..." / 辞書のどれでもよい）をバイナリにする"""
+    payload = _encode_v1(state)
+    return _HEADER.pack(MAGIC, HEADER_VERSION, SCHEMA_VERSION, len(payload), zlib.crc32(payload)) + payload
+
+
+def decode(data):
+    """バイナリ（または従来の JSON）から状態を復元する。history は HistoryBits、ご褒美のキーは文字列になる"""
+    if not data.startswith(MAGIC):
+        return _decode_legacy(data)
+    if len(data) < _HEADER.size:
+        raise SnapshotError("保存ファイルのヘッダーが途中で切れています")
+    _, header_version, schema, length, checksum = _HEADER.unpack_from(data)
+    if header_version != HEADER_VERSION or schema not in _PAYLOAD_DECODERS:
+        raise SnapshotError(f"未対応の保存ファイルの版です（ヘッダー {header_version} / スキーマ {schema}）")
+    payload = memoryview(data)[_HEADER.size:]
+    if len(payload) != length or zlib.crc32(payload) != checksum:
+        raise SnapshotError("保存ファイルのチェックサムが一致しません", _HEADER.size)
+    try:
+        state = _PAYLOAD_DECODERS[schema](payload)
+    except (struct.error, UnicodeDecodeError, ValueError) as e:
+        raise SnapshotError(f"保存ファイルの内容を読み取れません: {e}", _HEADER.size) from None
+    return migrate(state, schema)
+
+
+def _other_paths(path):
+    """path と同じ名前で、もう一方の形式の拡張子のファイル名"""
+    return [other for other in (path_for_format(path, fmt) for fmt in FORMATS) if other != path]
+
+
+def _decode_legacy(data):
+    try:
+        state = json.loads(data.decode('utf-8'))
+    except UnicodeDecodeError as e:
+        raise SnapshotError(f"保存ファイルを読み取れません: {e}", e.start) from None
+    # JSONとして壊れている場合は JSONDecodeError をそのまま呼び出し元へ
+    if not isinstance(state, dict):
+        raise SnapshotError("保存ファイルの中身がオブジェクトではありません")
+    return migrate(state, LEGACY_SCHEMA_VERSION)
+
+
+# --- 版1の本体 ---
+def _encode_v1(state):
+    extra = dict(state)
+    present = 0
+    ints = []
+    for bit, field in enumerate(INT_FIELDS):
+        value = extra.get(field)
+        if type(value) is int and -(1 << 63) <= value < (1 << 63):
+            present |= 1 << bit
+            ints.append(extra.pop(field))
+        else:
+            ints.append(0)
+
+    parts = [None]
+    for bit, field in enumerate(TEXT_FIELDS, start=len(INT_FIELDS)):
+        if isinstance(extra.get(field), str):
+            present |= 1 << bit
+            _append_bytes(parts, extra.pop(field).encode('utf-8'))
+
+    if "history" in extra and isinstance(extra["history"], (HistoryBits, str, dict)):
+        present |= _HISTORY_BIT
+        _append_bytes(parts, decode_history(extra.pop("history")).to_bytes())
+
+    rewards = _pack_rewards(extra.get("rewards"))
+    if rewards is not None:
+        present |= _REWARDS_BIT
+        del extra["rewards"]
+        parts.append(rewards)
+
+    # 取り消しの記録など、決まった型のない項目はまとめて JSON にする
+    _append_bytes(parts, json.dumps(extra, ensure_ascii=False, separators=(",", ":"),
+                                    default=json_default).encode('utf-8') if extra else b"")
+    parts[0] = _INTS.pack(present, *ints)
+    return b"".join(parts)
+
+
+def _decode_v1(payload):
+    present, *ints = _INTS.unpack_from(payload)
+    offset = _INTS.size
+    state = {field: value for bit, (field, value) in enumerate(zip(INT_FIELDS, ints)) if present & (1 << bit)}
+
+    for bit, field in enumerate(TEXT_FIELDS, start=len(INT_FIELDS)):
+        if present & (1 << bit):
+            value, offset = _read_bytes(payload, offset)
+            state[field] = str(value, 'utf-8')
+
+    if present & _HISTORY_BIT:
+        value, offset = _read_bytes(payload, offset)
+        state["history"] = HistoryBits(value)
+
+    if present & _REWARDS_BIT:
+        (count,) = _U32.unpack_from(payload, offset)
+        columns = struct.Struct(f"<{count}I{count}s{count}I")
+        values = columns.unpack_from(payload, offset + _U32.size)
+        days, checks, lengths = values[:count], values[count], values[count + 1:]
+        names, offset = _read_bytes(payload, offset + _U32.size + columns.size)
+        names = str(names, 'utf-8')
+        ends = list(accumulate(lengths))
+        state["rewards"] = {
+            str(day): {"name": names[end - length:end], "checked": checked == 1}
+            for day, checked, length, end in zip(days, checks, lengths, ends)
+        }
+
+    value, offset = _read_bytes(payload, offset)
+    if offset != len(payload):
+        raise ValueError("本体の長さが合いません")
+    if value:
+        state.update(json.loads(str(value, 'utf-8')))
+    return state
+
+
+_PAYLOAD_DECODERS = {1: _decode_v1}  # スキーマの版 -> 本体の読み込み（古い版は読んだあとマイグレーションする）
+
+
+def _pack_rewards(rewards):
+    """ご褒美がすべて {"name": 文字列, "checked": 真偽値} なら詰めたバイト列、そうでなければ None"""
+    if not isinstance(rewards, dict):
+        return None
+    days, checks, names = [], [], []
+    for key, reward in rewards.items():
+        day = str(key)
+        if (not day.isdigit() or str(int(day)) != day or int(day) >= 1 << 32
+                or not isinstance(reward, dict) or reward.keys() != {"name", "checked"}
+                or not isinstance(reward["name"], str) or not isinstance(reward["checked"], bool)):
+            return None
+        days.append(int(day))
+        checks.append(reward["checked"])
+        names.append(reward["name"])
+    count = len(days)
+    parts = [_U32.pack(count), struct.pack(f"<{count}I{count}s{count}I", *days, bytes(checks), *map(len, names))]
+    _append_bytes(parts, "".join(names).encode('utf-8'))
+    return b"".join(parts)
+
+
+def _append_bytes(parts, value):
+    parts.append(_U32.pack(len(value)))
+    parts.append(value)
+
+
+def _read_bytes(payload, offset):
+    (size,) = _U32.unpack_from(payload, offset)
+    start = offset + _U32.size
+    if start + size > len(payload):
+        raise ValueError("本体が途中で切れています")
+    return payload[start:start + size], start + size
@@ -0,0 +1,128 @@
+import json
+import threading
+from collections import OrderedDict
+
+from history_bits import decode_history, json_default
+from journal import apply_changes
+
+# --- 読み込み済みの状態のキャッシュ ---
+# ユーザー・チャレンジごとに、読み込んで履歴をビット列に戻した状態をプロセス内に保持する。
+# 同じユーザーの別タブや再訪問では保存先を読み直さず、保持している状態を複製して渡す。
+# 保存は保持している状態を更新してから、そのまま下の保存先へ渡す（write-through）。
+# 他のプロセスの更新は、live_sync.LiveSync が保存ファイルの変更を検知して refresh() したものだけ反映される。
+# それ以外の方法で同じ保存先を複数のプロセスから更新する場合は使わないこと。
+
+
+class StateCache:
+    """件数とおおよそのメモリ量で上限を決めた LRU キャッシュ。storage と同じ呼び出し方ができる"""
+
+    # 内容はこのキャッシュ自身が最新に保つため、ファイルの署名による読み込みキャッシュは使わない
+    files = None
+
+    def __init__(self, storage, writer=None, max_entries=256, max_bytes=64 * 1024 * 1024):
+        self.storage = storage
+        self.writer = writer  # 指定すると保存は裏側の書き込みスレッドに預ける
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # (user_id, challenge_id) -> 状態（history は HistoryBits）
+        self._sizes = {}
+        self._bytes = 0
+
+    def load(self, user_id, challenge_id):
+        """状態の複製を返す。キャッシュになければ保存先から読み込んで保持する"""
+        key = (user_id, challenge_id)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                self._entries.move_to_end(key)
+                return _clone(entry)
+            self.misses += 1
+
+        if self.writer is not None:
+            # 追い出された後の書き込み待ちの変更を先に反映してから読み込む
+            self.writer.flush()
+        entry = _normalize(self.storage.load(user_id, challenge_id))
+        with self._lock:
+            if key not in self._entries:  # 読み込み中に保存された場合はそちらが新しい
+                self._put(key, entry)
+            return _clone(self._entries[key])
+
+    def save(self, user_id, challenge_id, state, changes=None):
+        """保持している状態を更新してから、保存先へ書き込む"""
+        key = (user_id, challenge_id)
+        if changes is not None:
+            # ご褒美の辞書などをセッションと共有しないよう、保持している状態へ反映するのは複製にする
+            cached_changes = json.loads(json.dumps(changes, ensure_ascii=False, default=json_default))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and changes is not None:
+                entry = _normalize(apply_changes(entry, cached_changes))
+            else:
+                entry = _normalize(json.loads(json.dumps(state, ensure_ascii=False, default=json_default)))
+            self._put(key, entry)
+
+        if self.writer is not None:
+            self.writer.submit(user_id, challenge_id, state, changes)
+        else:
+            self.storage.save(user_id, challenge_id, state, changes)
+
+    def refresh(self, user_id, challenge_id, state):
+        """保存先が外から書き換えられたときに、保持している状態を置き換える（保持していなければ何もしない）"""
+        key = (user_id, challenge_id)
+        with self._lock:
+            if key in self._entries:
+                self._put(key, _normalize(json.loads(json.dumps(state, ensure_ascii=False, default=json_default))))
+
+    def stats(self):
+        """保存先の統計に、キャッシュの統計を加えて返す"""
+        with self._lock:
+            return {
+                **self.storage.stats(),
+                "cache_hits": self.hits,
+                "cache_misses": self.misses,
+                "cache_evictions": self.evictions,
+                "cache_entries": len(self._entries),
+                "cache_bytes": self._bytes,
+            }
+
+    def _put(self, key, entry):
+        """状態を保持し、上限を超えた分を古い順に追い出す（ロック中に呼ぶ）"""
+        self._bytes -= self._sizes.get(key, 0)
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        self._sizes[key] = _estimate_size(entry)
+        self._bytes += self._sizes[key]
+        # 直前に入れた1件は、上限を超えていても残す
+        while len(self._entries) > 1 and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            old_key, _ = self._entries.popitem(last=False)
+            self._bytes -= self._sizes.pop(old_key)
+            self.evictions += 1
+
+
+def _normalize(state):
+    """保持する形（history は HistoryBits）に揃える"""
+    state["history"] = decode_history(state.get("history", {}))
+    return state
+
+
+def _clone(entry):
+    """セッションが書き換えても保持している状態に影響しないよう、変わりうる部分を複製する"""
+    clone = dict(entry)
+    clone["history"] = entry["history"].copy()
+    clone["rewards"] = {day: dict(reward) for day, reward in entry.get("rewards", {}).items()}
+    return clone
+
+
+def _estimate_size(entry):
+    """状態が使うおおよそのメモリ量（バイト）"""
+    size = 512 + len(entry["history"]._bits)  # 辞書や数値のぶんを固定で見込む
+    size += len(str(entry.get("theme", "")).encode("utf-8"))
+    for reward in entry.get("rewards", {}).values():
+        size += 160 + len(reward.get("name", "").encode("utf-8"))
+    size += 600 * len(entry.get("undo", {}))  # 取り消し用の操作1件は、変わった項目だけの小さな辞書
+    return size
@@ -0,0 +1,92 @@
+from history_bits import ACHIEVED, FAILED, RETRIED
+
+# --- 集計（累計・連続達成）の差分更新 ---
+# 記録のたびに全履歴を数え直さず、1日分の記録ごとに O(1) で集計を更新する。
+# 連続達成日数は「最後に記録した日で終わる、連続した達成の日数」として履歴から決まる。
+# 未達成のあとに達成したマス（RETRIED）は、未達成の日と達成の日の両方として数え、連続はそのマスから数え直す
+# （未達成ボタンで連続が 0 に戻り、次の達成で 1 から始まるのと同じ）。
+
+
+class ChallengeStats:
+    """累計達成日数・未達成日数・連続達成日数・最長連続達成日数を保持する"""
+
+    __slots__ = ("achieved", "failed", "current_streak", "longest_streak", "last_day")
+
+    def __init__(self):
+        self.achieved = 0  # 累計達成日数
+        self.failed = 0  # 累計未達成日数（あとで達成したマスの未達成も含む）
+        self.current_streak = 0  # 最後に記録した日までの連続達成日数
+        self.longest_streak = 0  # 最長連続達成日数
+        self.last_day = 0  # 最後に記録した日
+
+    @classmethod
+    def from_history(cls, history):
+        """履歴（HistoryBits）を日付順に1回たどって集計を作る"""
+        stats = cls()
+        # HistoryBits は昇順に並んでいるので、ソートは線形時間で終わる
+        for day, status in sorted(history.stored_items(), key=_day_of):
+            stats._append(day, status)
+        return stats
+
+    @property
+    def recorded(self):
+        """記録した日数（未達成のあとに達成したマスは、未達成の日と達成の日の2日）"""
+        return self.achieved + self.failed
+
+    @property
+    def completion_rate(self):
+        """記録した日のうち達成した割合（0.0〜1.0）"""
+        return self.achieved / self.recorded if self.recorded else 0.0
+
+    def record(self, history, day, status):
+        """history[day] に status を記録し、集計を更新する
+
+        最後の日の次の日、または最後の日の上書きは O(1)。それより前の日を書き換えた場合は
+        連続日数が途中から変わるため、履歴全体から集計し直す。
+        """
+        previous = history.get(day)
+        history[day] = status
+        if day > self.last_day:
+            self._append(day, history.stored(day))
+        elif day == self.last_day and previous == status:
+            return  # 同じマスに同じ記録（未達成を続けて押したなど）は集計を変えない
+        elif day == self.last_day and previous == FAILED and status == ACHIEVED:
+            # 未達成のマスを達成で上書き: 未達成の日はそのまま数え、連続はこのマスの 1 から数え直す
+            self.achieved += 1
+            self.current_streak = 1
+            self.longest_streak = max(self.longest_streak, 1)
+        else:
+            self._copy_from(ChallengeStats.from_history(history))
+
+    def recent_days(self, history, limit):
+        """最後に記録した日から遡って、記録のある日を新しい順に最大 limit 件返す"""
+        days = []
+        day = self.last_day
+        while day >= 1 and len(days) < limit:
+            if day in history:
+                days.append(day)
+            day -= 1
+        return days
+
+    def _append(self, day, status):
+        contiguous = (day == self.last_day + 1)
+        self.last_day = day
+        if status == ACHIEVED:
+            self.achieved += 1
+            self.current_streak = self.current_streak + 1 if contiguous else 1
+        elif status == RETRIED:
+            self.achieved += 1
+            self.failed += 1
+            self.current_streak = 1
+        else:
+            self.failed += 1
+            self.current_streak = 0
+        self.longest_streak = max(self.longest_streak, self.current_streak)
+
+    def _copy_from(self, other):
+        for name in self.__slots__:
+            setattr(self, name, getattr(other, name))
+
+
+def _day_of(item):
+    return item[0]
@@ -0,0 +1,710 @@
+import glob
+import json
+import os
+import queue
+import re
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from crdt import ChallengeReplica, HybridClock
+from history_bits import decode_history, json_default
+from journal import EventJournal, apply_changes
+from locking import FileLock, atomic_write_text, file_signature
+from portfolio import summarize
+from snapshot import FORMATS, path_for_format, read_snapshot, write_snapshot
+
+# --- 保存先（ストレージ）の切り替え ---
+# どのバックエンドも同じ形で呼び出せるようにする:
+#   load(user_id, challenge_id) -> 状態の辞書（JSON形式: 日数キーは文字列）
+#   save(user_id, challenge_id, state, changes) -> 状態全体と、今回変わった部分を受け取って保存
+#   iter_challenges() -> 保存されている (user_id, challenge_id, 状態) を1件ずつ返す（一括エクスポート用）
+#   save_many(items) -> (user_id, challenge_id, 状態) の並びをまとめて保存する（一括インポート用）
+#   summaries(user_id) -> ユーザーのチャレンジごとの概要 {challenge_id: portfolio.summarize の結果}
+#                         （保存のたびに作っておいた概要を返し、チャレンジの状態は読み込まない）
+# ファイルに保存する方式（files が None でないもの）は、変更の監視（live_sync）のために次も持つ:
+#   files_for(user_id, challenge_id) -> そのチャレンジの状態が入っているファイル
+#   written -> ファイルのパス -> このプロセスが最後に書き込んだ直後の (更新時刻, サイズ)
+# changes の形式は journal.apply_changes と同じ
+SCALAR_FIELDS = ("current_day", "consecutive_success", "theme", "board_length", "calendar",
+                 "undo_bottom", "undo_position", "undo_top")
+# 1つのファイルに1チャレンジだけを保存する方式（"file" / "journal"）で使うキー
+DEFAULT_USER_ID = "default"
+DEFAULT_CHALLENGE_ID = "default"
+# チャレンジごとにファイルを分ける方式で、ファイル名に使えるチャレンジID
+CHALLENGE_ID_PATTERN = re.compile(r"[0-9A-Za-z_-]{1,64}")
+
+
+class MemoryStorage:
+    """プロセス内のメモリだけに保持する（app07 と同じくファイルには保存しない）"""
+
+    # 内容をファイルの署名で判定できないため、読み込み結果はキャッシュしない
+    files = None
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._states = {}
+        self._summaries = {}  # user_id -> {challenge_id: 概要}
+
+    def load(self, user_id, challenge_id):
+        """保持している状態のコピーを返す"""
+        with self._lock:
+            return json.loads(json.dumps(self._states.get((user_id, challenge_id), {}), default=json_default))
+
+    def save(self, user_id, challenge_id, state, changes=None):
+        """状態全体をコピーして保持する"""
+        with self._lock:
+            self._states[(user_id, challenge_id)] = json.loads(
+                json.dumps(state, ensure_ascii=False, default=json_default)
+            )
+            self._summaries.setdefault(user_id, {})[challenge_id] = summarize(state)
+
+    def iter_challenges(self):
+        """保持しているチャレンジを1件ずつ返す"""
+        with self._lock:
+            keys = list(self._states)
+        for user_id, challenge_id in keys:
+            yield user_id, challenge_id, self.load(user_id, challenge_id)
+
+    def save_many(self, items):
+        """状態をまとめて保持する"""
+        for user_id, challenge_id, state in items:
+            self.save(user_id, challenge_id, state)
+
+    def summaries(self, user_id):
+        """保存時に作った概要を返す"""
+        with self._lock:
+            return {challenge_id: dict(summary) for challenge_id, summary in self._summaries.get(user_id, {}).items()}
+
+    def stats(self):
+        """統計はないので空の辞書を返す"""
+        return {}
+
+
+class FileStorage:
+    """1つのファイルに状態全体を書き込む（従来の保存方式。ユーザーの区別はない）
+
+    ファイルには "version"（保存のたびに1増える）を持たせる。変更部分が渡されたときは
+    ロック中に読んだ内容の上に適用して保存し、最後に読み書きした版と違えば競合として数える。
+    ファイルの形式は snapshot_format（snapshot.FORMATS）で選ぶ。"binary" では拡張子を .sgrk にしたファイルに書く。
+    読み込みはどちらの形式でもよい。
+    """
+
+    def __init__(self, path, snapshot_format="json"):
+        self.path = path_for_format(path, snapshot_format)
+        self.snapshot_format = snapshot_format
+        self.files = (self.path,)
+        self.lock = FileLock(path)
+        self._written = {}
+        self.conflicts = 0  # 他のプロセスの更新と重なり、マージした回数
+        self._version = None  # このプロセスが最後に読み書きした版
+
+    def load(self, user_id, challenge_id):
+        """ファイルから状態を読み込む（破損時は JSONDecodeError）"""
+        with self.lock:
+            state = self._read()
+        self._version = state.pop("version", 0)
+        return state
+
+    def save(self, user_id, challenge_id, state, changes=None):
+        """状態をファイルに書き込む。一時ファイルに書いてから置き換えるので途中で壊れない"""
+        with self.lock:
+            on_disk = self._read()
+            disk_version = on_disk.pop("version", 0)
+            # 最後に読み書きした後に他のプロセスが保存していれば、その変更の上に重ねる
+            foreign = changes is not None and disk_version != self._version
+            if changes is not None:
+                # 状態全体で上書きせず、ファイルの内容に今回の変更を重ねる（他のプロセスや手での編集を消さない）
+                if self._version is not None and disk_version != self._version:
+                    self.conflicts += 1  # 他のプロセスが先に保存していた
+                state = apply_changes(on_disk, changes)
+            self._version = disk_version + 1
+            write_snapshot(self.path, {**state, "version": self._version}, self.snapshot_format)
+            if foreign:
+                self._written.pop(self.path, None)  # 他のプロセスの変更も入ったので、変更の監視で読み直させる
+            else:
+                self._written[self.path] = file_signature(self.path)
+
+    @property
+    def written(self):
+        """このプロセスが最後に書き込んだ直後のファイルの署名（書き込み中なら書き終えるまで待つ）"""
+        with self.lock:
+            return dict(self._written)
+
+    def iter_challenges(self):
+        """ファイルには1つのチャレンジしかないので、保存されていればそれだけを返す"""
+        state = self.load(DEFAULT_USER_ID, DEFAULT_CHALLENGE_ID)
+        if state:
+            yield DEFAULT_USER_ID, DEFAULT_CHALLENGE_ID, state
+
+    def save_many(self, items):
+        """1つのチャレンジしか保存できないため、2件以上は ValueError"""
+        _save_single(self, items)
+
+    def stats(self):
+        """ロックと競合の統計を辞書で返す"""
+        return {**self.lock.stats(), "conflicts": self.conflicts, "version": self._version}
+
+    def _read(self):
+        return read_snapshot(self.path)  # ファイルが存在しない場合は空の辞書
+
+
+class JournalStorage:
+    """変更部分だけをジャーナルに追記する（ユーザーの区別はない）"""
+
+    def __init__(self, snapshot_path, journal_path, compact_every=200, snapshot_format="json"):
+        self.journal = EventJournal(snapshot_path, journal_path, compact_every=compact_every,
+                                    snapshot_format=snapshot_format)
+        self.files = (self.journal.snapshot_path, journal_path)
+
+    def load(self, user_id, challenge_id):
+        """スナップショットとジャーナルの残りから状態を復元する"""
+        return self.journal.load()
+
+    def save(self, user_id, challenge_id, state, changes=None):
+        """変更部分を1行追記する。changes がなければ状態全体を記録する"""
+        self.journal.append(changes if changes is not None else {"set": state})
+
+    @property
+    def written(self):
+        """このプロセスが最後に書き込んだ直後のファイルの署名"""
+        return self.journal.written
+
+    def iter_challenges(self):
+        """ジャーナルには1つのチャレンジしかないので、保存されていればそれだけを返す"""
+        state = self.load(DEFAULT_USER_ID, DEFAULT_CHALLENGE_ID)
+        if state:
+            yield DEFAULT_USER_ID, DEFAULT_CHALLENGE_ID, state
+
+    def save_many(self, items):
+        """1つのチャレンジしか保存できないため、2件以上は ValueError"""
+        _save_single(self, items)
+
+    def stats(self):
+        """ロックと競合の統計を辞書で返す"""
+        return self.journal.stats()
+
+
+class ConnectionPool:
+    """SQLiteの接続を使い回すための簡単なプール"""
+
+    def __init__(self, path, size=4):
+        self.path = path
+        self._idle = queue.LifoQueue(maxsize=size)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")  # 読み込みと書き込みが互いを待たないようにする
+        conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """プールから接続を1つ借りる（空なら新しく作る）"""
+        try:
+            conn = self._idle.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+        try:
+            yield conn
+        finally:
+            try:
+                self._idle.put_nowait(conn)
+            except queue.Full:
+                conn.close()
+
+
+class SQLiteStorage:
+    """ユーザー・チャレンジごとに、履歴1件を1行として保存する"""
+
+    files = None  # WALモードではファイルの署名が当てにならないため、読み込み結果はキャッシュしない
+
+    def __init__(self, path, pool_size=4):
+        self.pool = ConnectionPool(path, size=pool_size)
+        with self.pool.connection() as conn, conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS challenges (
+                    user_id TEXT NOT NULL,
+                    challenge_id TEXT NOT NULL,
+                    current_day INTEGER NOT NULL DEFAULT 1,
+                    consecutive_success INTEGER NOT NULL DEFAULT 0,
+                    theme TEXT,
+                    board_length INTEGER NOT NULL DEFAULT 25,
+                    calendar TEXT,
+                    undo_bottom INTEGER NOT NULL DEFAULT 0,
+                    undo_position INTEGER NOT NULL DEFAULT 0,
+                    undo_top INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, challenge_id)
+                );
+                CREATE TABLE IF NOT EXISTS history (
+                    user_id TEXT NOT NULL,
+                    challenge_id TEXT NOT NULL,
+                    day INTEGER NOT NULL,
+                    status TEXT NOT NULL,
+                    PRIMARY KEY (user_id, challenge_id, day)
+                );
+                CREATE TABLE IF NOT EXISTS rewards (
+                    user_id TEXT NOT NULL,
+                    challenge_id TEXT NOT NULL,
+                    day INTEGER NOT NULL,
+                    name TEXT NOT NULL DEFAULT '',
+                    checked INTEGER NOT NULL DEFAULT 0,
+                    PRIMARY KEY (user_id, challenge_id, day)
+                );
+                -- 取り消し・やり直しの操作（undo.UndoStack の環状バッファの位置ごとに1行、操作はJSON）
+                CREATE TABLE IF NOT EXISTS undo_steps (
+                    user_id TEXT NOT NULL,
+                    challenge_id TEXT NOT NULL,
+                    slot INTEGER NOT NULL,
+                    step TEXT NOT NULL,
+                    PRIMARY KEY (user_id, challenge_id, slot)
+                );
+                -- 一覧・ダッシュボード用の概要（portfolio.summarize の結果をJSONで持つ。保存のたびに更新）
+                CREATE TABLE IF NOT EXISTS summaries (
+                    user_id TEXT NOT NULL,
+                    challenge_id TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    PRIMARY KEY (user_id, challenge_id)
+                );
+            """)
+            # 盤面の長さや日付ごとの記録、取り消しができる前に作られたデータベースには列を追加する
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(challenges)")]
+            if "board_length" not in columns:
+                conn.execute("ALTER TABLE challenges ADD COLUMN board_length INTEGER NOT NULL DEFAULT 25")
+            if "calendar" not in columns:
+                conn.execute("ALTER TABLE challenges ADD COLUMN calendar TEXT")
+            for column in ("undo_bottom", "undo_position", "undo_top"):
+                if column not in columns:
+                    conn.execute(f"ALTER TABLE challenges ADD COLUMN {column} INTEGER NOT NULL DEFAULT 0")
+
+    def load(self, user_id, challenge_id):
+        """ユーザー・チャレンジの行を集めて状態の辞書に組み立てる"""
+        with self.pool.connection() as conn:
+            return self._read(conn, (user_id, challenge_id))
+
+    def save(self, user_id, challenge_id, state, changes=None):
+        """変わった行だけを書き込む。changes がなければ状態全体を書き直す"""
+        with self.pool.connection() as conn, conn:  # 1操作を1トランザクションにまとめる
+            # 概要は渡された保存後の状態から作る（履歴や取り消しの行は読み直さない）
+            self._write(conn, (user_id, challenge_id), changes if changes is not None else {"set": state}, state)
+
+    def iter_challenges(self):
+        """ユーザー・チャレンジの順に1件ずつ読み込んで返す（全件をメモリに載せない）"""
+        with self.pool.connection() as conn:
+            keys = conn.execute("SELECT user_id, challenge_id FROM challenges ORDER BY user_id, challenge_id")
+            for key in keys:
+                yield (*key, self._read(conn, key))
+
+    def save_many(self, items):
+        """まとめて1トランザクションで状態全体を書き直す"""
+        with self.pool.connection() as conn, conn:
+            for user_id, challenge_id, state in items:
+                self._write(conn, (user_id, challenge_id), {"set": state}, state)
+
+    def summaries(self, user_id):
+        """概要の表から、ユーザーの行だけを主キーの範囲で読み込む"""
+        with self.pool.connection() as conn:
+            # 概要の表ができる前に保存されたチャレンジは、ここで1回だけ概要を作る
+            missing = conn.execute(
+                "SELECT challenge_id FROM challenges AS c WHERE user_id = ? AND NOT EXISTS"
+                " (SELECT 1 FROM summaries AS s WHERE s.user_id = c.user_id AND s.challenge_id = c.challenge_id)",
+                (user_id,)
+            ).fetchall()
+            if missing:
+                with conn:
+                    for (challenge_id,) in missing:
+                        self._write_summary(conn, (user_id, challenge_id), self._read(conn, (user_id, challenge_id)))
+            return {
+                challenge_id: json.loads(summary) for challenge_id, summary in conn.execute(
+                    "SELECT challenge_id, summary FROM summaries WHERE user_id = ?", (user_id,)
+                )
+            }
+
+    def _read(self, conn, key):
+        row = conn.execute(
+            "SELECT current_day, consecutive_success, theme, board_length, calendar, undo_bottom, undo_position, undo_top"
+            " FROM challenges WHERE user_id = ? AND challenge_id = ?", key
+        ).fetchone()
+        if row is None:
+            return {}
+        state = {"current_day": row[0], "consecutive_success": row[1], "board_length": row[3],
+                 "undo_bottom": row[5], "undo_position": row[6], "undo_top": row[7]}
+        if row[2] is not None:
+            state["theme"] = row[2]
+        if row[4] is not None:
+            state["calendar"] = row[4]
+        state["history"] = {
+            str(day): status for day, status in conn.execute(
+                "SELECT day, status FROM history WHERE user_id = ? AND challenge_id = ?", key
+            )
+        }
+        state["rewards"] = {
+            str(day): {"name": name, "checked": bool(checked)} for day, name, checked in conn.execute(
+                "SELECT day, name, checked FROM rewards WHERE user_id = ? AND challenge_id = ?", key
+            )
+        }
+        state["undo"] = {
+            str(slot): json.loads(step) for slot, step in conn.execute(
+                "SELECT slot, step FROM undo_steps WHERE user_id = ? AND challenge_id = ?", key
+            )
+        }
+        return state
+
+    def _write(self, conn, key, changes, state=None):
+        """変更を書き込み、概要を更新する（state: 保存後の状態全体。分かっていれば概要のために読み直さない）"""
+        fields = changes.get("set", {})
+        conn.execute("INSERT OR IGNORE INTO challenges (user_id, challenge_id) VALUES (?, ?)", key)
+        for field in SCALAR_FIELDS:
+            if field in fields:
+                # field は SCALAR_FIELDS の固定値なので、列名として埋め込んでも安全
+                conn.execute(
+                    f"UPDATE challenges SET {field} = ? WHERE user_id = ? AND challenge_id = ?",
+                    (fields[field], *key)
+                )
+
+        # "set" で丸ごと置き換える場合は、先に既存の行を消してから入れ直す
+        history = dict(changes.get("history", {}))
+        if "history" in fields:
+            conn.execute("DELETE FROM history WHERE user_id = ? AND challenge_id = ?", key)
+            history = {**decode_history(fields["history"]).to_dict(), **history}
+        rewards = dict(changes.get("rewards", {}))
+        if "rewards" in fields:
+            conn.execute("DELETE FROM rewards WHERE user_id = ? AND challenge_id = ?", key)
+            rewards = {**fields["rewards"], **rewards}
+        undo = dict(changes.get("undo", {}))
+        if "undo" in fields:
+            conn.execute("DELETE FROM undo_steps WHERE user_id = ? AND challenge_id = ?", key)
+            undo = {**fields["undo"], **undo}
+
+        # 状態が None の日は未記録に戻す（取り消し用）
+        conn.executemany(
+            "DELETE FROM history WHERE user_id = ? AND challenge_id = ? AND day = ?",
+            [(*key, int(day)) for day, status in history.items() if status is None]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO history (user_id, challenge_id, day, status) VALUES (?, ?, ?, ?)",
+            [(*key, int(day), status) for day, status in history.items() if status is not None]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO rewards (user_id, challenge_id, day, name, checked) VALUES (?, ?, ?, ?, ?)",
+            [(*key, int(day), reward["name"], int(reward["checked"])) for day, reward in rewards.items()]
+        )
+        conn.executemany(
+            "INSERT OR REPLACE INTO undo_steps (user_id, challenge_id, slot, step) VALUES (?, ?, ?, ?)",
+            [(*key, int(slot), json.dumps(step, ensure_ascii=False)) for slot, step in undo.items()]
+        )
+        self._write_summary(conn, key, state if state is not None else self._read(conn, key))
+
+    def _write_summary(self, conn, key, state):
+        conn.execute(
+            "INSERT OR REPLACE INTO summaries (user_id, challenge_id, summary) VALUES (?, ?, ?)",
+            (*key, json.dumps(summarize(state), ensure_ascii=False))
+        )
+
+    def stats(self):
+        """SQLite自身がロックを管理するため、統計は空の辞書を返す"""
+        return {}
+
+
+class ReplicaStorage:
+    """端末ごとの操作ログに追記し、他の端末のログは前回読んだ位置より後ろ（差分）だけを取り込む
+
+    ログは directory/端末ID.ops に1保存1行で書く: {"user_id", "challenge_id", "ops": [[キー, 値, タイムスタンプ], ...]}
+    ディレクトリを共有（同期フォルダやネットワークドライブ）すれば、オフラインで記録した分も後から失われずにまとまる。
+    1つの端末IDのログに書き込むのは1プロセスだけにすること。
+    """
+
+    def __init__(self, directory, device_id):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.device_id = device_id
+        self.clock = HybridClock(device_id)
+        self.own_path = os.path.join(directory, f"{device_id}.ops")
+        self.merged_ops = 0  # 他の端末から取り込んだ操作の数
+        self._lock = threading.Lock()
+        self._replicas = {}  # (user_id, challenge_id) -> ChallengeReplica
+        self._summaries = {}  # (user_id, challenge_id) -> 概要（操作を取り込んだら作り直す）
+        self._offsets = {}  # ログのパス -> 読み込み済みのバイト数
+        self._written = {}  # 自分のログ -> 最後に追記した直後の署名
+
+    @property
+    def files(self):
+        """自分と他の端末のログ（読み込みキャッシュの判定に使う）"""
+        return tuple(sorted({self.own_path, *glob.glob(os.path.join(self.directory, "*.ops"))}))
+
+    @property
+    def written(self):
+        """自分のログに最後に追記した直後の署名（追記中なら書き終えるまで待つ）"""
+        with self._lock:
+            return dict(self._written)
+
+    def files_for(self, user_id, challenge_id):
+        """どの端末のログにもすべてのチャレンジの操作が入りうるので、ログ全部"""
+        return self.files
+
+    def load(self, user_id, challenge_id):
+        """他の端末の差分を取り込み、まとめた状態を返す"""
+        with self._lock:
+            self._sync()
+            replica = self._replicas.get((user_id, challenge_id))
+            return replica.to_state() if replica is not None else {}
+
+    def save(self, user_id, challenge_id, state, changes=None):
+        """値が変わった項目だけを操作として自分のログに追記する"""
+        with self._lock:
+            self._sync()  # 他の端末の最新の値と比べて、変わっていない項目は書かない
+            replica = self._replicas.setdefault((user_id, challenge_id), ChallengeReplica())
+            ops = replica.ops_from_changes(changes if changes is not None else {"set": state}, self.clock)
+            if not ops:
+                return
+            replica.apply(ops)
+            self._summaries.pop((user_id, challenge_id), None)
+            record = {"user_id": user_id, "challenge_id": challenge_id, "ops": ops}
+            with open(self.own_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False, default=json_default) + "\n")
+            self._offsets[self.own_path] = os.path.getsize(self.own_path)
+            self._written[self.own_path] = file_signature(self.own_path)
+
+    def iter_challenges(self):
+        """まとめた状態を1件ずつ返す"""
+        with self._lock:
+            self._sync()
+            keys = sorted(self._replicas)
+        for user_id, challenge_id in keys:
+            yield user_id, challenge_id, self.load(user_id, challenge_id)
+
+    def save_many(self, items):
+        """1件ずつ操作にして追記する"""
+        for user_id, challenge_id, state in items:
+            self.save(user_id, challenge_id, state)
+
+    def summaries(self, user_id):
+        """概要を返す。前回から操作を取り込んだチャレンジの概要だけを作り直す"""
+        with self._lock:
+            self._sync()
+            result = {}
+            for key, replica in self._replicas.items():
+                if key[0] != user_id:
+                    continue
+                if key not in self._summaries:
+                    self._summaries[key] = summarize(replica.to_state())
+                result[key[1]] = dict(self._summaries[key])
+            return result
+
+    def stats(self):
+        """端末IDと、取り込んだ操作の数を返す"""
+        with self._lock:
+            return {"device": self.device_id, "logs": len(self.files), "merged_ops": self.merged_ops}
+
+    def _sync(self):
+        """各ログの、前回読んだ位置より後ろの完全な行だけを取り込む（ロック中に呼ぶ）"""
+        for path in self.files:
+            offset = self._offsets.get(path, 0)
+            try:
+                with open(path, 'rb') as f:
+                    f.seek(offset)
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            end = data.rfind(b"\n") + 1  # 書き込み途中の最終行は次回に読む
+            for line in data[:end].decode('utf-8').splitlines():
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue  # 壊れた行は読み飛ばす（他の行の操作だけで結果は決まる）
+                key = (record["user_id"], record["challenge_id"])
+                replica = self._replicas.setdefault(key, ChallengeReplica())
+                replica.apply(record["ops"])
+                self._summaries.pop(key, None)
+                for _, _, stamp in record["ops"]:
+                    self.clock.observe(stamp)
+                if path != self.own_path:
+                    self.merged_ops += len(record["ops"])
+            self._offsets[path] = offset + end
+
+
+class ChallengeFiles:
+    """1ファイル1チャレンジの方式（"file" / "journal"）で、チャレンジごとに別のファイルを使う
+
+    既定のチャレンジは従来のファイル名のまま、それ以外は "sugoroku_data.challenge-<ID>.json"（形式が "binary" なら .sgrk）のように
+    チャレンジIDを挟んだ名前のファイルに保存する。チャレンジの一覧と概要は "sugoroku_data.index.json" に
+    保存のたびに書き込む（概要が変わらない保存では書き込まない）。ユーザーの区別はない（従来通り全員で共有する）。
+    """
+
+    def __init__(self, open_storage, data_file):
+        self.open_storage = open_storage  # チャレンジID -> そのチャレンジの FileStorage / JournalStorage
+        root, ext = os.path.splitext(data_file)
+        self.index_path = f"{root}.index{ext}"
+        self.index_lock = FileLock(self.index_path)
+        self._lock = threading.Lock()
+        self._storages = {}  # チャレンジID -> このプロセスで開いた保存先
+        self._known = {DEFAULT_CHALLENGE_ID}  # 索引やこのプロセスの保存で見たことのあるチャレンジ
+        self._index = {}  # 最後に読み書きした索引（ファイルの署名が変わっていなければ読み直さない）
+        self._index_signature = None
+        self._empty_default = None  # 既定のチャレンジが空だったときのファイルの署名（変わるまで読み直さない）
+
+    @property
+    def files(self):
+        """把握しているチャレンジのファイル（読み込みキャッシュと変更の監視に使う）"""
+        with self._lock:
+            challenge_ids = sorted(self._known)
+        return tuple(path for challenge_id in challenge_ids for path in self._storage(challenge_id, keep=False).files)
+
+    def files_for(self, user_id, challenge_id):
+        """そのチャレンジのファイル"""
+        return self._storage(challenge_id, keep=False).files
+
+    @property
+    def written(self):
+        """このプロセスで開いた保存先が最後に書き込んだファイルの署名"""
+        with self._lock:
+            storages = list(self._storages.values())
+        return {path: signature for storage in storages for path, signature in storage.written.items()}
+
+    def load(self, user_id, challenge_id):
+        """そのチャレンジのファイルから読み込む"""
+        return self._storage(challenge_id).load(user_id, challenge_id)
+
+    def save(self, user_id, challenge_id, state, changes=None):
+        """そのチャレンジのファイルに保存し、索引の概要を更新する"""
+        self._storage(challenge_id).save(user_id, challenge_id, state, changes)
+        # 概要は渡された保存後の状態から作る（保存したファイルは読み直さない）
+        self._update_index({challenge_id: summarize(state)})
+
+    def iter_challenges(self):
+        """索引にあるチャレンジを1件ずつ返す（読み終えたチャレンジの保存先は開いたままにしない）"""
+        for challenge_id in sorted({DEFAULT_CHALLENGE_ID, *self._read_index()}):
+            state = self._storage(challenge_id, keep=False).load(DEFAULT_USER_ID, challenge_id)
+            if state:
+                yield DEFAULT_USER_ID, challenge_id, state
+
+    def save_many(self, items):
+        """チャレンジごとのファイルに保存し、索引はまとめて1回だけ書き直す（保存先は開いたままにしない）"""
+        summaries = {}
+        for user_id, challenge_id, state in items:
+            self._storage(challenge_id, keep=False).save(user_id, challenge_id, state)
+            summaries[challenge_id] = summarize(state)
+        if summaries:
+            self._update_index(summaries)
+
+    def summaries(self, user_id):
+        """索引のファイルだけを読んで概要を返す"""
+        index = self._read_index()
+        if DEFAULT_CHALLENGE_ID not in index:
+            # 索引ができる前から使っている保存ファイルは、ここで1回だけ概要を作る。
+            # まだ保存していない（ファイルがない）ときも、ファイルが変わるまでは読み直さない
+            signatures = tuple(file_signature(path) for path in self.files_for(user_id, DEFAULT_CHALLENGE_ID))
+            if signatures == self._empty_default:
+                return index
+            state = self.load(user_id, DEFAULT_CHALLENGE_ID)
+            if state:
+                index[DEFAULT_CHALLENGE_ID] = summarize(state)
+                self._update_index({DEFAULT_CHALLENGE_ID: index[DEFAULT_CHALLENGE_ID]})
+            else:
+                self._empty_default = signatures
+        return index
+
+    def stats(self):
+        """このプロセスで開いた保存先の統計を合計して返す（max_ で始まるものは最大値）"""
+        with self._lock:
+            storages = list(self._storages.values())
+            total = {"challenges": len(self._known)}
+        for storage in storages:
+            for name, value in storage.stats().items():
+                if name == "version" or not isinstance(value, (int, float)):
+                    continue  # ファイルごとの値は合計しても意味がない
+                total[name] = max(total.get(name, 0), value) if name.startswith("max_") else total.get(name, 0) + value
+        return total
+
+    def _storage(self, challenge_id, keep=True):
+        """そのチャレンジの保存先。keep=False なら、まだ開いていなければその場限りで開き、このプロセスに残さない
+
+        一括インポート / エクスポートやファイル名の問い合わせで、チャレンジの数だけ保存先が溜まらないようにする。
+        """
+        with self._lock:
+            storage = self._storages.get(challenge_id)
+            if storage is None:
+                storage = self.open_storage(challenge_id)
+                self._known.add(challenge_id)
+                if keep:
+                    self._storages[challenge_id] = storage
+            return storage
+
+    def _read_index(self):
+        """索引（チャレンジID -> 概要）を読み込む。置き換えで書くので、読み込みにロックは要らない"""
+        signature = file_signature(self.index_path)
+        with self._lock:
+            if signature is not None and signature == self._index_signature:
+                return dict(self._index)
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+        with self._lock:
+            self._known.update(index)
+            self._index, self._index_signature = index, signature
+        return dict(index)
+
+    def _update_index(self, summaries):
+        """索引の概要を更新する。最後に読み書きした索引と同じ概要しかなければ書き込まない"""
+        with self._lock:
+            summaries = {cid: summary for cid, summary in summaries.items() if self._index.get(cid) != summary}
+        if not summaries:
+            return
+        with self.index_lock:
+            index = self._read_index()
+            index.update(summaries)
+            # 保存のたびに書き直すため、字下げのない詰めた JSON にする
+            atomic_write_text(self.index_path, json.dumps(index, ensure_ascii=False, separators=(",", ":")))
+            with self._lock:
+                self._index, self._index_signature = index, file_signature(self.index_path)
+
+
+def challenge_path(path, challenge_id):
+    """チャレンジごとのファイル名（既定のチャレンジは従来のファイル名のまま）"""
+    if challenge_id == DEFAULT_CHALLENGE_ID:
+        return path
+    if not CHALLENGE_ID_PATTERN.fullmatch(challenge_id):
+        raise ValueError(f"ファイル名に使えないチャレンジIDです: {challenge_id}")
+    root, ext = os.path.splitext(path)
+    return f"{root}.challenge-{challenge_id}{ext}"
+
+
+
+def _save_single(storage, items):
+    """1チャレンジだけを保存できる方式の save_many"""
+    items = list(items)
+    if len(items) > 1:
+        raise ValueError("この保存方式には1つのチャレンジしか保存できません（sqlite を使ってください）")
+    for user_id, challenge_id, state in items:
+        storage.save(user_id, challenge_id, state)
+
+
+def create_storage(backend, data_file, journal_file=None, sqlite_file=None, compact_every=200,
+                   replica_dir=None, device_id=None, snapshot_format="json"):
+    """設定名からストレージを作成する（snapshot_format は "file" / "journal" の保存ファイルの形式）"""
+    if snapshot_format not in FORMATS:
+        raise ValueError(f"未対応の保存ファイルの形式です: {snapshot_format}")
+    if backend == "memory":
+        return MemoryStorage()
+    if backend == "file":
+        return ChallengeFiles(
+            lambda challenge_id: FileStorage(challenge_path(data_file, challenge_id), snapshot_format),
+            data_file,
+        )
+    if backend == "journal":
+        return ChallengeFiles(
+            lambda challenge_id: JournalStorage(
+                challenge_path(data_file, challenge_id),
+                challenge_path(journal_file, challenge_id),
+                compact_every=compact_every,
+                snapshot_format=snapshot_format,
+            ),
+            data_file,
+        )
+    if backend == "sqlite":
+        return SQLiteStorage(sqlite_file)
+    if backend == "crdt":
+        return ReplicaStorage(replica_dir, device_id)
+    raise ValueError(f"未対応の保存方式です: {backend}")
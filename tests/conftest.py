@@ -0,0 +1,24 @@
+import os
+import sys
+
+import pytest
+
+# モジュールはリポジトリ直下に並んでいるので、テストからもそのまま import できるようにする
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+APP09 = os.path.join(ROOT, "app09_can_be_saved.py")
+
+
+@pytest.fixture
+def app_env(tmp_path, monkeypatch):
+    """app09 を一時フォルダで、裏側の書き込みスレッドなしで動かす（保存方式などは環境変数で足す）"""
+    import streamlit as st
+
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setenv("SUGOROKU_WRITE_BEHIND_INTERVAL", "0")
+    st.cache_resource.clear()  # 前のテストの保存先や監視を持ち越さない
+    st.cache_data.clear()
+    yield tmp_path
+    st.cache_resource.clear()
+    st.cache_data.clear()
@@ -0,0 +1,61 @@
+from streamlit.testing.v1 import AppTest
+
+from conftest import APP09
+
+
+def run_app():
+    at = AppTest.from_file(APP09, default_timeout=30)
+    at.run()
+    assert not at.exception
+    return at
+
+
+def click(at, label):
+    next(button for button in at.button if button.label == label).click().run()
+    assert not at.exception
+
+
+def test_binary_file_save_is_seen_by_new_session(app_env, monkeypatch):
+    # 読み込みキャッシュはファイルの署名をキーにするので、実際に書き込むファイル（.sgrk）を見ていなければならない
+    monkeypatch.setenv("SUGOROKU_STORAGE_BACKEND", "file")
+    monkeypatch.setenv("SUGOROKU_SNAPSHOT_FORMAT", "binary")
+    monkeypatch.setenv("SUGOROKU_STATE_CACHE_ENTRIES", "0")
+    first = run_app()
+    for _ in range(3):
+        click(first, "達成した！🎉")
+    assert first.session_state.game.current_day == 4
+    assert (app_env / "sugoroku_data.sgrk").exists()
+
+    second = run_app()
+    assert second.session_state.game.current_day == 4
+
+
+def test_pushed_save_keeps_undo_stack(app_env, monkeypatch):
+    # 保存したタブ（このセッション）から、同じチャレンジを開いている別のタブ "other" へ note_saved で届ける
+    import engine
+    from live_sync import LiveSync
+
+    monkeypatch.setenv("SUGOROKU_STORAGE_BACKEND", "file")
+    other = {}
+    note_saved = LiveSync.note_saved
+
+    def note_saved_with_other_tab(self, session_id, user_id, challenge_id, state):
+        if not other:
+            other["game"] = engine.SessionChallenge.from_saved(self.storage.load(user_id, challenge_id), 25)
+            self.register("other", user_id, challenge_id, self.storage.load(user_id, challenge_id))
+            self.request_rerun = lambda session_id: True  # AppTest では他のセッションを再実行できない
+        note_saved(self, session_id, user_id, challenge_id, state)
+        pushed = self.take("other")
+        if pushed is not None:
+            other["game"].load(pushed, 25)
+
+    monkeypatch.setattr(LiveSync, "note_saved", note_saved_with_other_tab)
+    at = run_app()
+    for _ in range(3):
+        click(at, "達成した！🎉")
+
+    undo = other["game"].undo
+    assert other["game"].current_day == 4
+    assert undo.can_undo and undo.position == 3
+    assert (undo.bottom, undo.position, undo.top) == (
+        at.session_state.game.undo.bottom, at.session_state.game.undo.position, at.session_state.game.undo.top)
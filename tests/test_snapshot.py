@@ -0,0 +1,17 @@
+from snapshot import path_for_format, read_snapshot, write_snapshot
+
+
+def test_switching_format_moves_the_file(tmp_path):
+    json_path = str(tmp_path / "sugoroku_data.json")
+    binary_path = path_for_format(json_path, "binary")
+    write_snapshot(json_path, {"current_day": 3, "history": {"1": "達成"}}, "json")
+
+    # 選んだ形式のファイルがまだなければ、もう一方の形式のファイルから読む
+    state = read_snapshot(binary_path)
+    assert state["current_day"] == 3
+
+    # 書き込んだら、古い形式のファイルは残さない
+    write_snapshot(binary_path, {**state, "current_day": 4}, "binary")
+    assert not (tmp_path / "sugoroku_data.json").exists()
+    assert read_snapshot(json_path)["current_day"] == 4
+    assert read_snapshot(binary_path)["history"].to_dict() == {"1": "達成"}
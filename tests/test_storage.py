@@ -0,0 +1,19 @@
+from storage import DEFAULT_CHALLENGE_ID, FileStorage, create_storage
+
+
+def test_unsaved_default_challenge_is_not_reloaded(tmp_path, monkeypatch):
+    data_file = str(tmp_path / "sugoroku_data.json")
+    storage = create_storage("file", data_file)
+    loads = []
+    original_load = storage.load
+    monkeypatch.setattr(storage, "load", lambda *key: loads.append(key) or original_load(*key))
+
+    # まだ保存していない既定のチャレンジは、ファイルが変わるまで読み直さない
+    assert storage.summaries("user") == {}
+    assert storage.summaries("user") == {}
+    assert len(loads) == 1
+
+    # 索引ができる前の保存ファイルが置かれたら、読み直して概要を作る
+    FileStorage(data_file).save("user", DEFAULT_CHALLENGE_ID, {"current_day": 3, "history": {"1": "達成"}})
+    assert DEFAULT_CHALLENGE_ID in storage.summaries("user")
+    assert len(loads) == 2
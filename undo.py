@@ -0,0 +1,95 @@
+import json
+
+from history_bits import json_default
+
+# --- 取り消し（元に戻す）・やり直し ---
+# 操作ごとに「変わった項目の操作前の値（before）」と「操作後の値（after）」だけを変更レコード
+# （journal.apply_changes の形式）で積む。変わっていない履歴やご褒美は現在の状態と共有するので、
+# 1操作あたりの記録と保存の量は変わった項目の数に比例し、状態全体の複製は作らない。
+# 積んだ操作は UNDO_LIMIT 件の環状バッファ（番号 % UNDO_LIMIT の位置）に置き、
+# 保存時は {"undo": {位置: 操作}} と位置の数値3つ（UNDO_FIELDS）だけを書き込む。
+UNDO_LIMIT = 50  # 取り消せる操作の数
+UNDO_FIELDS = ("undo_bottom", "undo_position", "undo_top")
+
+
+class UndoStack:
+    """取り消し・やり直しのできる操作の列（bottom < 番号 <= position は取り消せ、position < 番号 <= top はやり直せる）"""
+
+    __slots__ = ("steps", "bottom", "position", "top")
+
+    def __init__(self, steps=None, bottom=0, position=0, top=0):
+        self.steps = steps if steps is not None else {}  # 環状バッファの位置 -> {"label", "before", "after"}
+        self.bottom = bottom  # これより後の操作だけが残っている
+        self.position = position  # 最後に行った（取り消していない）操作の番号
+        self.top = top  # やり直せる最後の操作の番号
+
+    @classmethod
+    def from_state(cls, data):
+        """保存データ（JSON形式の辞書）から復元する"""
+        steps = {int(slot): step for slot, step in data.get("undo", {}).items() if step is not None}
+        return cls(steps, *(int(data.get(field, 0)) for field in UNDO_FIELDS))
+
+    @property
+    def can_undo(self):
+        return self.position > self.bottom and self.position % UNDO_LIMIT in self.steps
+
+    @property
+    def can_redo(self):
+        return self.position < self.top and (self.position + 1) % UNDO_LIMIT in self.steps
+
+    @property
+    def undo_label(self):
+        """次に取り消す操作の名前（なければ None）"""
+        return self.steps[self.position % UNDO_LIMIT]["label"] if self.can_undo else None
+
+    @property
+    def redo_label(self):
+        """次にやり直す操作の名前（なければ None）"""
+        return self.steps[(self.position + 1) % UNDO_LIMIT]["label"] if self.can_redo else None
+
+    def push(self, label, before, after):
+        """操作を積み、保存する変更レコードを返す（やり直せる操作は捨てる）"""
+        # セッション側で後から書き換えられても影響しないよう、変わった項目の分だけ複製する
+        step = json.loads(json.dumps({"label": label, "before": before, "after": after},
+                                     ensure_ascii=False, default=json_default))
+        self.position += 1
+        self.top = self.position
+        self.bottom = max(self.bottom, self.position - UNDO_LIMIT)
+        slot = self.position % UNDO_LIMIT
+        self.steps[slot] = step
+        return {"set": self._cursor(), "undo": {slot: step}}
+
+    def undo(self):
+        """直前の操作を取り消す。(操作の名前, 状態に適用する変更レコード, 保存する位置の変更) を返す"""
+        step = self.steps[self.position % UNDO_LIMIT]
+        self.position -= 1
+        return step["label"], step["before"], {"set": self._cursor()}
+
+    def redo(self):
+        """取り消した操作をやり直す。戻り値は undo() と同じ形"""
+        self.position += 1
+        step = self.steps[self.position % UNDO_LIMIT]
+        return step["label"], step["after"], {"set": self._cursor()}
+
+    def to_state(self):
+        """保存データと同じ形（{"undo": {位置: 操作}} と位置の数値3つ）にする（他のタブへ届ける状態に含める）"""
+        return {"undo": {str(slot): step for slot, step in self.steps.items()}, **self._cursor()}
+
+    def _cursor(self):
+        return {"undo_bottom": self.bottom, "undo_position": self.position, "undo_top": self.top}
+
+
+def capture(state, fields=(), history=(), rewards=()):
+    """操作の前に、これから変わる項目の現在の値だけを変更レコードにして返す
+
+    state は保存形式の状態（app09 の current_state() など。history は HistoryBits）。履歴のない日は None（未記録に戻す）になる。
+    """
+    before = {}
+    if fields:
+        before["set"] = {field: state[field] for field in fields}
+    if history:
+        before["history"] = {day: state["history"].stored(day) for day in history}
+    if rewards:
+        before["rewards"] = {day: dict(state["rewards"][day]) for day in rewards}
+    # 以降の操作で書き換わらないよう、ここで変わった項目だけを複製する
+    return json.loads(json.dumps(before, ensure_ascii=False, default=json_default))
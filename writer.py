@@ -0,0 +1,81 @@
+import atexit
+import json
+import threading
+
+from history_bits import json_default
+from journal import merge_changes
+
+
+class WriteBehindQueue:
+    """保存を裏側のスレッドでまとめて行い、ボタン操作の処理でディスクを待たないようにする"""
+
+    def __init__(self, storage, interval=1.0):
+        self.storage = storage
+        self.interval = interval  # この間隔（秒）ごとに溜まった変更を書き込む
+        self.last_error = None
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()  # 書き込みの順序を保つため、同時に1つだけ書き込む
+        self._pending = {}  # (user_id, challenge_id) -> [最新の状態, まとめた変更]
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="sugoroku-writer", daemon=True)
+        self._thread.start()
+        atexit.register(self.close)  # プロセス終了時に残りを書き込む
+
+    def submit(self, user_id, challenge_id, state, changes=None):
+        """保存したい状態と変更を預ける（すぐに戻る）"""
+        # セッション側で後から書き換えられても影響しないようにコピーしておく
+        state = json.loads(json.dumps(state, ensure_ascii=False, default=json_default))
+        if changes is not None:
+            changes = json.loads(json.dumps(changes, ensure_ascii=False, default=json_default))
+        key = (user_id, challenge_id)
+        with self._lock:
+            if key in self._pending:
+                _, queued = self._pending[key]
+                # どちらかが状態全体の保存なら、まとめた結果も状態全体の保存にする
+                if queued is None or changes is None:
+                    changes = None
+                else:
+                    changes = merge_changes(queued, changes)
+            self._pending[key] = [state, changes]
+
+    def flush(self):
+        """溜まっている変更をすぐに書き込む（テストやセッション初期化の前に使う）"""
+        with self._write_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            for (user_id, challenge_id), (state, changes) in pending.items():
+                try:
+                    self.storage.save(user_id, challenge_id, state, changes)
+                except Exception as e:  # 書き込みスレッドを止めないよう、記録して次回に再試行する
+                    self.last_error = e
+                    self._requeue(user_id, challenge_id, state, changes)
+
+    def pending(self, user_id):
+        """ユーザーの書き込み待ちの状態を {challenge_id: 状態} で返す（まだ保存先にない変更を表示に含めるため）"""
+        with self._lock:
+            return {
+                challenge_id: state for (pending_user_id, challenge_id), (state, _) in self._pending.items()
+                if pending_user_id == user_id
+            }
+
+    def close(self):
+        """書き込みスレッドを止め、残りを書き込む"""
+        self._stop.set()
+        self.flush()
+
+    def _requeue(self, user_id, challenge_id, state, changes):
+        key = (user_id, challenge_id)
+        with self._lock:
+            if key in self._pending:
+                newer_state, newer_changes = self._pending[key]
+                if changes is None or newer_changes is None:
+                    merged = None
+                else:
+                    merged = merge_changes(changes, newer_changes)
+                self._pending[key] = [newer_state, merged]
+            else:
+                self._pending[key] = [state, changes]
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.flush()